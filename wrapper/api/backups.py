@@ -36,7 +36,8 @@ class Backups(object):
 
     def verifyTarInstalled(self):
         """
-        checks for tar on users system.
+        checks for tar on users system.  (Wrapper no longer needs
+        tar to make or restore backups.)
 
         :returns: True if installed, False if not (along with error logs
          and console messages).
@@ -62,6 +63,46 @@ class Backups(object):
         """
         self.wrapper.backups.pruneoldbackups()
 
+    def listBackups(self):
+        """
+        Get the backup catalog.
+
+        :returns: A list of backup records, oldest first:
+
+            .. code:: python
+
+                {"file": "backup-2017-06-01_12.00.00.tar.gz",
+                 "timestamp": 1496318400,
+                 "status": "ok",  # or "running", "failed"
+                 "duration": seconds taken,
+                 "size": bytes written (new bytes for snapshots),
+                 "files": number of files in the backup,
+                 "checksum": sha1 of the archive (or snapshot manifest)
+                 }
+
+            ..
+
+        """
+        return self.wrapper.backups.listbackups()
+
+    def restoreBackup(self, filename, destination=None):
+        """
+        Restore a backup (an incremental snapshot or a tar archive).
+
+        :Args:
+            :filename: the backup name, like
+             "snapshot-2017-06-01_12.00.00" or
+             "backup-2017-06-01_12.00.00.tar.gz".
+            :destination: folder to restore into.  Defaults to
+             "<backup-location>/restored/<filename>".  The server
+             should be stopped before restoring over its world!
+
+        :returns: The destination folder, or False if the backup
+         was not found.
+
+        """
+        return self.wrapper.backups.restorebackup(filename, destination)
+
     def disableBackups(self):
         """
         Allow plugin to temporarily shut off backups (only during
@@ -77,15 +118,11 @@ class Backups(object):
         Allow plugin to re-enable disabled backups or enable backups
         during this wrapper session.
 
-        :returns:
-            :True: tar is installed
-            :False: tar is not installed
+        :returns: None
 
         """
         self.wrapper.backups.enabled = True
         if not self.wrapper.backups.timerstarted:
-            if not self.wrapper.backups.dotarchecks():
-                return False
             self.wrapper.backups.timerstarted = True
             self.wrapper.backups.api.registerEvent(
                 "timer.second", self.wrapper.backups.eachsecond)
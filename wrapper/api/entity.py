@@ -76,6 +76,35 @@ class EntityControl(object):
         """
         pass
 
+    def countEntityTypesInPlayer(self, playername):
+        """
+        Returns a dictionary of entity names and how many of each
+        are in the player's client.
+
+            :sample:
+                .. code:: python
+
+                    {"Cow": 12, "Zombie": 3, "Item": 40}
+
+                ..
+
+        """
+        pass
+
+    def getEntitiesInRadius(self, playername, position, radius):
+        """
+        Returns a list of entity info dictionaries (see
+        getEntityInfo) for the entities in the player's client that
+        are within `radius` blocks (horizontal distance) of position.
+
+        :Args:
+            :playername: the player whose client is searched.
+            :position: (x, y, z) center of the search.
+            :radius: search radius in blocks.
+
+        """
+        pass
+
     def getEntityInfo(self, eid):
         """
         Get a dictionary of info on the specified EID.  Returns
@@ -9,7 +9,6 @@ from __future__ import unicode_literals
 
 import json
 import os
-from core.nbt import NBTFile
 from proxy.entity.entitybasics import Items
 from api.helpers import scrub_item_value, pickle_load
 from proxy.packets.mcpackets_cb import Packets as ClientBound
@@ -239,9 +238,6 @@ class Minecraft(object):
             :self.entityControl:
              config["Entities"]["enable-entity-controls"]
 
-            :self.entityProcessorFrequency:
-             config["Entities"]["entity-update-frequency"]
-
             :self.thiningFrequency:
              config["Entities"]["thinning-frequency"]
 
@@ -258,6 +254,10 @@ class Minecraft(object):
 
                 def countEntitiesInPlayer(self, playername)
 
+                def countEntityTypesInPlayer(self, playername)
+
+                def getEntitiesInRadius(self, playername, position, radius)
+
                 def countActiveEntities(self)
 
                 def getEntityByEID(self, eid)
@@ -625,14 +625,11 @@ class Minecraft(object):
             specified, Wrapper looks up the server worldname.
 
         :returns: Return an NBT object of the world's level.dat.
+         The object is cached until level.dat changes and is shared
+         with other plugins, so do not modify it.
 
         """
-        if not worldname:
-            worldname = self.wrapper.servervitals.worldname
-        if not worldname:
-            raise Exception("Server Uninitiated")
-        f = NBTFile("%s/%s/level.dat" % (self.serverpath, worldname), "rb")
-        return f["Data"]
+        return self.wrapper.javaserver.leveldata.tree(worldname)
 
     def getGameRules(self):
         """
@@ -641,7 +638,7 @@ class Minecraft(object):
         :returns: a dictionary of the gamerules.
 
         """
-        game_rules = self.getLevelInfo()["GameRules"]
+        game_rules = self.wrapper.javaserver.leveldata.summary()["GameRules"]
         rules = {}
         for rule in game_rules:
             rules[rule] = str(game_rules[rule])
@@ -660,9 +657,8 @@ class Minecraft(object):
         :returns: Returns the spawn point of the current world.
 
         """
-        return (int(str(self.getLevelInfo()["SpawnX"])),
-                int(str(self.getLevelInfo()["SpawnY"])),
-                int(str(self.getLevelInfo()["SpawnZ"])))
+        info = self.wrapper.javaserver.leveldata.summary()
+        return info["SpawnX"], info["SpawnY"], info["SpawnZ"]
 
     def getTime(self):
         """
@@ -672,7 +668,7 @@ class Minecraft(object):
         :returns: Returns the time of the world in ticks.
 
         """
-        return int(str(self.getLevelInfo()["Time"]))
+        return self.wrapper.javaserver.leveldata.summary()["Time"]
 
     def getServer(self):
         """
@@ -710,6 +706,101 @@ class Minecraft(object):
         """
         return self.wrapper.servervitals.worldname
 
+    def getWorldSize(self):
+        """
+        Returns the world's disk usage, as of the last count (the
+        world is re-counted about once a minute, in the background).
+
+        :returns: A dictionary:
+
+            .. code:: python
+
+                {"total": bytes,
+                 "dimensions": {"overworld": bytes, "nether": bytes,
+                                "the_end": bytes},
+                 "updated": time of the count (0 - not counted yet)
+                 }
+
+            ..
+
+        """
+        diskusage = self.wrapper.javaserver.diskusage
+        return {"total": diskusage.total,
+                "dimensions": dict(diskusage.dimensions),
+                "updated": diskusage.updated}
+
+    def getRegionSizes(self, dimension="overworld"):
+        """
+        Returns the size of each region file in a dimension.
+
+        :arg dimension: "overworld", "nether" or "the_end".
+
+        :returns: A dictionary of {"r.0.0.mca": bytes, ...}
+
+        """
+        return self.wrapper.javaserver.diskusage.getregionsizes(dimension)
+
+    def getServerResources(self, tier="second", since=0):
+        """
+        Returns the server process's resource use history (Linux
+        only).  Samples are taken every General
+        "resource-sample-interval" seconds; "minute" and "hour" hold
+        averages and reach back a day and a month.
+
+        :arg tier: "second" (the last hour of samples), "minute" or
+         "hour".
+        :arg since: only points after this time.
+
+        :returns: A dictionary of lists, oldest point first:
+
+            .. code:: python
+
+                {"time": [...],
+                 "rss": [bytes], "cpu": [percent of one core],
+                 "threads": [...], "fds": [open files],
+                 "read_bytes": [per second], "write_bytes": [per second],
+                 "gc_pauses": [per second], "gc_ms": [ms per second]
+                 }
+
+            ..
+
+            GC figures need the server's GC logging turned on
+            (-verbose:gc or -Xlog:gc).
+
+        """
+        return self.wrapper.javaserver.resources.history(tier, since)
+
+    def getTickHealth(self, seconds=60):
+        """
+        Returns the server's tick rate over the last `seconds` (up to
+        an hour).  The rate is measured from the time updates the
+        proxy passes to players (needs proxy mode and a player online)
+        or by the Gameplay "tps-probe-command" console probe.
+
+        :arg seconds: the period summarized.
+
+        :returns: A dictionary:
+
+            .. code:: python
+
+                {"points": seconds measured, "source": "proxy"/"probe",
+                 "health": "ok"/"warning"/"critical",
+                 "tps": {"mean":, "min":, "p1":, "p5":, "p50":},
+                 "mspt": {"mean":, "p50":, "p95":, "p99":, "max":},
+                 "lagspikes": count of "Can't keep up!" warnings,
+                 "pings": {username: keepalive round trip seconds}
+                 }
+
+            ..
+
+            Values are None while nothing has been measured.  See
+            the "server.tickhealth" event.
+
+        """
+        summary = self.wrapper.tickmonitor.summary(seconds)
+        summary["pings"] = dict(self.wrapper.tickmonitor.pings)
+        return summary
+
     def getUuidCache(self):
         """
         Gets the wrapper uuid cache.  This is as far as the API goes.
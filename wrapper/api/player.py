@@ -9,8 +9,8 @@ import time
 import json
 import threading
 
-from proxy.packets.mcpackets_cb import Packets as Packets_cb
-from proxy.packets.mcpackets_sb import Packets as Packets_sb
+from proxy.packets.mcpackets_cb import getpackets as getpackets_cb
+from proxy.packets.mcpackets_sb import getpackets as getpackets_sb
 
 from proxy.utils.constants import *
 from core.storage import Storage
@@ -94,8 +94,8 @@ class Player(object):
         self.serverUuid (proxy only)
         self.clientUuid (proxy only)
         self.clientgameversion
-        self.clientboundPackets = Packets_cb(self.clientgameversion)
-        self.serverboundPackets = Packets_sb(self.clientgameversion)
+        self.clientboundPackets
+        self.serverboundPackets
 
         # some player properties associated with abilities (proxy)
         # default is 1.  Should normally be congruent with speed.
@@ -111,8 +111,26 @@ class Player(object):
 
     """
 
+    # Player objects are created for every login, so the instance is
+    # kept small; see the uuid and data properties for what is
+    # resolved later, on first use.
+    __slots__ = (
+        "wrapper", "javaserver", "log", "username", "loggedIn",
+        "_mojanguuid", "_clientuuid", "_offlineuuid", "_serveruuid",
+        "ipaddress", "loginposition", "_position", "client",
+        "clientgameversion", "clientboundPackets", "serverboundPackets",
+        "playereid", "field_of_view", "godmode", "creative", "fly_speed",
+        "_data",
+    )
+
+    # guards the lazy creation of a player's Storage
+    _datalock = threading.Lock()
+
     def __init__(self, username, wrapper):
 
+        # loaded on first use of self.data
+        self._data = None
+
         self.wrapper = wrapper
         self.javaserver = wrapper.javaserver
         self.log = wrapper.log
@@ -120,12 +138,6 @@ class Player(object):
         self.username = username
         self.loggedIn = time.time()
 
-        # TODO - clean this out.  let player objects GC with their client?
-        # mcserver will set this to false later to close the thread.
-        self.abort = False
-        # meanwhile, it still needs to respect wrapper halts
-        self.wrapper_signal = self.wrapper.halt
-
         # these are all MCUUID objects.. I have separated out various
         #  uses of uuid to clarify for later refractoring
         # ---------------
@@ -141,19 +153,12 @@ class Player(object):
         # in offline mode (proxy mode).
         # *******************
 
-        # This can be False if cache (and requests) Fail... bad name or
-        # bad Mojang service connection.
-        self.mojangUuid = self.wrapper.uuids.getuuidbyusername(username)
-
-        # IF False error carries forward, this is not a valid player,
-        # for whatever reason...
-        self.clientUuid = self.mojangUuid
-
-        # These two are offline by default.
-        self.offlineUuid = self.wrapper.uuids.getuuidfromname(self.username)
-        # Start out as the Offline -
-        # change it to Mojang if local server is Online
-        self.serverUuid = self.offlineUuid
+        # None until looked up (see the properties).  The client
+        # supplies what it can below.
+        self._mojanguuid = None
+        self._clientuuid = None
+        self._offlineuuid = None
+        self._serveruuid = None
 
         self.ipaddress = "127.0.0.0"
         self.loginposition = [0, 0, 0]
@@ -161,8 +166,8 @@ class Player(object):
 
         self.client = None
         self.clientgameversion = self.wrapper.servervitals.protocolVersion
-        self.clientboundPackets = Packets_cb(self.clientgameversion)
-        self.serverboundPackets = Packets_sb(self.clientgameversion)
+        self.clientboundPackets = getpackets_cb(self.clientgameversion)
+        self.serverboundPackets = getpackets_sb(self.clientgameversion)
 
         self.playereid = None
 
@@ -178,22 +183,23 @@ class Player(object):
         self.fly_speed = float(1)
 
         if self.wrapper.proxy:
-            gotclient = False
-            for client in self.wrapper.servervitals.clients:
-                if client.username == self.username:
-                    self.client = client
-                    # Both MCUUID objects
-                    self.clientUuid = client.uuid
-                    self.serverUuid = client.serveruuid
-
-                    self.ipaddress = client.ip
-
-                    # pktSB already set to self.wrapper.servervitals.protocolVersion
-                    self.clientboundPackets = self.client.pktCB
-                    self.clientgameversion = self.client.clientversion
-                    gotclient = True
-                    break
-            if not gotclient:
+            client = self.wrapper.servervitals.clientsbyname.get(username)
+            if client:
+                self.client = client
+                # Both MCUUID objects
+                self._clientuuid = client.uuid
+                self._serveruuid = client.serveruuid
+                # an online mode proxy authenticated this uuid with
+                # the session server, so there is nothing to look up.
+                if client.onlinemode:
+                    self._mojanguuid = client.uuid
+
+                self.ipaddress = client.ip
+
+                # pktSB already set to self.wrapper.servervitals.protocolVersion
+                self.clientboundPackets = self.client.pktCB
+                self.clientgameversion = self.client.clientversion
+            else:
                 self.log.error("Proxy is on, but this client is not "
                                "listed in wrapper.proxy.clients!")
                 self.log.error("The usual cause of this would be that"
@@ -201,26 +207,11 @@ class Player(object):
                                " your server port and not the wrapper"
                                " proxy port!")
 
-        # Process login data
-        self.data = Storage(
-            self.clientUuid.string, root="wrapper-data/players")
-        if "firstLoggedIn" not in self.data.Data:
-            self.data.Data["firstLoggedIn"] = (time.time(), time.tzname)
-        if "logins" not in self.data.Data:
-            self.data.Data["logins"] = {}
-        self.data.Data["lastLoggedIn"] = (self.loggedIn, time.tzname)
-        self.data.save()
-
-        # start player logged in time tracking thread
-        t = threading.Thread(target=self._track, args=())
-        t.daemon = True
-        t.start()
-
     def __str__(self):
         return self.username
 
     def __del__(self):
-        self.data.close()
+        self._close_data()
 
     @property
     def name(self):
@@ -230,38 +221,68 @@ class Player(object):
     def uuid(self):
         return self.mojangUuid
 
-    def _track(self):
-        """
-        internal tracking that updates a player's server play time.
-        Not a part of the public player object API.
-
-        Sample ReST formattings -
-
-        # emphasized notes
-        Note: *You do not need to run this function unless you want*
-         *certain permission nodes to be granted by default.*
-         *i.e., 'essentials.list' should be on by default, so players*
-         *can run /list without having any permissions*
-
-        # code samples
-            :sample usage:
+    @property
+    def mojangUuid(self):
+        # This can be False if cache (and requests) Fail... bad name or
+        # bad Mojang service connection.
+        if self._mojanguuid is None:
+            self._mojanguuid = self.wrapper.uuids.getuuidbyusername(
+                self.username)
+        return self._mojanguuid
 
-                .. code:: python
+    @property
+    def clientUuid(self):
+        # IF False error carries forward, this is not a valid player,
+        # for whatever reason...
+        if self._clientuuid is None:
+            return self.mojangUuid
+        return self._clientuuid
 
-                    < code here >
+    @property
+    def offlineUuid(self):
+        if self._offlineuuid is None:
+            self._offlineuuid = self.wrapper.uuids.getuuidfromname(
+                self.username)
+        return self._offlineuuid
 
-                ..
+    @property
+    def serverUuid(self):
+        # Start out as the Offline -
+        # change it to Mojang if local server is Online
+        if self._serveruuid is None:
+            return self.offlineUuid
+        return self._serveruuid
 
-        """
-        self.data.Data["logins"][int(self.loggedIn)] = time.time()
-        while not (self.abort or self.wrapper_signal.halt):
-            timeupdate = time.time()
-            if timeupdate % 60:  # Just update every 60 seconds
-                self.data.Data["logins"][int(self.loggedIn)] = int(time.time())
-            # this needs a fast response to ensure the storage closes 
-            # immediately on player logoff
-            time.sleep(.5)
-        self.data.close()
+    @property
+    def data(self):
+        # The player's wrapper-data/players Storage, loaded the
+        # first time something needs it.
+        if self._data is None:
+            with self._datalock:
+                if self._data is None:
+                    self._data = self._load_data()
+        return self._data
+
+    def _load_data(self):
+        data = Storage(self.clientUuid.string, root="wrapper-data/players",
+                       encoding=self.wrapper.encoding)
+        if "firstLoggedIn" not in data.Data:
+            data.Data["firstLoggedIn"] = (self.loggedIn, time.tzname)
+        data.Data["lastLoggedIn"] = (self.loggedIn, time.tzname)
+        return data
+
+    def _record_login(self):
+        """Write firstLoggedIn/lastLoggedIn to the player's Storage at
+        login (self.data itself stays unloaded until it is used)."""
+        if self._data is None:
+            # loading stamps them; closing saves
+            self._load_data().close()
+
+    def _close_data(self):
+        """Save and close the player Storage, if it was ever loaded."""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
 
     def execute(self, string):
         """
@@ -347,10 +368,11 @@ class Player(object):
 
         """
         if self.client is None:
-            for client in self.wrapper.servervitals.clients:
-                if client.username == self.username:
-                    self.client = client
-                    return client
+            client = self.wrapper.servervitals.clientsbyname.get(
+                self.username)
+            if client:
+                self.client = client
+                return client
             self.log.warning("getClient could not return a client for:%s"
                              " \nThe usual cause of this condition"
                              " is that no client instance exists because"
@@ -969,6 +991,15 @@ class Player(object):
         """
         return self.data.Data["firstLoggedIn"]
 
+    def getPlaytime(self):
+        """
+        Returns the total number of seconds this player has been
+        logged in to the server (all sessions, including the current
+        one).
+
+        """
+        return self.wrapper.sessions.getplaytime(self.mojangUuid.string)
+
     # Cross-server commands
     def connect(self, address, port):
         # TODO - WORK IN PROGRESS
@@ -5,8 +5,11 @@
 # This program is distributed under the terms of the GNU
 # General Public License, version 3 or later.
 
-import struct
 import json
+import math
+import os
+
+from core.region import RegionReader
 
 
 # noinspection PyPep8Naming
@@ -34,7 +37,8 @@ class World(object):
         self.javaserver = mcserver
         self.log = mcserver.log
 
-        self.chunks = {}  # not implemented
+        # saved chunks, read straight from the region files
+        self.regions = RegionReader(os.path.join(mcserver.vitals.serverpath, name))
 
     def __str__(self):
         return self.name
@@ -93,44 +97,71 @@ class World(object):
                  tilename2, damage2, tilename1, damage1))
         return
 
-    def getBlock(self, pos):
+    def getBlock(self, pos, dimension="overworld"):
+        """
+        Get a block, as of the server's last save, by reading the
+        world's region files (no console commands are used).  Chunks
+        are cached, so repeated lookups are cheap.
+
+        :Args:
+            :pos: tuple x, y, z
+            :dimension: "overworld", "nether" or "the_end"
+
+        :returns: The block state - a dictionary like
+         {"Name": "minecraft:stone", "Properties": {...}} (1.13+) or
+         {"id": 1, "data": 0} (before 1.13).  None if the chunk has not
+         been saved yet.
+
         """
-        not implemented
+        x, y, z = (int(math.floor(value)) for value in pos)
+        chunk = self.getChunk(x >> 4, z >> 4, dimension)
+        if chunk is None:
+            return None
+        return chunk.getBlock(x & 15, y, z & 15)
 
+    def getChunk(self, chunkx, chunkz, dimension="overworld"):
         """
-        x, y, z = pos
-        chunkx, chunkz = int(x / 16), int(z / 16)
-        localx, localz = (x / 16.0 - x / 16) * 16, (z / 16.0 - z / 16) * 16
-        # print chunkx, chunkz, localx, y, localz
-        return self.chunks[chunkx][chunkz].getBlock(localx, y, localz)
+        Get a chunk from the world's region files.
+
+        :Args:
+            :chunkx, chunkz: chunk coordinates (block coordinate // 16)
+            :dimension: "overworld", "nether" or "the_end"
 
-    def setChunk(self, x, z, chunk):
-        """ not implemented """
-        if x not in self.chunks:
-            self.chunks[x] = {}
-        self.chunks[x][z] = chunk
+        :returns: A Chunk, or None if the chunk has not been saved yet.
+
+        """
+        sections = self.regions.getsections(chunkx, chunkz, dimension)
+        if sections is None:
+            return None
+        return Chunk(sections, chunkx, chunkz)
 
 
 # noinspection PyPep8Naming
 class Chunk(object):
     """
-    not implemented
+    A 16 x 16 column of the world, as read by World.getChunk().
 
     """
-    def __init__(self, bytesarray, x, z):
-        self.ids = struct.unpack("<" + ("H" * (len(bytesarray) // 2)), bytesarray)
+    def __init__(self, sections, x, z):
+        # {section y: (palette, array of palette indexes)}
+        self.sections = sections
         self.x = x
         self.z = z
-        # for i,v in enumerate(bytesarray):
-        #   y = math.ceil(i/256)
-        #   if y not in self.blocks: self.blocks[y] = {}
-        #   z = int((i/256.0 - int(i/256.0)) * 16)
-        #   if z not in self.blocks[y]: self.blocks[y][z] = {}
-        #   x = (((i/256.0 - int(i/256.0)) * 16) - z) * 16
-        #   if x not in self.blocks[y][z]: self.blocks[y][z][x] = i
 
     def getBlock(self, x, y, z):
-        # print x, y, z
-        i = int((y * 256) + (z * 16) + x)
-        bid = self.ids[i]
-        return bid
+        """
+        Get a block by its position inside the chunk.
+
+        :Args:
+            :x, z: 0 - 15
+            :y: world height
+
+        :returns: The block state (see World.getBlock), or None for
+         sections that were never generated.
+
+        """
+        section = self.sections.get(y >> 4)
+        if section is None:
+            return None
+        palette, indexes = section
+        return palette[indexes[((y & 15) << 8) | (z << 4) | x]]
@@ -45,6 +45,24 @@ CONFIG = {
 
             "backup-compression": False,
 
+         # incremental backups store each changed file once (deduplicated) in '<backup-location>/store' instead of writing a full tar archive each time.  tar is not needed for this mode.
+
+            "backup-incremental": False,
+
+         # number of processes used to compress backup archives (0 = one per CPU).  Compressors run with their priority lowered by 'backup-niceness'.
+
+            "backup-compression-workers": 0,
+
+            "backup-niceness": 10,
+
+         # limits how fast backups read the server files, in KiB per second (0 = no limit).  Useful to keep backups from starving the server of disk bandwidth.
+
+            "backup-bandwidth-limit": 0,
+
+         # backup-staging keeps a copy of the backup-folders in '<backup-location>/staging'.  Server saving is only off while the files changed since the last backup are copied there (reflinked if the filesystem can); the backup is then made from the copy in the background.  Needs disk space for one extra copy of the world.
+
+            "backup-staging": False,
+
          # Specify files and folders you want backed up.  Items must be in your server folder (see 'General' section)
 
             "backup-folders":
@@ -68,6 +86,14 @@ CONFIG = {
 
             "backups-keep": 10,
 
+         # besides the newest 'backups-keep' backups, also keep the newest backup of each of the last N hours, days and weeks (0 = off).
+
+            "backups-keep-hourly": 0,
+
+            "backups-keep-daily": 0,
+
+            "backups-keep-weekly": 0,
+
             "enabled": False
 
         },
@@ -80,6 +106,18 @@ CONFIG = {
 
             "use-timer-tick-event": False,
 
+         # the server's tick rate is monitored (see api.minecraft getTickHealth()).  Below these TPS the "server.tickhealth" event reports "warning" or "critical".
+
+            "tps-warning": 18.0,
+
+            "tps-critical": 12.0,
+
+         # console command run every tps-probe-interval seconds to measure the tick rate: "debug" (vanilla), "forge tps" or "tps" (spigot/paper).  "debug" makes the server write a profiling report to its debug folder each time; wrapper removes the probe's reports.  Without a probe, the tick rate is only known in proxy mode while a player is online.
+
+            "tps-probe-command": "",
+
+            "tps-probe-interval": 30,
+
         },
 
 # Entity processing is somewhat superfluous now that minecraft has more built-in entity management gamerules now.  Must be turned on to use player.mount / unmount events.
@@ -92,7 +130,7 @@ CONFIG = {
 
             "enable-entity-controls": False,
 
-         # how often the entity processor updates world entity counts
+         # no longer used.  Entities are now removed as clients disconnect, change servers or respawn.
 
             "entity-update-frequency": 4,
 
@@ -104,6 +142,14 @@ CONFIG = {
 
             "thinning-activation-threshhold": 100,
 
+         # proxy side entity culling (needs enable-entity-controls).  Spawns of entities farther than this many blocks from the player are held back by the proxy, with the packets that follow them, until the player comes within range.  Nothing is killed on the server.  0 disables.
+
+            "cull-radius": 0,
+
+         # proxy side entity culling: once a player's client has this many entities of one type, further spawns of that type are held back until some are destroyed.  0 disables.
+
+            "cull-type-cap": 0,
+
          # The following items thin specific mobs over the stated count.  This only happens after the total mob count threshold above is met first.  For example, 'thin-Cow: 40` starts thinning cows > 40.  Entity names must match minecraft naming exactly as they would appear in the game.
 
             "thin-Cow": 40,
@@ -174,7 +220,11 @@ CONFIG = {
 
          # Use-betterconsole replaces "use-readline" for clarity about what this option does.  The default is False because use-betterconsole may not be fully cross-platform.  Better Console makes it easier for the console operator too see what they are typing, even while the server or wrapper my be writing output at the same time, essentially produces jline-like functionality to the wrapper console...
 
-            "use-betterconsole": False
+            "use-betterconsole": False,
+
+         # rewrite the server's rotated logs (logs/2017-05-01-1.log.gz) as indexed archives, in the background after the server starts, so /logs can search them by time without decompressing whole files.  They remain ordinary .gz files.
+
+            "archive-server-logs": True
 
         },
 
@@ -217,6 +267,10 @@ CONFIG = {
 
             "timed-reboot-warning-minutes": 5,
 
+         # seconds between samples of the server process's memory, CPU, threads, open files and disk I/O (Linux only).  See api.minecraft getServerResources().
+
+            "resource-sample-interval": 1,
+
          # wrapper detects server version and adjusts accordingly now.
 
             "pre-1.7-mode": "deprecated",
@@ -273,6 +327,14 @@ CONFIG = {
 
             "irc-enabled": False,
 
+         # flood control: up to flood-burst messages at once, then flood-rate messages a second.  Chat that piles up meanwhile is joined into fewer messages; past max-backlog waiting messages the oldest are dropped (and the channel told how many).
+
+            "flood-rate": 0.5,
+
+            "flood-burst": 4,
+
+            "max-backlog": 40,
+
             "nick": "MinecraftWrap",
 
             "obstruct-nicknames": False,
@@ -371,8 +433,26 @@ CONFIG = {
 
             "web-port": 8070,
 
+         # threads serving web requests.  Connections beyond these wait (up to 64), then are refused.
+
+            "web-workers": 8,
+
             "server-name": "Minecraft Server",
 
+         # console lines the web admin keeps for its console view and history search; the oldest are dropped once either the line count or the total size (bytes) is exceeded.
+
+            "console-scrollback-lines": 5000,
+
+            "console-scrollback-bytes": 1048576,
+
+         # chat, join and leave messages the web admin keeps.
+
+            "chat-scrollback-lines": 200,
+
+         # serve /metrics (proxy packet and byte counts, logins, event and storage timings, console lines) in the Prometheus text format.  It needs no login; firewall the web port if that matters.
+
+            "metrics-endpoint": False,
+
         }
 
     }
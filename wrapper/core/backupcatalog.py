@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import json
+import os
+import threading
+import time
+
+
+class BackupCatalog(object):
+    """
+    Persistent record of every backup made, kept as
+    '<backup-location>/catalog.json' so the backup folder never has
+    to be scanned.
+
+    Each record is a dictionary:
+
+        {"file": "backup-2017-06-01_12.00.00.tar.gz",
+         "timestamp": 1496318400,
+         "status": "ok",  # or "running", "failed"
+         "duration": seconds taken,
+         "size": bytes written (new bytes for incremental snapshots),
+         "files": number of files in the backup,
+         "checksum": sha1 of the archive (or snapshot manifest)
+         }
+
+    An old style 'backups.json' ([[timestamp, filename], ...]) or, failing
+    that, the tar files in the folder, are imported the first time.
+    """
+
+    def __init__(self, location, log):
+        self.location = location
+        self.path = os.path.join(location, "catalog.json")
+        self.log = log
+        self.records = []
+        # True if catalog.json could not be read
+        self.corrupted = False
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as f:
+                        self.records = json.load(f)
+                except ValueError:
+                    self.log.error("NOTE - backup catalog %s is unreadable. It might be corrupted. Backups "
+                                   "made before now will no longer be automatically pruned.", self.path)
+                    self.records = []
+                    self.corrupted = True
+                    return False
+            else:
+                self._importlegacy()
+            # anything still 'running' was interrupted by a wrapper shutdown or crash
+            for record in self.records:
+                if record["status"] == "running":
+                    record["status"] = "failed"
+            self.records.sort(key=lambda item: item["timestamp"])
+            self.save()
+        return True
+
+    def save(self):
+        with self._lock:
+            temp = self.path + ".tmp"
+            with open(temp, "w") as f:
+                json.dump(self.records, f, indent=2, sort_keys=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temp, self.path)
+
+    def add(self, filename, timestamp, status="running"):
+        with self._lock:
+            record = {"file": filename, "timestamp": int(timestamp), "status": status,
+                      "duration": 0, "size": 0, "files": 0, "checksum": None}
+            self.records.append(record)
+            self.save()
+            return record
+
+    def update(self, filename, **fields):
+        with self._lock:
+            record = self.get(filename)
+            if record:
+                record.update(fields)
+                self.save()
+            return record
+
+    def remove(self, filename):
+        with self._lock:
+            self.records = [record for record in self.records if record["file"] != filename]
+
+    def get(self, filename):
+        for record in self.records:
+            if record["file"] == filename:
+                return record
+        return None
+
+    def listbackups(self):
+        """copies of all records, oldest first."""
+        with self._lock:
+            return [dict(record) for record in self.records]
+
+    def expired(self, keep=0, hourly=0, daily=0, weekly=0):
+        """
+        Records that the retention policy no longer needs (oldest first).  A backup is kept if it is
+        one of the `keep` newest good backups, or the newest good backup of one of the `hourly` most
+        recent hours, `daily` days or `weekly` weeks that have backups.  Failed backups are never kept;
+        running ones are never expired.
+        """
+        with self._lock:
+            good = [record for record in reversed(self.records) if record["status"] == "ok"]
+            kept = set(record["file"] for record in good[:keep])
+            for count, pattern in ((hourly, "%Y-%m-%d %H"), (daily, "%Y-%m-%d"), (weekly, "%Y-%W")):
+                buckets = set()
+                for record in good:
+                    if len(buckets) >= count:
+                        break
+                    bucket = time.strftime(pattern, time.localtime(record["timestamp"]))
+                    if bucket not in buckets:
+                        buckets.add(bucket)
+                        kept.add(record["file"])
+            return [record for record in self.records
+                    if record["status"] != "running" and record["file"] not in kept]
+
+    def _importlegacy(self):
+        legacy = os.path.join(self.location, "backups.json")
+        pairs = []
+        if os.path.exists(legacy):
+            try:
+                with open(legacy) as f:
+                    pairs = json.load(f)
+            except ValueError:
+                self.log.error("NOTE - backups.json was unreadable and could not be imported.")
+        else:
+            # backups from older versions of Wrapper.py, named 'backup-<timestamp>.tar'
+            for name in os.listdir(self.location):
+                # noinspection PyBroadException
+                try:
+                    pairs.append((int(name[name.find('-') + 1:name.find('.')]), name))
+                except Exception:
+                    pass
+        for timestamp, filename in pairs:
+            path = os.path.join(self.location, filename)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            self.records.append({"file": filename, "timestamp": int(timestamp), "status": "ok",
+                                 "duration": 0, "size": size, "files": 0, "checksum": None})
+        if pairs:
+            self.log.info("Imported %d existing backups into the backup catalog.", len(pairs))
@@ -6,14 +6,45 @@
 # General Public License, version 3 or later.
 
 import datetime
+import errno
+import threading
 import time
 
 import subprocess
 import os
 import platform
+import shutil
+import tarfile
 
 from api.base import API
-from api.helpers import putjsonfile, getjsonfile, mkdir_p
+from api.helpers import mkdir_p
+from core.backupcatalog import BackupCatalog
+from core.backupstore import BackupStore
+from core.compressor import TarCompressor
+
+# ioctl to make a copy-on-write clone of a file (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def _clonefile(source, destination):
+    """reflink-copy source if the filesystem can, otherwise a normal copy.
+    Hard links are not an option; the server modifies region files in place."""
+    if _clonefile.reflink:
+        # noinspection PyBroadException
+        try:
+            import fcntl
+            with open(source, "rb") as src:
+                with open(destination, "wb") as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, destination)
+            return
+        except Exception:
+            # not supported here (or no fcntl) - stop trying.
+            _clonefile.reflink = False
+    shutil.copy2(source, destination)
+
+
+_clonefile.reflink = True
 
 # I should probably not use irc=True when broadcasting, and instead should just rely on events and having
 # MCserver.py and irc.py print messages themselves for the sake of consistency.
@@ -31,10 +62,15 @@ class Backups(object):
         self.interval = 0
         self.backup_interval = self.config["Backups"]["backup-interval"]
         self.time = time.time()
-        self.backups = []
+        self.catalog = None
         self.enabled = self.config["Backups"]["enabled"]  # allow plugins to shutdown backups via api
+        # incremental backups are done by core.backupstore, archives by core.compressor
+        self.incremental = self.config["Backups"]["backup-incremental"]
+        self.store = None
+        # True while a backup (or its background compression) is in progress
+        self.backuprunning = False
         self.timerstarted = False
-        if self.enabled and self.dotarchecks():  # only register event if used and tar installed!
+        if self.enabled:
             self.api.registerEvent("timer.second", self.eachsecond)
             self.timerstarted = True
             self.log.debug("Backups Enabled..")
@@ -46,37 +82,82 @@ class Backups(object):
             self.dobackup()
 
     def pruneoldbackups(self, filename="IndependentPurge"):
-        if len(self.backups) > self.config["Backups"]["backups-keep"]:
+        backupconfig = self.config["Backups"]
+        catalog = self._getcatalog()
+        snapshotsdeleted = False
+        expired = catalog.expired(backupconfig["backups-keep"], backupconfig["backups-keep-hourly"],
+                                  backupconfig["backups-keep-daily"], backupconfig["backups-keep-weekly"])
+        if expired:
             self.log.info("Deleting old backups...")
-            while len(self.backups) > self.config["Backups"]["backups-keep"]:
-                backup = self.backups[0]
-                if not self.wrapper.events.callevent("wrapper.backupDelete", {"file": filename}):
-                    """ eventdoc
-                                    <group> Backups <group>
-
-                                    <description> Called upon deletion of a backup file.
-                                    <description>
-
-                                    <abortable> Yes, return False to abort. <abortable>
-
-                                    <comments>
-                                    
-                                    <comments>
-                                    <payload>
-                                    "file": filename
-                                    <payload>
-
-                                """
-                    break
-                try:
-                    os.remove('%s/%s' % (self.config["Backups"]["backup-location"], backup[1]))
-                except Exception as e:
-                    self.log.error("Failed to delete backup (%s)", e)
-                self.log.info("Deleting old backup: %s",
-                              datetime.datetime.fromtimestamp(int(backup[0])).strftime('%Y-%m-%d_%H:%M:%S'))
-                # hink = self.backups[0][1][:]  # not used...
-                del self.backups[0]
-        putjsonfile(self.backups, "backups", self.config["Backups"]["backup-location"])
+        for backup in expired:
+            if not self.wrapper.events.callevent("wrapper.backupDelete", {"file": backup["file"]}):
+                """ eventdoc
+                                <group> Backups <group>
+
+                                <description> Called upon deletion of a backup file.
+                                <description>
+
+                                <abortable> Yes, return False to abort. <abortable>
+
+                                <comments>
+                                
+                                <comments>
+                                <payload>
+                                "file": filename
+                                <payload>
+
+                            """
+                break
+            try:
+                if self._issnapshot(backup["file"]):
+                    self._getstore().deletesnapshot(backup["file"])
+                    snapshotsdeleted = True
+                elif os.path.exists('%s/%s' % (backupconfig["backup-location"], backup["file"])):
+                    os.remove('%s/%s' % (backupconfig["backup-location"], backup["file"]))
+            except Exception as e:
+                self.log.error("Failed to delete backup (%s)", e)
+                continue
+            self.log.info("Deleting old backup: %s",
+                          datetime.datetime.fromtimestamp(int(backup["timestamp"])).strftime('%Y-%m-%d_%H:%M:%S'))
+            catalog.remove(backup["file"])
+        catalog.save()
+
+        # free the stored files no remaining snapshot uses
+        if snapshotsdeleted or (self.incremental and filename == "IndependentPurge"):
+            removed, freed = self._getstore().collectgarbage()
+            if removed:
+                self.log.info("Removed %d unused backup files (%.1f MiB).", removed, freed / 1048576.0)
+
+    def restorebackup(self, filename, destination=None):
+        """
+        Restore a backup (snapshot or tar archive) into destination.  By default
+        this is '<backup-location>/restored/<filename>', so a live world is
+        never overwritten unless asked for.
+
+        :returns: the destination path, or False if the backup was not found.
+        """
+        location = self.config["Backups"]["backup-location"]
+        if destination is None:
+            destination = "%s/restored/%s" % (location, filename)
+        mkdir_p(destination)
+        self.log.info("Restoring backup '%s' to '%s'...", filename, destination)
+        if self._issnapshot(filename):
+            if self._getstore().restore(filename, destination) is False:
+                self.log.error("Backup snapshot '%s' does not exist.", filename)
+                return False
+        else:
+            archive = "%s/%s" % (location, filename)
+            if not os.path.exists(archive):
+                self.log.error("Backup file '%s' does not exist.", archive)
+                return False
+            try:
+                with tarfile.open(archive) as tar:
+                    tar.extractall(destination)
+            except (tarfile.TarError, IOError, OSError) as e:
+                self.log.error("Could not extract '%s' (%s).", archive, e)
+                return False
+        self.log.info("Backup '%s' restored.", filename)
+        return destination
 
     def dotarchecks(self):
         # Check if tar is installed
@@ -98,7 +179,7 @@ class Backups(object):
                 1 - Tar not installed.
                 2 - Backup file does not exist after the tar operation.
                 3 - Specified file does not exist.
-                4 - backups.json is corrupted
+                4 - catalog.json is corrupted
                 <comments>
                 <payload>
                 "reasonCode": an integer 1-4
@@ -115,12 +196,22 @@ class Backups(object):
             return True
 
     def dobackup(self):
+        if self.backuprunning:
+            self.log.warning("A backup is already in progress; skipping this one.")
+            return
+        self.backuprunning = True
         self.log.debug("Backup starting.")
-        self._settime()
-        self._checkforbackupfolder()
-        self._getbackups()  # populate self.backups
-        self._performbackup()
-        self.log.debug("Backup cycle complete.")
+        try:
+            self._settime()
+            self._checkforbackupfolder()
+            self._getcatalog()
+            background = self._performbackup()
+        except Exception:
+            self.backuprunning = False
+            raise
+        if not background:
+            self.backuprunning = False
+            self.log.debug("Backup cycle complete.")
 
     def _checkforbackupfolder(self):
         if not os.path.exists(self.config["Backups"]["backup-location"]):
@@ -151,14 +242,11 @@ class Backups(object):
         # Turn off server saves...
         self._doserversaving(False)
 
-        # Create tar arguments
         filename = "backup-%s.tar" % datetime.datetime.fromtimestamp(int(timestamp)).strftime("%Y-%m-%d_%H.%M.%S")
-        if self.config["Backups"]["backup-compression"]:
+        if self.incremental:
+            filename = "snapshot-%s" % filename[7:-4]
+        elif self.config["Backups"]["backup-compression"]:
             filename += ".gz"
-            arguments = ["tar", "czf", "%s/%s" % (self.config["Backups"]["backup-location"].replace(" ", "\\ "),
-                                                  filename)]
-        else:
-            arguments = ["tar", "cfpv", "%s/%s" % (self.config["Backups"]["backup-location"], filename)]
 
         # Process begin Events
         if not self.wrapper.events.callevent("wrapper.backupBegin", {"file": filename}):
@@ -179,6 +267,7 @@ class Backups(object):
                 <payload>
 
             """
+            self._doserversaving()
             return
         if self.config["Backups"]["backup-notification"]:
             self.api.minecraft.broadcast("&cBacking up... lag may occur!", irc=False)
@@ -187,9 +276,7 @@ class Backups(object):
         serverpath = self.config["General"]["server-directory"]
         for backupfile in self.config["Backups"]["backup-folders"]:
             backup_file_and_path = "%s/%s" % (serverpath, backupfile)
-            if os.path.exists(backup_file_and_path):
-                arguments.append(backup_file_and_path)
-            else:
+            if not os.path.exists(backup_file_and_path):
                 self.log.warning("Backup file '%s' does not exist - canceling backup", backup_file_and_path)
                 self.wrapper.events.callevent("wrapper.backupFailure", {"reasonCode": 3,
                                                                         "reasonText": "Backup file '%s' does not exist."
@@ -198,12 +285,52 @@ class Backups(object):
                                 <description> internalfunction <description>
 
                             """
+                self._doserversaving()
+                return
+
+        self._getcatalog().add(filename, timestamp)
+        if self.config["Backups"]["backup-staging"]:
+            # copy just the changed files aside, let the server save again and compress the copy later.
+            stagingpath = "%s/staging" % self.config["Backups"]["backup-location"]
+            started = time.time()
+            # noinspection PyBroadException
+            try:
+                copied = self._stagefiles(serverpath, stagingpath)
+            except Exception as e:
+                self.log.exception("Could not stage files for backup (%s)", e)
+                self._doserversaving()
+                self._getcatalog().update(filename, status="failed", duration=int(time.time() - timestamp))
+                self.wrapper.events.callevent("wrapper.backupEnd", {"file": filename, "status": 1})
                 return
-        statuscode = os.system(" ".join(arguments))
+            self._doserversaving()
+            self.log.info("Staged %d changed files in %.1f seconds; server saving is back on.",
+                          copied, time.time() - started)
+            t = threading.Thread(target=self._compressstaged, name="Backup",
+                                 args=(filename, timestamp, stagingpath))
+            t.daemon = True
+            t.start()
+            return True
 
+        statuscode, details = self._makebackup(filename, serverpath)
         # TODO add a wrapper properties config item to set save mode of server
         # restart saves, call finish Events
         self._doserversaving()
+        self._finishbackup(filename, timestamp, statuscode, details)
+
+    def _compressstaged(self, filename, timestamp, stagingpath):
+        try:
+            statuscode, details = self._makebackup(filename, stagingpath)
+            self._finishbackup(filename, timestamp, statuscode, details)
+        finally:
+            self.backuprunning = False
+            self.log.debug("Backup cycle complete.")
+
+    def _makebackup(self, filename, sourcepath):
+        if self.incremental:
+            return self._performsnapshot(filename, sourcepath)
+        return self._performarchive(filename, sourcepath)
+
+    def _finishbackup(self, filename, timestamp, statuscode, details):
         if self.config["Backups"]["backup-notification"]:
             self.api.minecraft.broadcast("&aBackup complete!", irc=False)
         self.wrapper.events.callevent("wrapper.backupEnd", {"file": filename, "status": statuscode})
@@ -222,13 +349,9 @@ class Backups(object):
             <payload>
 
         """
-        self.backups.append((timestamp, filename))
-
-        # Prune backups
-        self.pruneoldbackups(filename)
-
         # Check for success
-        if not os.path.exists(self.config["Backups"]["backup-location"] + "/" + filename):
+        exists = self._backupexists(filename)
+        if not exists:
             self.wrapper.events.callevent("wrapper.backupFailure",
                                           {"reasonCode": 2, "reasonText": "Backup file didn't exist after the tar "
                                                                           "command executed - assuming failure."})
@@ -236,39 +359,147 @@ class Backups(object):
                 <description> internalfunction <description>
 
             """
+        status = "ok" if exists and statuscode == 0 else "failed"
+        self._getcatalog().update(filename, status=status, duration=int(time.time() - timestamp), **details)
 
-    def _getbackups(self):
-        if len(self.backups) == 0 and os.path.exists(self.config["Backups"]["backup-location"] + "/backups.json"):
-            loadcode = getjsonfile("backups", self.config["Backups"]["backup-location"],
-                                   encodedas=self.encoding)
-            if not loadcode:
-                self.log.error("NOTE - backups.json was unreadable. It might be corrupted. Backups will no "
-                               "longer be automatically pruned.")
+        # Prune backups
+        self.pruneoldbackups(filename)
+
+    def listbackups(self):
+        """ catalog records of all backups, oldest first (see core.backupcatalog). """
+        return self._getcatalog().listbackups()
+
+    def _getcatalog(self):
+        if not self.catalog:
+            self.catalog = BackupCatalog(self.config["Backups"]["backup-location"], self.log)
+            if self.catalog.corrupted:
                 self.wrapper.events.callevent("wrapper.backupFailure", {
                     "reasonCode": 4,
-                    "reasonText": "backups.json is corrupted. Please contact an administer instantly, as this "
+                    "reasonText": "catalog.json is corrupted. Please contact an administer instantly, as this "
                                   "may be critical."
                 })
                 """ eventdoc
                     <description> internalfunction <description>
 
                 """
-                self.backups = []
+        return self.catalog
+
+    def _stagefiles(self, serverpath, stagingpath):
+        """
+        Make stagingpath a copy of the backup-folders, copying only files whose size or mtime
+        changed since the last backup.  Returns the number of files copied.
+        """
+        copied = 0
+        wanted = set()
+        for item in self.config["Backups"]["backup-folders"]:
+            source = os.path.join(serverpath, item)
+            if os.path.isfile(source):
+                files = [item]
             else:
-                self.backups = loadcode
-        else:
-            if len(os.listdir(self.config["Backups"]["backup-location"])) > 0:
-                # import old backups from previous versions of Wrapper.py
-                backuptimestamps = []
-                for backupNames in os.listdir(self.config["Backups"]["backup-location"]):
-                    # noinspection PyBroadException,PyUnusedLocal
-                    try:
-                        backuptimestamps.append(int(backupNames[backupNames.find('-') + 1:backupNames.find('.')]))
-                    except Exception as e:
-                        pass
-                backuptimestamps.sort()
-                for backupI in backuptimestamps:
-                    self.backups.append((int(backupI), "backup-%s.tar" % str(backupI)))
+                files = []
+                for dirpath, dirnames, filenames in os.walk(source):
+                    for filename in filenames:
+                        files.append(os.path.relpath(os.path.join(dirpath, filename), serverpath))
+            for relpath in files:
+                wanted.add(relpath)
+                src = os.path.join(serverpath, relpath)
+                dst = os.path.join(stagingpath, relpath)
+                try:
+                    srcstat = os.stat(src)
+                except OSError:
+                    continue
+                try:
+                    dststat = os.stat(dst)
+                    if dststat.st_size == srcstat.st_size and int(dststat.st_mtime) == int(srcstat.st_mtime):
+                        continue
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                mkdir_p(os.path.dirname(dst))
+                _clonefile(src, dst)
+                copied += 1
+
+        # remove what the server (or the config) no longer has
+        for dirpath, dirnames, filenames in os.walk(stagingpath, topdown=False):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.relpath(path, stagingpath) not in wanted:
+                    os.remove(path)
+            if dirpath != stagingpath and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+        return copied
+
+    def _performsnapshot(self, name, serverpath):
+        """ incremental backup of the backup-folders.  Returns (0 for success (like tar), catalog details). """
+        # noinspection PyBroadException
+        try:
+            stats = self._getstore().snapshot(name, serverpath, self.config["Backups"]["backup-folders"])
+        except Exception as e:
+            self.log.exception("Incremental backup '%s' failed (%s)", name, e)
+            return 1, {}
+        self.log.info("Backup %s: %d files, %d new (%.1f of %.1f MiB stored).", name, stats["files"],
+                      stats["newfiles"], stats["newbytes"] / 1048576.0, stats["totalbytes"] / 1048576.0)
+        return 0, {"size": stats["newbytes"], "files": stats["files"], "checksum": stats["checksum"]}
+
+    def _performarchive(self, filename, serverpath):
+        """ write the backup-folders to a tar(.gz) archive.  Returns (0 for success (like tar), catalog details). """
+        backupconfig = self.config["Backups"]
+        path = "%s/%s" % (backupconfig["backup-location"], filename)
+
+        def progress(bytesread, byteswritten, rate):
+            self.wrapper.events.callevent("wrapper.backupProgress", {
+                "file": filename, "bytesread": bytesread, "byteswritten": byteswritten, "rate": rate})
+            """ eventdoc
+                <group> Backups <group>
+
+                <description> Progress of a backup archive being written.  Sent about once a second.
+                <description>
+
+                <abortable> No - informational only <abortable>
+
+                <comments>
+                <comments>
+                <payload>
+                "file": Name of backup file.
+                "bytesread": bytes of server files archived so far.
+                "byteswritten": bytes written to the backup file so far.
+                "rate": average bytes read per second.
+                <payload>
+
+            """
+
+        # noinspection PyBroadException
+        try:
+            with TarCompressor(path, compress=backupconfig["backup-compression"],
+                               workers=backupconfig["backup-compression-workers"],
+                               ratelimit=backupconfig["backup-bandwidth-limit"] * 1024,
+                               niceness=backupconfig["backup-niceness"], progress=progress) as archive:
+                for backupfile in backupconfig["backup-folders"]:
+                    archive.add("%s/%s" % (serverpath, backupfile), backupfile)
+        except Exception as e:
+            self.log.exception("Backup '%s' failed (%s)", filename, e)
+            if os.path.exists(path):
+                os.remove(path)
+            return 1, {}
+        self.log.info("Backup %s: %.1f MiB archived to %.1f MiB (%.1f MiB/s).", filename,
+                      archive.bytesread / 1048576.0, archive.byteswritten / 1048576.0,
+                      archive.rate() / 1048576.0)
+        return 0, {"size": archive.byteswritten, "files": archive.files, "checksum": archive.checksum.hexdigest()}
+
+    def _getstore(self):
+        if not self.store:
+            self.store = BackupStore(self.config["Backups"]["backup-location"], self.log,
+                                     compress=self.config["Backups"]["backup-compression"])
+        return self.store
+
+    def _backupexists(self, filename):
+        if self._issnapshot(filename):
+            return filename in self._getstore().snapshots()
+        return os.path.exists(self.config["Backups"]["backup-location"] + "/" + filename)
+
+    @staticmethod
+    def _issnapshot(filename):
+        return filename.startswith("snapshot-")
 
     def _settime(self):
         self.time = time.time()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import zlib
+
+from api.helpers import mkdir_p
+
+# read/hash files in pieces of this size
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupStore(object):
+    """
+    Incremental, deduplicating backup store.
+
+    Every file is stored once, as a blob named by the sha1 of its
+    contents.  A snapshot is just a manifest listing the files it
+    contains and the blob each one points to, so an unchanged file
+    costs nothing in a new snapshot.  Files whose size and mtime
+    match the previous snapshot are not even re-read.
+
+    Layout (inside the backup location):
+
+        store/objects/ab/abcdef... - blobs (".z" suffix if zlib-compressed)
+        store/manifests/<snapshot>.json
+
+    A manifest is:
+
+        {"timestamp": int,
+         "files": {"world/level.dat": [sha1, size, mtime, mode], ...}}
+
+    Blobs are only deleted by `collectgarbage()`, which removes
+    those that no manifest references.
+    """
+
+    def __init__(self, location, log, compress=False):
+        self.root = os.path.join(location, "store")
+        self.objects = os.path.join(self.root, "objects")
+        self.manifests = os.path.join(self.root, "manifests")
+        self.log = log
+        self.compress = compress
+        mkdir_p(self.objects)
+        mkdir_p(self.manifests)
+
+    def snapshot(self, name, basepath, items):
+        """
+        Create snapshot `name` from the listed files/folders.
+
+        :Args:
+            :name: snapshot name (no extension).
+            :basepath: the directory `items` are relative to.
+            :items: list of relative file or folder names.
+
+        :returns: a dict of stats - files, newfiles, newbytes,
+         totalbytes and checksum (sha1 of the manifest).
+
+        """
+        previous = self.readmanifest(self.latest()) or {"files": {}}
+        oldfiles = previous["files"]
+        files = {}
+        stats = {"files": 0, "newfiles": 0, "newbytes": 0, "totalbytes": 0}
+
+        for relpath in self._walk(basepath, items):
+            fullpath = os.path.join(basepath, relpath)
+            try:
+                st = os.stat(fullpath)
+            except OSError:
+                # deleted while we were walking
+                continue
+            size, mtime = st.st_size, int(st.st_mtime)
+            old = oldfiles.get(relpath)
+            if old and old[1] == size and old[2] == mtime \
+                    and self.hasblob(old[0]):
+                digest = old[0]
+            else:
+                digest, stored = self._storefile(fullpath)
+                if stored:
+                    stats["newfiles"] += 1
+                    stats["newbytes"] += size
+            files[relpath] = [digest, size, mtime, st.st_mode & 0o777]
+            stats["files"] += 1
+            stats["totalbytes"] += size
+
+        stats["checksum"] = self._writejson(
+            os.path.join(self.manifests, "%s.json" % name),
+            {"timestamp": int(time.time()), "files": files})
+        return stats
+
+    def restore(self, name, destination):
+        """
+        Recreate snapshot `name` under destination.
+
+        :returns: number of files restored, or False if there is
+         no such snapshot.
+
+        """
+        manifest = self.readmanifest(name)
+        if not manifest:
+            return False
+        count = 0
+        for relpath, (digest, size, mtime, mode) in manifest["files"].items():
+            target = os.path.join(destination, relpath)
+            mkdir_p(os.path.dirname(target) or ".")
+            with open(target, "wb") as f:
+                self._copyblob(digest, f)
+            os.chmod(target, mode)
+            os.utime(target, (mtime, mtime))
+            count += 1
+        return count
+
+    def snapshots(self):
+        """sorted list of snapshot names (oldest first)."""
+        names = [item[:-5] for item in os.listdir(self.manifests)
+                 if item.endswith(".json")]
+        names.sort()
+        return names
+
+    def latest(self):
+        names = self.snapshots()
+        if names:
+            return names[-1]
+        return None
+
+    def readmanifest(self, name):
+        if not name:
+            return None
+        path = os.path.join(self.manifests, "%s.json" % name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            self.log.error("Backup manifest %s is corrupted.", path)
+            return None
+
+    def deletesnapshot(self, name):
+        """remove a snapshot's manifest.  Its blobs remain until
+        `collectgarbage()` is run."""
+        path = os.path.join(self.manifests, "%s.json" % name)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def collectgarbage(self):
+        """delete blobs not referenced by any snapshot.
+
+        :returns: (blobs removed, bytes freed)
+        """
+        live = set()
+        for name in self.snapshots():
+            manifest = self.readmanifest(name)
+            if manifest is None:
+                # can't tell what a corrupt manifest references.
+                self.log.error("Skipping backup garbage collection because"
+                               " manifest '%s' is unreadable.", name)
+                return 0, 0
+            for entry in manifest["files"].values():
+                live.add(entry[0])
+        removed = freed = 0
+        for prefix in os.listdir(self.objects):
+            folder = os.path.join(self.objects, prefix)
+            for blob in os.listdir(folder):
+                digest = blob.split(".")[0]
+                # ".tmp" files are leftovers of an interrupted write
+                if digest in live and not blob.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, blob)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+            if not os.listdir(folder):
+                os.rmdir(folder)
+        return removed, freed
+
+    def hasblob(self, digest):
+        return self._blobpath(digest) is not None
+
+    def _blobpath(self, digest):
+        base = os.path.join(self.objects, digest[:2], digest)
+        if os.path.exists(base):
+            return base
+        if os.path.exists(base + ".z"):
+            return base + ".z"
+        return None
+
+    def _storefile(self, fullpath):
+        """hash the file and add it as a blob if it is new.
+
+        :returns: (sha1, True if a blob was written)
+        """
+        sha = hashlib.sha1()
+        with open(fullpath, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                sha.update(data)
+        digest = sha.hexdigest()
+        if self.hasblob(digest):
+            return digest, False
+
+        folder = os.path.join(self.objects, digest[:2])
+        mkdir_p(folder)
+        target = os.path.join(folder, digest)
+        if self.compress:
+            target += ".z"
+        temp = target + ".tmp"
+        compressor = zlib.compressobj() if self.compress else None
+        with open(fullpath, "rb") as source:
+            with open(temp, "wb") as f:
+                while True:
+                    data = source.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    if compressor:
+                        data = compressor.compress(data)
+                    f.write(data)
+                if compressor:
+                    f.write(compressor.flush())
+        # a blob only appears under its final name once complete.
+        os.rename(temp, target)
+        return digest, True
+
+    def _copyblob(self, digest, destfile):
+        path = self._blobpath(digest)
+        if path is None:
+            raise IOError("backup blob %s is missing" % digest)
+        decompressor = zlib.decompressobj() if path.endswith(".z") else None
+        with open(path, "rb") as f:
+            if not decompressor:
+                shutil.copyfileobj(f, destfile, CHUNK_SIZE)
+                return
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                destfile.write(decompressor.decompress(data))
+            destfile.write(decompressor.flush())
+
+    @staticmethod
+    def _walk(basepath, items):
+        """yield paths (relative to basepath, '/' separated) of every
+        file in items."""
+        for item in items:
+            fullpath = os.path.join(basepath, item)
+            if os.path.isfile(fullpath):
+                yield item.replace(os.sep, "/")
+                continue
+            for dirpath, dirnames, filenames in os.walk(fullpath):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    relpath = os.path.relpath(
+                        os.path.join(dirpath, filename), basepath)
+                    yield relpath.replace(os.sep, "/")
+
+    @staticmethod
+    def _writejson(path, data):
+        """write data as json; returns the sha1 of what was written."""
+        text = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(text)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
+        return hashlib.sha1(text).hexdigest()
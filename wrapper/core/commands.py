@@ -6,6 +6,7 @@
 # General Public License, version 3 or later.
 
 import random
+import re
 import time
 import json
 
@@ -13,6 +14,7 @@ from api.helpers import format_bytes, getargs, getargsafter, readout
 from api.helpers import get_int, set_item, putjsonfile
 # noinspection PyProtectedMember
 from api.helpers import _secondstohuman, _showpage
+from core.logsearch import parsetime
 from utils.crypt import get_passphrase
 
 
@@ -98,6 +100,14 @@ class Commands(object):
             self.command_entities(player, payload)
             return True
 
+        elif command == "worldstats":
+            self.command_worldstats(player, payload)
+            return True
+
+        elif command == "logs":
+            self.command_logs(player, payload)
+            return True
+
         elif command in (
                 "config", "con", "prop", "property", "properties"):
             self.command_setconfig(player, payload)
@@ -375,6 +385,118 @@ class Commands(object):
         player.message("&c       /entity player <name> list")
         player.message("&c       /entity kill <EIDofEntity> [count]")
 
+    def command_worldstats(self, player, payload):
+        if not self._superop(player):
+            return False
+
+        worldstats = self.wrapper.worldstats
+        commargs = payload["args"]
+        subcommand = getargs(commargs, 0).lower()
+        if subcommand in ("run", "analyze", "update"):
+            blocks = getargs(commargs, 1).lower() != "noblocks"
+            if worldstats.analyze(blocks=blocks, callback=lambda report: player.message(
+                    "&aWorld analysis finished - run /worldstats for the results.")):
+                player.message("&eAnalyzing the world's region files in the background...")
+            else:
+                player.message("&cAn analysis is already running (or the world is not loaded yet).")
+            return
+        elif subcommand in ("entities", "tiles", "inhabited"):
+            count = get_int(getargs(commargs, 1)) or 10
+            player.message("&6----- Top %d chunks by %s -----" % (count, subcommand))
+            for dimension, chunkx, chunkz, value in worldstats.top(subcommand, count):
+                if subcommand == "inhabited":
+                    value = _secondstohuman(value // 20)
+                player.message("&e%s chunk %d, %d &7(blocks %d, %d)&e: &6%s" % (
+                    dimension, chunkx, chunkz, chunkx * 16, chunkz * 16, value))
+            return
+        elif subcommand == "blocks":
+            count = get_int(getargs(commargs, 1)) or 10
+            blocks = worldstats.totals()["blocks"]
+            if not blocks:
+                player.message("&cNo block counts - run '/worldstats run' first.")
+                return
+            player.message("&6----- Top %d blocks -----" % count)
+            for name in sorted(blocks, key=blocks.get, reverse=True)[:count]:
+                player.message("&e%s: &6%d" % (name, blocks[name]))
+            return
+        elif subcommand in ("", "status"):
+            if worldstats.running:
+                player.message("&eWorld analysis running: %d of %d region files read." %
+                               worldstats.progress)
+            if not worldstats.report["updated"]:
+                player.message("&cThe world has not been analyzed yet - run '/worldstats run'.")
+                return
+            totals = worldstats.totals()
+            player.message("&6----- World analysis of %s -----" % time.strftime(
+                "%Y-%m-%d %H:%M", time.localtime(worldstats.report["updated"])))
+            player.message("&eChunks: &6%d" % totals["chunks"])
+            for field, title in (("entities", "Entities"), ("tiles", "Tile entities")):
+                counts = totals[field]
+                player.message("&e%s: &6%d" % (title, sum(counts.values())))
+                for name in sorted(counts, key=counts.get, reverse=True)[:5]:
+                    player.message("&7    %s: %d" % (name, counts[name]))
+            return
+
+        player.message("&cUsage: /worldstats [status]")
+        player.message("&c       /worldstats run [noblocks]")
+        player.message("&c       /worldstats entities/tiles/inhabited [count]")
+        player.message("&c       /worldstats blocks [count]")
+
+    def command_logs(self, player, payload):
+        if not self._superop(player):
+            return False
+
+        logsearch = self.wrapper.logsearch
+        commargs = payload["args"]
+        source = getargs(commargs, 0).lower()
+        if source not in logsearch.sources():
+            player.message("&cUsage: /logs <%s> [from:<time>] [to:<time>] [n:<lines>] [regex]" %
+                           "/".join(logsearch.sources()))
+            player.message("&c  <time> is 30m, 6h, 2d (ago), 2017-05-01 or 2017-05-01T14:30")
+            player.message("&c  shows the newest matching lines (20 unless n: is given)")
+            return
+        since = until = None
+        count = 20
+        skip = 0
+        words = commargs[1:]
+        # leading from:/to:/n:/skip: options; the rest is the regex
+        while words and ":" in words[0] and \
+                words[0].partition(":")[0].lower() in ("from", "to", "n", "skip"):
+            option, _, value = words.pop(0).partition(":")
+            option = option.lower()
+            if option == "n":
+                count = min(get_int(value) or 20, 200)
+                continue
+            if option == "skip":
+                skip = max(get_int(value), 0)
+                continue
+            when = parsetime(value)
+            if when is None:
+                player.message("&cNot a time: %s" % value)
+                return
+            if option == "from":
+                since = when
+            else:
+                until = when
+        try:
+            found = logsearch.search(source, " ".join(words), since, until, count, skip)
+        except re.error as e:
+            player.message("&cBad regex: %s" % e)
+            return
+        if not found["results"]:
+            player.message("&eNo matching lines.")
+            return
+        for stamp, line in found["results"]:
+            # wrapper log lines carry the date already
+            if source == "server" and stamp:
+                line = "%s %s" % (time.strftime("%Y-%m-%d", time.localtime(stamp)), line)
+            player.message("&7%s" % line)
+        if found["next"]:
+            # skip: the lines of that second already shown
+            player.message("&eOlder lines: /logs %s to:%s skip:%d ..." % (
+                source, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(found["next"])),
+                found["skip"]))
+
     def command_wrapper(self, player, payload):
         if not self._superop(player):
             return False
@@ -406,12 +528,25 @@ class Commands(object):
                 player.message("&cHalting Wrapper.py... goodbye!")
                 self.wrapper.shutdown()
             elif subcommand in ("mem", "memory"):
-                server_bytes = self.wrapper.javaserver.getmemoryusage()
+                server_bytes = self.wrapper.serverstats.get().get("server_memory")
                 if server_bytes:
                     amount, units = format_bytes(server_bytes)
                     player.message("&cServer Memory: %s %s (%s bytes)" % (amount, units, server_bytes))
                 else:
                     player.message("&cError: Couldn't retrieve memory usage for an unknown reason")
+            elif subcommand == "stats":
+                stats = self.wrapper.serverstats.get()
+                if not stats:
+                    player.message("&cServer stats are not available yet.")
+                    return
+                player.message("&7%s - %s (%s)" % (stats["server_name"], stats["server_version"], stats["level_name"]))
+                player.message("&7Players: &a%d/%d" % (stats["playerCount"][0], stats["playerCount"][1]))
+                player.message("&7Plugins: &a%d" % len(stats["plugins"]))
+                for label, value in (("Server memory", stats["server_memory"]), ("World size", stats["world_size"]),
+                                     ("Disk available", stats["disk_avail"])):
+                    amount, units = format_bytes(value)
+                    player.message("&7%s: &a%s %s" % (label, amount, units))
+                player.message("&7(as of %d seconds ago)" % (time.time() - stats["updated"]))
             elif subcommand == "random":
                 player.message("&cRandom number: &a%d" % random.randrange(0, 99999999))
         else:
@@ -649,37 +784,19 @@ class Commands(object):
             return
 
         subcommand = getargs(payload["args"], 0)
-        totalplaytime = {}
-        players = self.wrapper.api.minecraft.getAllPlayers()
-        for each_uuid in players:
-            if "logins" not in players[each_uuid]:
-                continue
-            playername = self.wrapper.uuids.getusernamebyuuid(each_uuid)
-            totalplaytime[playername] = [0, 0]
-            for i in players[each_uuid]["logins"]:
-                totalplaytime[
-                    playername][0] += players[each_uuid]["logins"][i] - int(i)
-                totalplaytime[playername][1] += 1
 
         if subcommand == "all":
             player.message("&6----- All Players' Playtime -----")
-            for name in totalplaytime:
-                seconds = totalplaytime[name][0]
+            for seconds, name, logins in self.wrapper.sessions.gettopplaytimes():
                 result = _secondstohuman(seconds)
                 player.message("&e%s:&6 %s (%d logins)" %
-                               (name, result, totalplaytime[name][1]))
+                               (name, result, logins))
         else:
-            topplayers = []
-            for username in totalplaytime:
-                topplayers.append((totalplaytime[username][0], username))
-            topplayers.sort()
-            topplayers.reverse()
+            topplayers = self.wrapper.sessions.gettopplaytimes(10)
             player.message("&6----- Top 10 Players' Playtime -----")
             for i, p in enumerate(topplayers):
                 result = _secondstohuman(p[0])
                 player.message("&7%d. &e%s:&6 %s" % (i + 1, p[1], result))
-                if i == 9:
-                    break
         return
 
     def command_deop(self, player, payload):
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import hashlib
+import multiprocessing
+import os
+import tarfile
+import time
+import zlib
+from collections import deque
+
+# the tar stream is cut into blocks of this size, each compressed
+# separately (by a pool process) as its own gzip member.
+BLOCK_SIZE = 1024 * 1024
+
+
+def _lowerpriority(niceness):
+    """pool initializer - run compression at a lower CPU priority."""
+    if niceness and hasattr(os, "nice"):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+def _compressblock(data, level):
+    """compress one block into a complete gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class TarCompressor(object):
+    """
+    Writes a tar (or tar.gz) archive in-process, replacing the
+    external `tar` command.
+
+    For .tar.gz the tar stream is split into BLOCK_SIZE pieces which
+    are gzip-compressed in parallel by a multiprocessing pool and
+    written in order as consecutive gzip members (what `pigz` does).
+    A multi-member gzip file is a normal gzip file to every reader,
+    so `tar xzf` and tarfile read it as usual.
+
+    :Args:
+        :path: the archive file to create.
+        :compress: gzip the archive.
+        :workers: compressor processes (0 - one per CPU, 1 - compress
+         in this process).
+        :level: gzip compression level.
+        :ratelimit: maximum rate files are read, in bytes/second (0
+         for no limit).  This keeps the backup from starving the
+         server of disk bandwidth.
+        :niceness: added to the compressor processes' nice value.
+        :progress: optional callable, called at most once a second
+         with (bytesread, byteswritten, bytes per second).
+
+    """
+
+    def __init__(self, path, compress=True, workers=0, level=6,
+                 ratelimit=0, niceness=10, progress=None):
+        self.path = path
+        self.compress = compress
+        self.workers = workers or multiprocessing.cpu_count()
+        self.level = level
+        self.ratelimit = ratelimit
+        self.niceness = niceness
+        self.progress = progress
+
+        self.bytesread = 0
+        self.byteswritten = 0
+        # number of files archived
+        self.files = 0
+        # sha1 of the archive file
+        self.checksum = hashlib.sha1()
+        self.started = 0
+
+        self._file = None
+        self._tar = None
+        self._pool = None
+        self._buffer = []
+        self._buffered = 0
+        self._pending = deque()
+        self._lastprogress = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(abort=exc_type is not None)
+
+    def open(self):
+        self.started = time.time()
+        self._file = open(self.path, "wb")
+        if self.compress and self.workers > 1:
+            try:
+                self._pool = multiprocessing.Pool(
+                    self.workers, _lowerpriority, (self.niceness,))
+            except (OSError, ImportError, NotImplementedError):
+                # no working multiprocessing; compress in-line.
+                self._pool = None
+        # tar's own 'stream' mode; we are the file object.
+        self._tar = tarfile.open(fileobj=self, mode="w|")
+
+    def add(self, path, arcname):
+        """add a file or folder (recursively) to the archive."""
+        self._tar.add(path, arcname=arcname, filter=self._countmember)
+
+    def close(self, abort=False):
+        """finish the archive.  With abort=True, the pool is
+        terminated and the partial archive is left for the caller
+        to remove."""
+        try:
+            if not abort:
+                self._tar.close()
+                self._flushbuffer()
+                while self._pending:
+                    self._writeresult(self._pending.popleft())
+                self._reportprogress(True)
+        finally:
+            if self._pool:
+                if abort:
+                    self._pool.terminate()
+                else:
+                    self._pool.close()
+                self._pool.join()
+                self._pool = None
+            self._file.close()
+
+    def rate(self):
+        """average bytes read per second so far."""
+        elapsed = time.time() - self.started
+        if elapsed <= 0:
+            return 0
+        return self.bytesread / elapsed
+
+    # file object interface used by tarfile
+    def write(self, data):
+        self.bytesread += len(data)
+        if not self.compress:
+            self._writeresult(data)
+        else:
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if self._buffered >= BLOCK_SIZE:
+                self._flushbuffer()
+        self._throttle()
+        self._reportprogress()
+
+    def tell(self):
+        return self.bytesread
+
+    def _flushbuffer(self):
+        if not self._buffered:
+            return
+        block = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if not self._pool:
+            self._writeresult(_compressblock(block, self.level))
+            return
+        self._pending.append(self._pool.apply_async(
+            _compressblock, (block, self.level)))
+        # bound memory use - wait on the oldest block when too many
+        # are in flight.
+        while len(self._pending) > self.workers * 2 or (
+                self._pending and self._pending[0].ready()):
+            self._writeresult(self._pending.popleft())
+
+    def _writeresult(self, result):
+        if not isinstance(result, bytes):
+            result = result.get()
+        self._file.write(result)
+        self.checksum.update(result)
+        self.byteswritten += len(result)
+
+    def _countmember(self, tarinfo):
+        if tarinfo.isfile():
+            self.files += 1
+        return tarinfo
+
+    def _throttle(self):
+        if not self.ratelimit:
+            return
+        ahead = self.bytesread / float(self.ratelimit) - (
+            time.time() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def _reportprogress(self, final=False):
+        if not self.progress:
+            return
+        now = time.time()
+        if final or now - self._lastprogress >= 1:
+            self._lastprogress = now
+            self.progress(self.bytesread, self.byteswritten, self.rate())
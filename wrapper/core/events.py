@@ -5,6 +5,14 @@
 # This program is distributed under the terms of the GNU
 # General Public License, version 3 or later.
 
+import time
+
+from utils.metrics import REGISTRY
+
+_DISPATCH_SECONDS = REGISTRY.histogram(
+    "wrapper_event_dispatch_seconds", "Time taken to run an event's "
+    "plugin handlers.", ("event",))
+
 
 class Events(object):
 
@@ -35,6 +43,7 @@ class Events(object):
             yield i
 
     def callevent(self, event, payload):
+        started = time.time()
         # create reference player object for payload, if needed.
         if payload and ("playername" in payload) and ("player" not in payload):
             payload["player"] = self.wrapper.api.minecraft.getPlayer(
@@ -88,4 +97,5 @@ class Events(object):
                             # non dictionary payloads are deprecated and will be overridden by dict payloads
                             # dict payloads are those that return the payload in the same format as it was passed.
                             payload_status = result
+        _DISPATCH_SECONDS.labels(event).observe(time.time() - started)
         return payload_status
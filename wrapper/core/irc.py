@@ -9,7 +9,7 @@ import socket
 import time
 import threading
 import random
-import math
+from collections import deque
 
 import core.buildinfo as version_info
 
@@ -23,6 +23,79 @@ if PY3:
     # noinspection PyShadowingBuiltins
     xrange = range
 
+# longest PRIVMSG text sent; longer messages are split
+MAX_LINE = 400
+
+# joins chat lines coalesced into one PRIVMSG
+JOINER = " | "
+
+
+class TokenBucket(object):
+    """
+    Flood control: `burst` messages may go at once, then `rate` a
+    second.
+
+    :Args:
+        :rate: messages per second (refill rate).
+        :burst: most messages sent back to back.
+
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = max(rate, 0.01)
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.stamp = time.time()
+
+    def take(self):
+        """ Take a token, sleeping until there is one. """
+        while True:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class OutboundQueue(object):
+    """
+    Messages waiting to go to IRC, as (target, text) - target None
+    for every channel.  Bounded: past `limit` messages the oldest are
+    dropped (and counted, so the sender can say so).  The sender
+    blocks in take() until there is something to send.
+    """
+
+    def __init__(self, limit):
+        self.limit = max(limit, 1)
+        self.items = deque()
+        # messages dropped since the last take()
+        self.dropped = 0
+        self._waiting = threading.Condition()
+
+    def append(self, message, target=None):
+        with self._waiting:
+            if len(self.items) >= self.limit:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append((target, message))
+            self._waiting.notify()
+
+    def take(self, timeout):
+        """ ([(target, text), ...] oldest first, count dropped) of all
+        that is waiting; waits up to `timeout` seconds for something. """
+        with self._waiting:
+            if not self.items and not self.dropped:
+                self._waiting.wait(timeout)
+            items = list(self.items)
+            self.items.clear()
+            dropped, self.dropped = self.dropped, 0
+        return items, dropped
+
+    def __len__(self):
+        return len(self.items)
+
 
 # due to self.socket being ducktyped as boolean when it is used later as a socket.
 # also, api uses mixedCase
@@ -47,7 +120,9 @@ class IRC(object):
         self.log = log
         self.timeout = False
         self.ready = False
-        self.msgQueue = []
+        # set once the server has welcomed us (messages can be sent)
+        self.readyevent = threading.Event()
+        self.msgQueue = OutboundQueue(self.config["IRC"]["max-backlog"])
         self.authorized = {}
 
         self.api = API(self.wrapper, "IRC", internal=True)
@@ -89,6 +164,7 @@ class IRC(object):
             time.sleep(5)
 
     def connect(self):
+        self.readyevent.clear()
         self.nickname = self.originalNickname[0:]
         self.socket = socket.socket()
         self.socket.connect((self.address, self.port))
@@ -236,6 +312,7 @@ class IRC(object):
                     self.log.error("Disconnected from IRC")
                     self.socket = False
                     self.ready = False
+                    self.readyevent.clear()
                     break
             except socket.timeout:
                 if self.timeout:
@@ -252,21 +329,60 @@ class IRC(object):
                 self.parse(line)
 
     def queue(self):
+        """ The sender thread: relays msgQueue at the IRC "flood-rate",
+        coalescing what piled up meanwhile. """
+        bucket = TokenBucket(self.config["IRC"]["flood-rate"], self.config["IRC"]["flood-burst"])
         while self.socket:
-            if not self.ready:
-                time.sleep(0.1)
+            if not self.readyevent.wait(1):
                 continue
-            for i, message in enumerate(self.msgQueue):
-                for channel in self.channels:
-                    if len(message) > 400:
-                        for l in xrange(int(math.ceil(len(message) / 400.0))):
-                            chunk = message[l * 400:(l + 1) * 400]
-                            self.send("PRIVMSG %s :%s" % (channel, chunk))
-                    else:
-                        self.send("PRIVMSG %s :%s" % (channel, message))
-                del self.msgQueue[i]
-            self.msgQueue = []
-            time.sleep(0.1)
+            items, dropped = self.msgQueue.take(1)
+            for target, text in self.batch(items, dropped):
+                if not self.socket:
+                    return
+                bucket.take()
+                self.send("PRIVMSG %s :%s" % (target, text))
+
+    def batch(self, items, dropped=0):
+        """
+        The PRIVMSGs, as (target, text), for queued (target, message)
+        items: consecutive messages to a target are joined into one
+        PRIVMSG as far as MAX_LINE allows; longer messages are split.
+        The targets take turns, so one busy target does not hold up
+        the others.
+        """
+        lines = {}
+        order = []
+        if dropped:
+            # the dropped messages were the oldest
+            for name in self.channels:
+                lines[name] = ["[%d messages were not relayed]" % dropped]
+                order.append(name)
+        for target, message in items:
+            for name in (self.channels if target is None else (target,)):
+                if name not in lines:
+                    lines[name] = []
+                    order.append(name)
+                lines[name].append(message)
+        merged = dict((name, self._coalesce(lines[name])) for name in order)
+        result = []
+        for position in xrange(max([len(texts) for texts in merged.values()] or [0])):
+            for name in order:
+                if position < len(merged[name]):
+                    result.append((name, merged[name][position]))
+        return result
+
+    @staticmethod
+    def _coalesce(messages):
+        texts = []
+        for message in messages:
+            while len(message) > MAX_LINE:
+                texts.append(message[:MAX_LINE])
+                message = message[MAX_LINE:]
+            if texts and len(texts[-1]) + len(JOINER) + len(message) <= MAX_LINE:
+                texts[-1] = "%s%s%s" % (texts[-1], JOINER, message)
+            else:
+                texts.append(message)
+        return texts
 
     def filterName(self, name):
         if self.config["IRC"]["obstruct-nicknames"]:
@@ -293,6 +409,7 @@ class IRC(object):
             for channel in self.channels:
                 self.send("JOIN %s" % channel)
             self.ready = True
+            self.readyevent.set()
             self.log.info("Connected to IRC!")
             self.state = True
             self.nickAttempts = 0
@@ -350,10 +467,10 @@ class IRC(object):
                     users = ""
                     for user in self.javaserver.players:
                         users += "%s " % user
-                    self.send("PRIVMSG %s :There are currently %s users on the server: %s" %
-                              (channel, len(self.javaserver.players), users))
+                    self.msgQueue.append("There are currently %s users on the server: %s" %
+                                         (len(self.javaserver.players), users), channel)
                 elif message.strip() == ".about":
-                    self.send("PRIVMSG %s :Wrapper.py Version %s" % (channel, self.wrapper.getbuildstring()))
+                    self.msgQueue.append("Wrapper.py Version %s" % self.wrapper.getbuildstring(), channel)
                 else:
                     if not PY3:
                         message = message.decode(self.encoding, "ignore")
@@ -375,7 +492,7 @@ class IRC(object):
 
                 def msg(string):
                     self.log.info("[PRIVATE] (%s) %s", self.nickname, string)
-                    self.send("PRIVMSG %s :%s" % (nick, string))
+                    self.msgQueue.append(string, nick)
                 if self.config["IRC"]["control-irc-pass"] == "password":
                     msg("A new password is required in wrapper.properties. Please change it.")
                 if "password" in self.config["IRC"]["control-irc-pass"]:
@@ -444,8 +561,9 @@ class IRC(object):
                             else:
                                 msg("Server is in unknown state. This is probably a Wrapper.py bug - report it! "
                                     "(state #%d)" % self.javaserver.state)
-                            if self.wrapper.javaserver.getmemoryusage():
-                                msg("Server Memory Usage: %d bytes" % self.wrapper.javaserver.getmemoryusage())
+                            server_bytes = self.wrapper.serverstats.get().get("server_memory")
+                            if server_bytes:
+                                msg("Server Memory Usage: %d bytes" % server_bytes)
                         elif getargs(message.split(" "), 0) == 'check-update':
                             msg("Checking for new updates...")
                             update = self.wrapper.get_wrapper_update_info()
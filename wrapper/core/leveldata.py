@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import os
+import threading
+
+from core import nbt
+
+# the parts of level.dat's "Data" compound that the summary decodes.
+SUMMARY = {"Data": {"GameRules": None, "SpawnX": None, "SpawnY": None,
+                    "SpawnZ": None, "Time": None, "DayTime": None,
+                    "LevelName": None}}
+
+
+class LevelData(object):
+    """
+    Cache of each world's level.dat.
+
+    level.dat is only re-read when its (mtime, size) changes, so the
+    API's getGameRules(), getSpawnPoint(), getTime()... no longer
+    decompress and parse the whole file on every call.  Two views
+    are cached separately, each decoded the first time it is asked for:
+
+        :summary: a dict of the commonly used "Data" entries (SUMMARY),
+         decoded with the fast nbt.load(select=...).
+        :tree: the full NBTFile "Data" compound (for getLevelInfo).
+
+    mtime has a one second resolution on some file systems, so
+    `refresh()` is also called when the server reports a save.
+    """
+
+    def __init__(self, javaserver):
+        self.vitals = javaserver.vitals
+        self.log = javaserver.log
+        # {path: [(mtime, size), summary or None, tree or None]}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, worldname=None):
+        """forget the cached level.dat of a world (default - all)."""
+        with self._lock:
+            if worldname is None:
+                self._cache = {}
+            else:
+                self._cache.pop(self._path(worldname), None)
+
+    def summary(self, worldname=None):
+        """the SUMMARY entries of level.dat's "Data", as plain
+        python values.  Do not modify the returned dict."""
+        return self._get(worldname, 1)
+
+    def tree(self, worldname=None):
+        """the "Data" TAG_Compound of level.dat.  The same object is
+        returned until level.dat changes, so treat it as read-only."""
+        return self._get(worldname, 2)
+
+    def _get(self, worldname, view):
+        path = self._path(worldname)
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        with self._lock:
+            entry = self._cache.get(path)
+            if not entry or entry[0] != key:
+                entry = [key, None, None]
+                self._cache[path] = entry
+            if entry[view] is None:
+                if view == 1:
+                    entry[1] = nbt.load(path, select=SUMMARY)["Data"]
+                else:
+                    entry[2] = nbt.NBTFile(path, "rb")["Data"]
+            return entry[view]
+
+    def _path(self, worldname):
+        if not worldname:
+            worldname = self.vitals.worldname
+        if not worldname:
+            raise Exception("Server Uninitiated")
+        return os.path.join(self.vitals.serverpath, worldname, "level.dat")
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import os
+import re
+import time
+from collections import deque
+
+from api.base import API
+from utils.log import filehandlers
+from utils.logarchive import ARCHIVER, LineClock, enddate, readindex, searchfile
+
+# rotated server logs: "2017-05-01-2.log.gz" (or "...-2.log" on some forks)
+_SERVER_ROTATED = re.compile(r"^(\d{4})-(\d\d)-(\d\d)-(\d+)\.log(\.gz)?$")
+
+# relative times for parsetime(): "30m", "6h", "2d", "1w"
+_RELATIVE = re.compile(r"^(\d+)([smhdw])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parsetime(text):
+    """
+    Epoch seconds of a time given as "30m", "6h", "2d" (ago) or
+    "2017-05-01", "2017-05-01T14:30" (local time); None if it is
+    none of those.
+    """
+    match = _RELATIVE.match(text)
+    if match:
+        return time.time() - int(match.group(1)) * _UNITS[match.group(2)]
+    for layout in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, layout))
+        except ValueError:
+            continue
+    return None
+
+
+class LogSearch(object):
+    """
+    Searches of the logs by time range and regex, across the live log
+    and its compressed archives, and the archiving of the server's
+    rotated logs.
+
+    Sources are "server" (the server's logs folder) and one per
+    wrapper log file, by name: "wrapper" and "wrapper.errors" with the
+    default logging.json.
+
+    The wrapper's logs are archived as they rotate (utils.log
+    WrapperHandler).  The server rotates its own log when it starts,
+    gzipped but as a single stream; with Misc "archive-server-logs"
+    those files are rewritten (in the background) as indexed archives
+    once the server has started, so searches can skip to the times
+    they want.  They stay valid .gz files.
+    """
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.config = wrapper.config
+        self.log = wrapper.log
+        self.api = API(wrapper, "LogSearch", internal=True)
+
+        self.api.registerEvent("server.started", self.archiveserverlogs)
+
+    def sources(self):
+        """ the names search() takes. """
+        return ["server"] + [self._handlername(handler) for handler in filehandlers()]
+
+    def search(self, source, pattern=None, since=None, until=None, count=50, skip=0):
+        """
+        The newest `count` matching lines of a source.
+
+        :Args:
+            :source: one of sources().
+            :pattern: regex (string or compiled); None or "" for every
+             line.
+            :since, until: epoch seconds bounds, or None.
+            :count: most lines returned.
+            :skip: how many of the newest matching lines stamped exactly
+             `until` to leave out (the ones an earlier page returned).
+
+        :returns: {"results": [[time, line], ...] oldest first, "next":
+         the time to pass as `until` for the next (older) page, or None
+         if there are no more, "skip": the `skip` to pass with it} - or
+         None for an unknown source.  Raises re.error for a bad pattern.
+
+        """
+        files = self._files(source)
+        if files is None:
+            return None
+        if pattern and not hasattr(pattern, "search"):
+            pattern = re.compile(pattern)
+        if until is None:
+            skip = 0
+        results = []
+        more = False
+        # stamps only have one second resolution, so a page can end
+        #  part way through a second; its lines are skipped by count.
+        toskip = skip
+        # newest file first, so older archives are only read while
+        #  more lines are wanted
+        for position in range(len(files) - 1, -1, -1):
+            path, clock = files[position]
+            if self._outside(path, since, until):
+                continue
+            wanted = count - len(results)
+            matches = deque(searchfile(path, clock, pattern or None, since, until),
+                            maxlen=wanted + toskip + 1)
+            while toskip and matches and matches[-1][0] == until:
+                matches.pop()
+                toskip -= 1
+            while len(matches) > wanted:
+                matches.popleft()
+                more = True
+            results = [[stamp, line] for stamp, line in matches] + results
+            if len(results) >= count:
+                # older files may hold more
+                more = more or position > 0
+                break
+        if not (more and results) or results[0][0] is None:
+            return {"results": results, "next": None, "skip": 0}
+        oldest = results[0][0]
+        # the lines of the oldest second this page (and, if it is still
+        #  `until`, the earlier pages) returned
+        nextskip = sum(1 for stamp, line in results if stamp == oldest)
+        if oldest == until:
+            nextskip += skip
+        return {"results": results, "next": oldest, "skip": nextskip}
+
+    def archiveserverlogs(self, payload=None):
+        """ Queue the server's rotated logs that have no index yet. """
+        if not self.config["Misc"]["archive-server-logs"]:
+            return
+        for path, clock in self._serverfiles():
+            if os.path.basename(path) == "latest.log" or readindex(path) is not None:
+                continue
+            target = path if path.endswith(".gz") else path + ".gz"
+            ARCHIVER.archive(path, target, clock)
+
+    def _files(self, source):
+        """ [(path, LineClock), ...] of a source, oldest first; the
+        last is the live log. """
+        if source == "server":
+            return self._serverfiles()
+        for handler in filehandlers():
+            if self._handlername(handler) == source:
+                files = [(path, LineClock()) for path in handler.archives()]
+                if os.path.exists(handler.baseFilename):
+                    files.append((handler.baseFilename, LineClock()))
+                return files
+        return None
+
+    def _serverfiles(self):
+        folder = os.path.join(self.wrapper.servervitals.serverpath, "logs")
+        if not os.path.isdir(folder):
+            return []
+        rotated = []
+        for name in os.listdir(folder):
+            match = _SERVER_ROTATED.match(name)
+            if not match:
+                continue
+            if not match.group(5) and os.path.exists(os.path.join(folder, name + ".gz")):
+                # being archived
+                continue
+            rotated.append((tuple(int(part) for part in match.groups()[:4]), name))
+        files = []
+        for key, name in sorted(rotated):
+            path = os.path.join(folder, name)
+            files.append((path, LineClock(enddate(path))))
+        latest = os.path.join(folder, "latest.log")
+        if os.path.exists(latest):
+            files.append((latest, LineClock(enddate(latest))))
+        return files
+
+    @staticmethod
+    def _outside(path, since, until):
+        """ True if a file certainly holds nothing in [since, until]. """
+        if since is not None and os.path.getmtime(path) < since:
+            # last written before the range
+            return True
+        index = readindex(path)
+        if index and until is not None:
+            firsts = [block[0] for block in index if block[0] >= 0]
+            return bool(firsts) and firsts[0] > until
+        return False
+
+    @staticmethod
+    def _handlername(handler):
+        return os.path.splitext(os.path.basename(handler.baseFilename))[0]
@@ -14,6 +14,10 @@ from api.helpers import getjsonfile, getfileaslines, config_to_dict_read
 from api.base import API
 from api.world import World
 from api.player import Player
+from core.worldsize import WorldSize
+from core.leveldata import LevelData
+from core.resources import ResourceSampler
+from utils.metrics import REGISTRY
 
 import time
 import threading
@@ -36,6 +40,10 @@ STARTED = 2
 STOPPING = 3
 FROZEN = 4
 
+# the rate of it is the console lines per second
+_CONSOLE_LINES = REGISTRY.counter(
+    "wrapper_console_lines_total", "Lines the server wrote to its console.")
+
 
 # noinspection PyBroadException,PyUnusedLocal
 class MCServer(object):
@@ -77,7 +85,6 @@ class MCServer(object):
         # whether a stopped server tries rebooting
         self.server_autorestart = self.config["General"]["auto-restart"]
         self.proc = None
-        self.lastsizepoll = 0
         self.console_output_data = []
 
         self.server_muted = False
@@ -93,8 +100,13 @@ class MCServer(object):
                 " running. To start the server, run /start.")
 
         # Server Information
-        self.worldSize = 0
         self.world = None
+        # background world disk usage counter (see the worldSize property)
+        self.diskusage = WorldSize(self)
+        # cached level.dat (see api.minecraft getLevelInfo, getTime...)
+        self.leveldata = LevelData(self)
+        # memory/CPU/thread/file/IO history of the server process
+        self.resources = ResourceSampler(self)
 
         # get OPs
         self.refresh_ops()
@@ -113,11 +125,6 @@ class MCServer(object):
             rb.daemon = True
             rb.start()
 
-        if self.config["Web"]["web-enabled"]:
-            wb = threading.Thread(target=self.eachsecond_web, args=())
-            wb.daemon = True
-            wb.start()
-
         # This event is used to allow proxy to make console commands via
         # callevent() without referencing mcserver.py code (the eventhandler
         # is passed as an argument to the proxy).
@@ -378,6 +385,7 @@ class MCServer(object):
 
         if username not in self.vitals.players:
             self.vitals.players[username] = Player(username, self.wrapper)
+            self.vitals.players[username]._record_login()
         # store EID if proxy is not fully connected yet (or is not enabled).
         self.vitals.players[username].playereid = servereid
         self.vitals.players[username].loginposition = position
@@ -390,6 +398,8 @@ class MCServer(object):
                 playerclient.server_eid = servereid
                 playerclient.position = position
 
+        self.wrapper.sessions.login(self.vitals.players[username])
+
         self.wrapper.events.callevent(
             "player.login",
             {"player": self.getplayer(username)})
@@ -420,7 +430,8 @@ class MCServer(object):
             "player.logout", {"player": self.getplayer(players_name)})
 
         if players_name in self.vitals.players:
-            self.vitals.players[players_name].abort = True
+            self.wrapper.sessions.logout(self.vitals.players[players_name])
+            self.vitals.players[players_name]._close_data()
             del self.vitals.players[players_name]
 
     def getplayer(self, username):
@@ -610,13 +621,17 @@ class MCServer(object):
         self.vitals.operator_list = self.read_ops_file(read_super_ops)
 
     def getmemoryusage(self):
-        """Returns allocated memory in bytes. This command
+        """Returns allocated memory in bytes (from the resource
+        sampler's latest sample, if it is recent). This command
         currently only works for *NIX based systems.
         """
         if not resource or not os.name == "posix" or self.proc is None:
             raise OSError(
                 "Your current OS (%s) does not support"
                 " this command at this time." % os.name)
+        latest = self.resources.latest()
+        if latest and time.time() - latest["time"] <= 2 * self.resources.interval:
+            return int(latest["rss"])
         try:
             with open("/proc/%d/statm" % self.proc.pid) as f:
                 getbytes = int(f.read().split(" ")[1]) * resource.getpagesize()
@@ -662,6 +677,7 @@ class MCServer(object):
         """Internally-used function that parses a particular
         console line.
         """
+        _CONSOLE_LINES.inc()
         if not self.wrapper.events.callevent(
                 "server.consoleMessage", {"message": buff}):
             return False
@@ -765,6 +781,13 @@ class MCServer(object):
             else:
                 self.queued_lines.append(buff)
 
+        # level.dat was just rewritten (save-all, backups, autosave).  Not
+        #  part of the elif chain below, so a chat line quoting it still
+        #  fires player.message.
+        if ("Saved the game" in buff or "Saved the world" in buff) and \
+                getargs(line_words, 0)[:1] != "<":
+            self.leveldata.refresh()
+
         # be careful about how these elif's are handled!
         # confirm server start
         if "Done (" in buff:
@@ -777,7 +800,10 @@ class MCServer(object):
         # Getting world name
         elif "Preparing level" in buff:
             self.vitals.worldname = getargs(line_words, 2).replace('"', "")
+            if self.world:
+                self.world.regions.close()
             self.world = World(self.vitals.worldname, self)
+            self.leveldata.refresh()
 
         # Player Message
         elif getargs(line_words, 0)[0] == "<":
@@ -880,10 +906,15 @@ class MCServer(object):
         # server lagged
         elif "Can't keep up!" in buff:
             skipping_ticks = getargs(line_words, 17)
+            self.wrapper.tickmonitor.consoleline(buff)
             self.wrapper.events.callevent("server.lagged", {
                 "ticks": get_int(skipping_ticks)
             })
 
+        # tick rate probe results (see core/tickmonitor.py)
+        elif "ticks per second" in buff or "Mean TPS" in buff or "TPS from last" in buff:
+            self.wrapper.tickmonitor.consoleline(buff)
+
         # player teleport
         elif getargs(line_words, 0) == "Teleported" and getargs(line_words, 2) == "to":
             playername = getargs(line_words, 1)
@@ -912,6 +943,11 @@ class MCServer(object):
                 <payload>
     
             """
+
+        # JVM garbage collection log (-verbose:gc or -Xlog:gc)
+        elif "GC" in buff:
+            self.resources.gcline(buff)
+
     # mcserver.py onsecond Event Handlers
     def reboot_timer(self):
         rb_mins = self.reboot_minutes
@@ -934,17 +970,10 @@ class MCServer(object):
                     continue
                 self.restart(self.reboot_message)
 
-    def eachsecond_web(self):
-        if time.time() - self.lastsizepoll > 120:
-            if self.vitals.worldname is None:
-                return True
-            self.lastsizepoll = time.time()
-            size = 0
-            # os.scandir not in standard library on early py2.7.x systems
-            for i in os.walk("%s/%s" % (self.vitals.serverpath, self.vitals.worldname)):
-                for f in os.listdir(i[0]):
-                    size += os.path.getsize(os.path.join(i[0], f))
-            self.worldSize = size
+    @property
+    def worldSize(self):
+        """bytes used by the world folder, as of the last count."""
+        return self.diskusage.total
 
     def _console_event(self, payload):
         """This function is used in conjunction with event handlers to
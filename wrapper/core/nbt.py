@@ -22,11 +22,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from collections import MutableMapping, MutableSequence, Sequence
+try:
+    from collections.abc import Mapping, MutableMapping, MutableSequence, Sequence
+except ImportError:
+    from collections import Mapping, MutableMapping, MutableSequence, Sequence
 from struct import Struct, error as StructError
 from gzip import GzipFile
 
 import sys
+import zlib
 
 PY3 = sys.version_info > (3,)
 if PY3:
@@ -47,6 +51,7 @@ TAG_STRING = 8
 TAG_LIST = 9
 TAG_COMPOUND = 10
 TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
 
 
 class TAG(object):
@@ -283,6 +288,22 @@ class TAG_Int_Array(TAG, MutableSequence):
         return "[%i int(s)]" % len(self.value)
 
 
+class TAG_Long_Array(TAG_Int_Array):
+    """
+    TAG_Long_Array, comparable to a collections.UserList with
+    an intrinsic name whose values must be longs (1.12+)
+    """
+    tid = TAG_LONG_ARRAY
+
+    def update_fmt(self, length):
+        """ Adjust struct format description to length given """
+        self.fmt = Struct(">" + str(length) + "q")
+
+    # Printing and Formatting of tree
+    def valuestr(self):
+        return "[%i long(s)]" % len(self.value)
+
+
 class TAG_String(TAG, Sequence):
     """
     TAG_String, comparable to a collections.UserString with an
@@ -420,10 +441,17 @@ class TAG_Compound(TAG, MutableMapping):
     def __init__(self, buffer=None):
         super(TAG_Compound, self).__init__()
         self.tags = []
+        # {name: tag} - first tag of each name, for O(1) lookups
+        self._index = {}
         self.name = ""
         if buffer:
             self._parse_buffer(buffer)
 
+    def _reindex(self):
+        self._index = {}
+        for tag in self.tags:
+            self._index.setdefault(tag.name, tag)
+
     # Parsers and Generators
     def _parse_buffer(self, buffer):
         while True:
@@ -437,6 +465,7 @@ class TAG_Compound(TAG, MutableMapping):
                     tag = TAGLIST[ttype.value](buffer=buffer)
                     tag.name = name
                     self.tags.append(tag)
+                    self._index.setdefault(name, tag)
                 except KeyError:
                     raise ValueError("Unrecognised tag type")
 
@@ -459,10 +488,7 @@ class TAG_Compound(TAG, MutableMapping):
         if isinstance(key, int):
             return key <= len(self.tags)
         elif isinstance(key, basestring):
-            for tag in self.tags:
-                if tag.name == key:
-                    return True
-            return False
+            return key in self._index
         elif isinstance(key, TAG):
             return key in self.tags
         return False
@@ -471,10 +497,9 @@ class TAG_Compound(TAG, MutableMapping):
         if isinstance(key, int):
             return self.tags[key]
         elif isinstance(key, basestring):
-            for tag in self.tags:
-                if tag.name == key:
-                    return tag
-            else:
+            try:
+                return self._index[key]
+            except KeyError:
                 raise KeyError("Tag %s does not exist" % key)
         else:
             raise TypeError(
@@ -485,13 +510,18 @@ class TAG_Compound(TAG, MutableMapping):
         if isinstance(key, int):
             # Just try it. The proper error will be raised if it doesn't work.
             self.tags[key] = value
+            self._reindex()
         elif isinstance(key, basestring):
             value.name = key
-            for i, tag in enumerate(self.tags):
-                if tag.name == key:
-                    self.tags[i] = value
-                    return
-            self.tags.append(value)
+            if key in self._index:
+                old = self._index[key]
+                for i, tag in enumerate(self.tags):
+                    if tag is old:
+                        self.tags[i] = value
+                        break
+            else:
+                self.tags.append(value)
+            self._index[key] = value
 
     def __delitem__(self, key):
         if isinstance(key, int):
@@ -501,6 +531,7 @@ class TAG_Compound(TAG, MutableMapping):
         else:
             raise ValueError(
                 "key needs to be either name of tag, or index of tag")
+        self._reindex()
 
     def keys(self):
         return [tag.name for tag in self.tags]
@@ -531,7 +562,7 @@ class TAG_Compound(TAG, MutableMapping):
 TAGLIST = {TAG_END: _TAG_End, TAG_BYTE: TAG_Byte, TAG_SHORT: TAG_Short, TAG_INT: TAG_Int, TAG_LONG: TAG_Long,
            TAG_FLOAT: TAG_Float, TAG_DOUBLE: TAG_Double,
            TAG_BYTE_ARRAY: TAG_Byte_Array, TAG_STRING: TAG_String, TAG_LIST: TAG_List, TAG_COMPOUND: TAG_Compound,
-           TAG_INT_ARRAY: TAG_Int_Array}
+           TAG_INT_ARRAY: TAG_Int_Array, TAG_LONG_ARRAY: TAG_Long_Array}
 
 
 class NBTFile(TAG_Compound):
@@ -643,3 +674,241 @@ class NBTFile(TAG_Compound):
         else:
             return "<%s with %s(%r) at 0x%x>" % \
                 (self.__class__.__name__, TAG_Compound.__name__, self.name, id(self))
+
+
+# == Fast decoder ==
+#
+# The TAG classes above build a full object tree and read the data a
+# few bytes at a time.  The functions below decode straight from a
+# bytes/memoryview with precompiled structs into plain python values:
+#
+#   TAG_Compound -> dict, TAG_List -> list, TAG_Byte_Array -> bytearray,
+#   TAG_Int_Array/TAG_Long_Array -> list, TAG_String -> unicode,
+#   numbers -> int/float.
+#
+# `select` limits decoding to the parts of the tree asked for; anything
+# else is skipped over without being decoded.  It is a nested dict of
+# compound names, where None means "the whole subtree":
+#
+#   load("world/level.dat", select={"Data": {"GameRules": None,
+#                                            "SpawnX": None}})
+#
+# `lazy=True` returns LazyCompound views instead, which only decode a
+# value when it is looked up.
+
+_UBYTE = Struct(">B")
+_USHORT = Struct(">H")
+_INT = Struct(">i")
+
+_NUMERIC = {
+    TAG_BYTE: Struct(">b"),
+    TAG_SHORT: Struct(">h"),
+    TAG_INT: Struct(">i"),
+    TAG_LONG: Struct(">q"),
+    TAG_FLOAT: Struct(">f"),
+    TAG_DOUBLE: Struct(">d"),
+}
+
+# struct format character and size of the numeric and array items
+_ITEMCODES = {TAG_BYTE: ("b", 1), TAG_SHORT: ("h", 2), TAG_INT: ("i", 4),
+              TAG_LONG: ("q", 8), TAG_FLOAT: ("f", 4), TAG_DOUBLE: ("d", 8)}
+_ARRAYITEMS = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+
+# Struct(">%d<code>") objects for bulk unpacking, by (code, count)
+_bulkstructs = {}
+
+
+def _bulkstruct(code, count):
+    key = (code, count)
+    if key not in _bulkstructs:
+        if len(_bulkstructs) > 256:
+            _bulkstructs.clear()
+        _bulkstructs[key] = Struct(">%d%s" % (count, code))
+    return _bulkstructs[key]
+
+
+def _readstring(buf, offset):
+    length = _USHORT.unpack_from(buf, offset)[0]
+    offset += 2
+    end = offset + length
+    if end > len(buf):
+        raise StructError("string runs past the end of the data")
+    return bytes(buf[offset:end]).decode("utf-8"), end
+
+
+def _decode(tagtype, buf, offset, select=None, lazy=False):
+    """Decode one tag payload; returns (value, offset after it)."""
+    if tagtype in _NUMERIC:
+        fmt = _NUMERIC[tagtype]
+        return fmt.unpack_from(buf, offset)[0], offset + fmt.size
+    if tagtype == TAG_STRING:
+        return _readstring(buf, offset)
+    if tagtype == TAG_COMPOUND:
+        if lazy:
+            view = LazyCompound(buf, offset)
+            return view, view.end
+        return _decodecompound(buf, offset, select)
+    if tagtype == TAG_LIST:
+        itemtype = _UBYTE.unpack_from(buf, offset)[0]
+        count = _INT.unpack_from(buf, offset + 1)[0]
+        offset += 5
+        if count <= 0:
+            return [], offset
+        if itemtype in _ITEMCODES:
+            code, size = _ITEMCODES[itemtype]
+            fmt = _bulkstruct(code, count)
+            return list(fmt.unpack_from(buf, offset)), offset + count * size
+        items = []
+        for _ in xrange(count):
+            value, offset = _decode(itemtype, buf, offset, select, lazy)
+            items.append(value)
+        return items, offset
+    if tagtype in _ARRAYITEMS:
+        count = _INT.unpack_from(buf, offset)[0]
+        offset += 4
+        end = offset + count * _ARRAYITEMS[tagtype]
+        if end > len(buf):
+            raise StructError("array runs past the end of the data")
+        if tagtype == TAG_BYTE_ARRAY:
+            return bytearray(buf[offset:end]), end
+        code = "i" if tagtype == TAG_INT_ARRAY else "q"
+        return list(_bulkstruct(code, count).unpack_from(buf, offset)), end
+    raise ValueError("Unrecognised tag type %s" % tagtype)
+
+
+def _decodecompound(buf, offset, select=None):
+    result = {}
+    while True:
+        tagtype = _UBYTE.unpack_from(buf, offset)[0]
+        offset += 1
+        if tagtype == TAG_END:
+            return result, offset
+        name, offset = _readstring(buf, offset)
+        if select is None:
+            result[name], offset = _decode(tagtype, buf, offset)
+        elif name in select:
+            result[name], offset = _decode(tagtype, buf, offset, select[name])
+        else:
+            offset = _skip(tagtype, buf, offset)
+
+
+def _skip(tagtype, buf, offset):
+    """Offset just past a tag payload, without decoding it."""
+    if tagtype in _ITEMCODES:
+        return offset + _ITEMCODES[tagtype][1]
+    if tagtype == TAG_STRING:
+        return offset + 2 + _USHORT.unpack_from(buf, offset)[0]
+    if tagtype in _ARRAYITEMS:
+        return offset + 4 + _INT.unpack_from(buf, offset)[0] * _ARRAYITEMS[tagtype]
+    if tagtype == TAG_LIST:
+        itemtype = _UBYTE.unpack_from(buf, offset)[0]
+        count = _INT.unpack_from(buf, offset + 1)[0]
+        offset += 5
+        if itemtype in _ITEMCODES:
+            return offset + max(count, 0) * _ITEMCODES[itemtype][1]
+        for _ in xrange(count):
+            offset = _skip(itemtype, buf, offset)
+        return offset
+    if tagtype == TAG_COMPOUND:
+        while True:
+            itemtype = _UBYTE.unpack_from(buf, offset)[0]
+            offset += 1
+            if itemtype == TAG_END:
+                return offset
+            offset += 2 + _USHORT.unpack_from(buf, offset)[0]
+            offset = _skip(itemtype, buf, offset)
+    raise ValueError("Unrecognised tag type %s" % tagtype)
+
+
+class LazyCompound(Mapping):
+    """
+    Read-only dict-like view of a TAG_Compound in an NBT buffer.  The
+    names (and offsets) of the entries are indexed when the view is
+    made; values are only decoded when first looked up.  Compounds
+    inside are LazyCompounds too.
+    """
+
+    def __init__(self, buf, offset):
+        self._buf = buf
+        # {name: (tag type, offset of the value)}
+        self._entries = {}
+        self._values = {}
+        while True:
+            tagtype = _UBYTE.unpack_from(buf, offset)[0]
+            offset += 1
+            if tagtype == TAG_END:
+                break
+            name, offset = _readstring(buf, offset)
+            self._entries[name] = (tagtype, offset)
+            offset = _skip(tagtype, buf, offset)
+        self.end = offset
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            tagtype, offset = self._entries[name]
+            self._values[name] = _decode(tagtype, self._buf, offset, lazy=True)[0]
+        return self._values[name]
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def tagtype(self, name):
+        """The TAG_ type number of an entry."""
+        return self._entries[name][0]
+
+    def todict(self):
+        """Fully decode into plain dicts and lists."""
+        result = {}
+        for name, (tagtype, offset) in self._entries.items():
+            result[name] = _decode(tagtype, self._buf, offset)[0]
+        return result
+
+
+def loads(data, select=None, lazy=False):
+    """
+    Decode NBT data (already decompressed) from bytes, bytearray or
+    memoryview.
+
+    :Args:
+        :data: the NBT data, starting with the root TAG_Compound.
+        :select: optional nested dict of the compound entries wanted;
+         see the notes above.  Ignored when lazy.
+        :lazy: return a LazyCompound instead of a dict.
+
+    :returns: the root compound (dict or LazyCompound).
+
+    """
+    if isinstance(data, memoryview) and not PY3:
+        data = data.tobytes()
+    try:
+        if _UBYTE.unpack_from(data, 0)[0] != TAG_COMPOUND:
+            raise ValueError("First record is not a Compound Tag")
+        name, offset = _readstring(data, 1)
+        if lazy:
+            return LazyCompound(data, offset)
+        return _decodecompound(data, offset, select)[0]
+    except StructError:
+        raise ValueError("Partial File Parse: file possibly truncated.")
+
+
+def decompress(data):
+    """Undo gzip or zlib compression (as found in .dat files and
+    region chunks).  Uncompressed data is returned as is."""
+    if data[:2] == b"\x1f\x8b":
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    if data[:1] == b"\x78":
+        return zlib.decompress(data)
+    return data
+
+
+def load(filename, select=None, lazy=False):
+    """Read and decode an NBT file (gzipped or not).  See loads()."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    return loads(decompress(data), select, lazy)
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import mmap
+import os
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from struct import Struct
+
+from core import nbt
+from core.worldsize import DIMENSIONS
+
+# Py3-2
+try:
+    xrange
+except NameError:
+    # noinspection PyShadowingBuiltins
+    xrange = range
+
+SECTOR = 4096
+
+# decoded chunks kept by a RegionReader (a chunk is ~130 KiB decoded)
+CHUNK_CACHE_SIZE = 256
+
+# region files kept open (mapped) by a RegionReader
+REGION_CACHE_SIZE = 32
+
+# first DataVersion (20w17a/1.16) whose BlockStates entries do not
+# span two longs.
+NONSPANNING_VERSION = 2529
+
+# compression types of a chunk's data
+GZIP, ZLIB, UNCOMPRESSED = 1, 2, 3
+# flag added to the type when the chunk is stored in a c.x.z.mcc file
+EXTERNAL = 128
+
+# {dimension name: world sub folder}
+DIMENSION_FOLDERS = {"overworld": ""}
+for _folder, _name in DIMENSIONS.items():
+    DIMENSION_FOLDERS[_name] = _folder
+
+_HEADER = Struct(">1024I")
+_CHUNKHEADER = Struct(">IB")
+
+# the parts of a chunk's nbt decodesections() needs (nbt.load select=)
+SECTION_SELECT = {"Y": None, "Blocks": None, "Add": None, "Data": None,
+                  "Palette": None, "BlockStates": None, "block_states": None}
+CHUNK_SELECT = {"DataVersion": None, "Level": {"Sections": SECTION_SELECT},
+                "sections": SECTION_SELECT}
+
+
+class RegionFile(object):
+    """
+    Read-only view of one Anvil (.mca) region file.
+
+    The file is memory-mapped; the location table (the first 4 KiB)
+    says which sectors hold each of the region's 32 x 32 chunks.
+    Chunks are only read and decompressed when asked for.  Minecraft
+    rewrites region files in place, so the mapping sees its changes;
+    `stale()` reports when the file has grown past the mapping.
+
+    :Args:
+        :path: the r.<x>.<z>.mca file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        # when stale() last checked the file
+        self.checked = time.time()
+        self._file = open(path, "rb")
+        self._map = None
+        size = os.fstat(self._file.fileno()).st_size
+        # a region file that has no chunks yet may be empty
+        if size >= 2 * SECTOR:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = size
+
+    def close(self):
+        if self._map:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def stale(self):
+        """True if the file grew (or shrank) since it was mapped."""
+        self.checked = time.time()
+        try:
+            return os.path.getsize(self.path) != self.size
+        except OSError:
+            return True
+
+    def location(self, localx, localz):
+        """(first sector, sector count) of a chunk; (0, 0) if the
+        chunk has not been generated."""
+        if not self._map:
+            return 0, 0
+        entry = _HEADER.unpack_from(self._map, 0)[localx + localz * 32]
+        return entry >> 8, entry & 0xff
+
+    def mapped(self, localx, localz):
+        """False if the chunk's sectors lie past the mapping."""
+        sector, count = self.location(localx, localz)
+        return (sector + count) * SECTOR <= self.size
+
+    def timestamp(self, localx, localz):
+        """when the chunk was last saved (0 - not generated)."""
+        if not self._map:
+            return 0
+        return _HEADER.unpack_from(self._map, SECTOR)[localx + localz * 32]
+
+    def chunks(self):
+        """[(localx, localz), ...] of the generated chunks."""
+        if not self._map:
+            return []
+        table = _HEADER.unpack_from(self._map, 0)
+        return [(index % 32, index // 32) for index in xrange(1024) if table[index]]
+
+    def readchunk(self, localx, localz):
+        """the chunk's decompressed nbt data, or None if the chunk
+        has not been generated (or its sectors lie past the mapping)."""
+        sector, count = self.location(localx, localz)
+        start = sector * SECTOR
+        if not sector or start + 5 > self.size:
+            return None
+        length, compression = _CHUNKHEADER.unpack_from(self._map, start)
+        if compression & EXTERNAL:
+            regionx, regionz = regioncoords(self.path)
+            external = os.path.join(os.path.dirname(self.path), "c.%d.%d.mcc" % (
+                regionx * 32 + localx, regionz * 32 + localz))
+            with open(external, "rb") as f:
+                data = f.read()
+        else:
+            if start + 4 + length > self.size:
+                return None
+            data = self._map[start + 5:start + 4 + length]
+        compression &= ~EXTERNAL
+        if compression == GZIP:
+            return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        if compression == ZLIB:
+            return zlib.decompress(data)
+        if compression == UNCOMPRESSED:
+            return data
+        raise ValueError("Unknown chunk compression type %d in %s" % (compression, self.path))
+
+
+def readsections(data):
+    """decodesections() of a chunk's raw nbt data."""
+    return decodesections(nbt.loads(data, select=CHUNK_SELECT))
+
+
+def decodesections(root):
+    """
+    Decode the blocks of a chunk's (decoded) nbt, which must include
+    the CHUNK_SELECT entries.
+
+    Every format is reduced to the same form - for each 16 block high
+    section, a palette of block states and an array('H') of 4096
+    palette indexes (ordered y, z, x):
+
+        {section y: (palette, indexes), ...}
+
+    Palette entries are {"Name": "minecraft:stone", "Properties": {...}}
+    for 1.13+ worlds and {"id": 1, "data": 0} for older ones.
+    """
+    dataversion = root.get("DataVersion", 0)
+    if "sections" in root:
+        sections = root["sections"]
+    else:
+        sections = root.get("Level", {}).get("Sections", [])
+    result = {}
+    for section in sections:
+        y = section.get("Y", 0)
+        if "Blocks" in section:
+            result[y] = _legacysection(section)
+            continue
+        if "block_states" in section:
+            states = section["block_states"]
+            palette, longs = states.get("palette", []), states.get("data", [])
+        else:
+            palette, longs = section.get("Palette", []), section.get("BlockStates", [])
+        if not palette:
+            # 1.18+ empty sections above/below the terrain
+            continue
+        if not longs:
+            result[y] = (palette, array("H", [0]) * 4096)
+            continue
+        bits = max(4, (len(palette) - 1).bit_length())
+        result[y] = (palette, _unpack(longs, bits, dataversion < NONSPANNING_VERSION))
+    return result
+
+
+def _legacysection(section):
+    blocks = section["Blocks"]
+    add = section.get("Add")
+    data = section.get("Data")
+    palette = []
+    seen = {}
+    indexes = array("H", [0]) * 4096
+    for i in xrange(4096):
+        blockid = blocks[i]
+        if add:
+            blockid += ((add[i >> 1] >> ((i & 1) * 4)) & 0xf) << 8
+        damage = (data[i >> 1] >> ((i & 1) * 4)) & 0xf if data else 0
+        key = (blockid << 4) | damage
+        if key not in seen:
+            seen[key] = len(palette)
+            palette.append({"id": blockid, "data": damage})
+        indexes[i] = seen[key]
+    return palette, indexes
+
+
+def _unpack(longs, bits, spanning):
+    """unpack 4096 `bits` wide values from a (signed) long array."""
+    mask = (1 << bits) - 1
+    values = [value & 0xffffffffffffffff for value in longs]
+    indexes = array("H", [0]) * 4096
+    if spanning:
+        # 1.13-1.15: values are packed end to end across longs
+        last = len(values) - 1
+        for i in xrange(4096):
+            bit = i * bits
+            index, offset = bit >> 6, bit & 63
+            value = values[index] >> offset
+            if offset + bits > 64 and index < last:
+                value |= values[index + 1] << (64 - offset)
+            indexes[i] = value & mask
+    else:
+        perlong = 64 // bits
+        for i in xrange(min(4096, len(values) * perlong)):
+            indexes[i] = (values[i // perlong] >> ((i % perlong) * bits)) & mask
+    return indexes
+
+
+def regioncoords(path):
+    """(x, z) of an r.<x>.<z>.mca file name."""
+    parts = os.path.basename(path).split(".")
+    return int(parts[1]), int(parts[2])
+
+
+class RegionReader(object):
+    """
+    Chunk lookups for one world, served from an LRU cache of decoded
+    chunks (see readsections) over memory-mapped region files.
+
+    A cached chunk is re-read once its save timestamp in the region
+    file changes, so lookups reflect the world as of the server's
+    last save.
+
+    :Args:
+        :worldpath: the world folder.
+        :cachesize: decoded chunks to keep.
+
+    """
+
+    def __init__(self, worldpath, cachesize=CHUNK_CACHE_SIZE):
+        self.worldpath = worldpath
+        self.cachesize = cachesize
+        # {(dimension, chunkx, chunkz): ((timestamp, location), sections)}
+        self._chunks = OrderedDict()
+        # {(dimension, regionx, regionz): RegionFile}
+        self._regions = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock:
+            for region in self._regions.values():
+                region.close()
+            self._regions.clear()
+            self._chunks.clear()
+
+    def getsections(self, chunkx, chunkz, dimension="overworld"):
+        """the chunk's readsections() result, or None if the chunk
+        has not been generated (saved) yet."""
+        key = (dimension, chunkx, chunkz)
+        localx, localz = chunkx & 31, chunkz & 31
+        with self._lock:
+            region = self._getregion(dimension, chunkx >> 5, chunkz >> 5)
+            if region is not None and not region.mapped(localx, localz):
+                # the chunk was (re)written past the end of the mapping
+                region = self._getregion(dimension, chunkx >> 5, chunkz >> 5, True)
+            if region is None:
+                return None
+            # a rewritten chunk gets a new timestamp, and usually new sectors
+            stamp = (region.timestamp(localx, localz), region.location(localx, localz))
+            cached = self._chunks.pop(key, None)
+            if cached and cached[0] == stamp:
+                self.hits += 1
+                self._chunks[key] = cached
+                return cached[1]
+            self.misses += 1
+            try:
+                data = region.readchunk(localx, localz)
+            except (zlib.error, IOError, OSError, ValueError):
+                # caught the server mid-write; try again next lookup.
+                data = None
+            if data is None:
+                return None
+            sections = readsections(data)
+            self._chunks[key] = (stamp, sections)
+            while len(self._chunks) > self.cachesize:
+                self._chunks.popitem(last=False)
+            return sections
+
+    def regionpath(self, dimension, regionx, regionz):
+        return os.path.join(self.worldpath, DIMENSION_FOLDERS[dimension], "region",
+                            "r.%d.%d.mca" % (regionx, regionz))
+
+    def _getregion(self, dimension, regionx, regionz, reopen=False):
+        key = (dimension, regionx, regionz)
+        region = self._regions.pop(key, None)
+        if region and (reopen or time.time() - region.checked > 1 and region.stale()):
+            region.close()
+            region = None
+        if region is None:
+            path = self.regionpath(dimension, regionx, regionz)
+            try:
+                region = RegionFile(path)
+            except (IOError, OSError):
+                return None
+        self._regions[key] = region
+        while len(self._regions) > REGION_CACHE_SIZE:
+            self._regions.popitem(last=False)[1].close()
+        return region
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import os
+import re
+import threading
+import time
+from array import array
+
+# what a sample records, in store order:
+#   rss - resident memory (bytes)
+#   cpu - CPU used since the last sample (percent of one core)
+#   threads - thread count
+#   fds - open file descriptors
+#   read_bytes, write_bytes - storage I/O (bytes per second)
+#   gc_pauses - GC pauses reported on the console (per second)
+#   gc_ms - time spent in those pauses (milliseconds per second)
+FIELDS = ("rss", "cpu", "threads", "fds", "read_bytes", "write_bytes", "gc_pauses", "gc_ms")
+
+# (name, seconds per point, seconds kept).  The first tier holds every
+# sample (one per sample interval, so it keeps 3600 / interval points);
+# the others hold averages.
+TIERS = (("second", 1, 3600), ("minute", 60, 86400), ("hour", 3600, 2592000))
+
+# JDK 9+ unified logging:  [gc] GC(12) Pause Young (Normal) ... 3.456ms
+_UNIFIED_PAUSE = re.compile(r"Pause.*?(\d+(?:\.\d+)?)ms\s*$")
+# JDK 8 -verbose:gc:  [GC (Allocation Failure) ..., 0.0123456 secs]
+_LEGACY_PAUSE = re.compile(r", (\d+\.\d+) secs\]")
+
+
+class Series(object):
+    """
+    A fixed-size circular store of points: one array('d') of times
+    and one per field, so a tier costs 8 bytes a value no matter how
+    long the server runs.
+
+    :Args:
+        :size: points kept; the oldest are overwritten.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.times = array("d", [0.0]) * size
+        self.columns = [array("d", [0.0]) * size for _ in FIELDS]
+        # the slot the next point goes to
+        self.position = 0
+        self.count = 0
+
+    def add(self, stamp, values):
+        slot = self.position
+        self.times[slot] = stamp
+        for column, value in zip(self.columns, values):
+            column[slot] = value
+        self.position = (slot + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def points(self, since=0):
+        """{"time": [...], <field>: [...]} of the points after `since`,
+        oldest first."""
+        first = (self.position - self.count) % self.size
+        slots = [(first + i) % self.size for i in range(self.count)]
+        slots = [slot for slot in slots if self.times[slot] > since]
+        result = {"time": [self.times[slot] for slot in slots]}
+        for name, column in zip(FIELDS, self.columns):
+            result[name] = [column[slot] for slot in slots]
+        return result
+
+    def last(self):
+        """{"time": t, <field>: value} of the newest point, or None."""
+        if not self.count:
+            return None
+        slot = (self.position - 1) % self.size
+        result = {"time": self.times[slot]}
+        for name, column in zip(FIELDS, self.columns):
+            result[name] = column[slot]
+        return result
+
+
+class ResourceSampler(object):
+    """
+    Samples the server process's resource use - memory, CPU, threads,
+    open files and storage I/O from /proc, and GC pauses from the
+    console - every General "resource-sample-interval" seconds.
+
+    Samples are kept in three TIERS of Series: every sample for the
+    last hour, one-minute averages for a day and one-hour averages
+    for a month.  Only Linux has /proc; elsewhere the sampler thread
+    exits and the store stays empty.
+
+    :Args:
+        :javaserver: the MCServer.
+
+    """
+
+    def __init__(self, javaserver):
+        self.javaserver = javaserver
+        self.wrapper = javaserver.wrapper
+        self.log = javaserver.log
+        self.interval = max(1, javaserver.config["General"]["resource-sample-interval"])
+
+        # a point per sample at most, however long the interval
+        self.tiers = dict((name, Series(max(1, int(span // max(seconds, self.interval)))))
+                          for name, seconds, span in TIERS)
+        # {tier name: [bucket, [sums], sample count]} of the averaging tiers
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        # GC pauses seen since the last sample ([count, milliseconds])
+        self._gc = [0, 0.0]
+        # (pid, time, cpu ticks, read bytes, write bytes) of the last sample
+        self._previous = None
+        try:
+            self._ticks = os.sysconf("SC_CLK_TCK")
+            self._pagesize = os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            self._ticks = self._pagesize = 0
+
+        t = threading.Thread(target=self._sampler, name="ResourceSampler", args=())
+        t.daemon = True
+        t.start()
+
+    def latest(self):
+        """the newest sample ({"time": t, "rss": bytes, ...}), or None."""
+        return self.tiers["second"].last()
+
+    def history(self, tier="second", since=0):
+        """{"time": [...], <field>: [...]} of a tier's points after
+        `since`, oldest first."""
+        with self._lock:
+            return self.tiers[tier].points(since)
+
+    def gcline(self, line):
+        """Count a GC pause reported in a console line (needs the
+        server's GC logging on: -verbose:gc or -Xlog:gc)."""
+        match = _UNIFIED_PAUSE.search(line)
+        if match:
+            milliseconds = float(match.group(1))
+        else:
+            pauses = _LEGACY_PAUSE.findall(line)
+            if not pauses:
+                return
+            # the last one is the whole collection's
+            milliseconds = float(pauses[-1]) * 1000
+        # the sampler thread takes and resets these
+        with self._lock:
+            self._gc[0] += 1
+            self._gc[1] += milliseconds
+
+    def _sampler(self):
+        if not self._ticks or not os.path.isdir("/proc/self"):
+            self.log.debug("No /proc; the server's resource use will not be sampled.")
+            return
+        while not self.wrapper.halt.halt:
+            started = time.time()
+            proc = self.javaserver.proc
+            if proc is not None and proc.poll() is None:
+                # noinspection PyBroadException
+                try:
+                    self._sample(proc.pid)
+                except (IOError, OSError):
+                    # the process just ended
+                    self._previous = None
+                except Exception as e:
+                    self.log.debug("Resource sample failed: %s", e)
+            else:
+                self._previous = None
+            time.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def _sample(self, pid):
+        now = time.time()
+        with open("/proc/%d/stat" % pid) as f:
+            # the command name (field 2) may hold spaces; skip past it
+            stat = f.read()
+        fields = stat[stat.rindex(")") + 2:].split()
+        # fields[0] is field 3 (state) of proc(5)
+        cputicks = int(fields[11]) + int(fields[12])
+        threads = int(fields[17])
+        rss = int(fields[21]) * self._pagesize
+        fds = len(os.listdir("/proc/%d/fd" % pid))
+        readbytes = writebytes = 0
+        try:
+            with open("/proc/%d/io" % pid) as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name == "read_bytes":
+                        readbytes = int(value)
+                    elif name == "write_bytes":
+                        writebytes = int(value)
+        except (IOError, OSError):
+            # not permitted on some kernels
+            pass
+
+        previous = self._previous
+        self._previous = (pid, now, cputicks, readbytes, writebytes)
+        with self._lock:
+            gccount, gcms = self._gc
+            self._gc = [0, 0.0]
+        if not previous or previous[0] != pid:
+            # rates need a previous sample of the same process
+            return
+        elapsed = max(now - previous[1], 0.001)
+        values = (rss,
+                  (cputicks - previous[2]) * 100.0 / self._ticks / elapsed,
+                  threads,
+                  fds,
+                  (readbytes - previous[3]) / elapsed,
+                  (writebytes - previous[4]) / elapsed,
+                  gccount / elapsed,
+                  gcms / elapsed)
+        self._add(now, values)
+
+    def _add(self, stamp, values):
+        with self._lock:
+            self.tiers["second"].add(stamp, values)
+            for name, seconds, span in TIERS[1:]:
+                bucket = int(stamp // seconds)
+                current = self._buckets.get(name)
+                if current and current[0] != bucket:
+                    sums, count = current[1], current[2]
+                    self.tiers[name].add(current[0] * seconds, [total / count for total in sums])
+                    current = None
+                if not current:
+                    current = [bucket, [0.0] * len(FIELDS), 0]
+                    self._buckets[name] = current
+                for index, value in enumerate(values):
+                    current[1][index] += value
+                current[2] += 1
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import json
+import threading
+import time
+
+from api.base import API
+
+# seconds between refreshes when nothing announced a change
+STATS_INTERVAL = 5
+
+
+class ServerStats(object):
+    """
+    One shared snapshot of the server's statistics - players, plugins,
+    memory, disk and world sizes, state - for everything that shows
+    them: the web admin page and public /action/stats, the dashboard,
+    IRC and the `/wrapper` command.
+
+    The snapshot is rebuilt on the timer thread, every STATS_INTERVAL
+    seconds, or on the next second after a player joins or leaves or
+    the server changes state.  Readers never touch /proc, statvfs or
+    the player objects themselves.  Each rebuild serializes the public
+    stats to JSON once, so answering a server list site's poll is a
+    plain string send.
+
+    A snapshot is a new dict each rebuild; readers must not modify it.
+    """
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.config = wrapper.config
+        self.log = wrapper.log
+        self.api = API(wrapper, "ServerStats", internal=True)
+
+        self.snapshot = {}
+        # the public subset ({"playerCount": n, "players": [...]})
+        self.public = {"playerCount": 0, "players": []}
+        # the /action/stats response body
+        self.publicjson = json.dumps({"status": "good", "payload": self.public})
+        self.updated = 0
+        self.dirty = True
+        self._lock = threading.Lock()
+
+        self.api.registerEvent("timer.second", self.tick)
+        for event in ("player.login", "player.logout", "server.state"):
+            self.api.registerEvent(event, self.invalidate)
+
+    def invalidate(self, payload=None):
+        """ Have the snapshot rebuilt on the next timer second. """
+        self.dirty = True
+
+    def tick(self, payload=None):
+        if self.dirty or time.time() - self.updated >= STATS_INTERVAL:
+            self.refresh()
+
+    def get(self):
+        """ The current snapshot ({} before the server is set up). """
+        if not self.updated:
+            self.refresh()
+        return self.snapshot
+
+    def refresh(self):
+        """ Rebuild the snapshot now. """
+        javaserver = self.wrapper.javaserver
+        if not javaserver:
+            return
+        with self._lock:
+            self.dirty = False
+            # noinspection PyBroadException
+            try:
+                snapshot = self._build(javaserver)
+            except Exception as e:
+                self.log.debug("Could not gather server stats: %s", e)
+                return
+            public = {
+                "playerCount": snapshot["playerCount"][0],
+                "players": [{"name": p["name"], "loggedIn": p["loggedIn"], "uuid": p["uuid"]}
+                            for p in snapshot["players"]]
+            }
+            self.publicjson = json.dumps({"status": "good", "payload": public})
+            self.public = public
+            self.snapshot = snapshot
+            self.updated = snapshot["updated"]
+
+    def _build(self, javaserver):
+        vitals = self.wrapper.servervitals
+        players = []
+        for name in list(vitals.players):
+            player = vitals.players.get(name)
+            if player is None:
+                continue
+            players.append({
+                "name": name,
+                "loggedIn": player.loggedIn,
+                "uuid": player.uuid.string,
+                "isOp": player.isOp()
+            })
+        plugins = []
+        for pid in self.wrapper.plugins:
+            plugin = self.wrapper.plugins[pid]
+            if plugin["good"]:
+                plugins.append({
+                    "name": plugin["name"],
+                    "version": plugin["version"],
+                    "description": plugin["description"] or None,
+                    "summary": plugin["summary"],
+                    "author": plugin["author"],
+                    "website": plugin["website"],
+                    "id": pid,
+                    "good": True
+                })
+            else:
+                plugins.append({
+                    "name": plugin["name"],
+                    "good": False
+                })
+        try:
+            memory = javaserver.getmemoryusage()
+        except (OSError, IOError, ValueError):
+            # not posix, or the server is not running
+            memory = 0
+        try:
+            diskavail = javaserver.getstorageavailable(".")
+        except OSError:
+            diskavail = 0
+        return {
+            "playerCount": [len(players), vitals.maxPlayers],
+            "players": players,
+            "plugins": plugins,
+            "server_state": vitals.state,
+            "wrapper_build": self.wrapper.getbuildstring(),
+            "level_name": vitals.worldname,
+            "server_version": vitals.version,
+            "motd": vitals.motd,
+            "server_name": self.config["Web"]["server-name"],
+            "server_memory": memory,
+            "world_size": javaserver.worldSize,
+            "world_dimension_sizes": dict(javaserver.diskusage.dimensions),
+            "disk_avail": diskavail,
+            "resources": javaserver.resources.latest(),
+            "tps": self.wrapper.tickmonitor.current() if self.wrapper.tickmonitor else None,
+            "topPlayers": [],
+            "updated": time.time()
+        }
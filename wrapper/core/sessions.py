@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import os
+import time
+
+from api.base import API
+from core.storage import Storage
+
+# how often (seconds) open sessions are stamped with a 'last seen' time.
+# This only matters for recovering sessions after a crash.
+TICK_INTERVAL = 60
+
+# number of individual session records retained per player.  Totals
+# are kept separately, so trimming old records loses no playtime.
+MAX_SESSIONS = 100
+
+
+class Sessions(object):
+    """Central player session and playtime tracker.
+
+    Replaces the old per-player `_track` threads.  Sessions are opened
+    and closed by mcserver's login()/logout() and a single coarse
+    'timer.second' tick stamps the open sessions so that a crash
+    loses, at most, TICK_INTERVAL seconds of playtime.
+
+    Storage layout (wrapper-data/json/sessions.pkl):
+
+        Data["players"][uuid] = {
+            "name": last known username,
+            "playtime": total closed-session seconds,
+            "logins": number of closed sessions,
+            "sessions": [[login, logout], ...] (newest last)
+            }
+        Data["open"][uuid] = [login, lastseen]
+
+    """
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.log = wrapper.log
+        self.api = API(wrapper, "Sessions", internal=True)
+
+        self.sessions_storage = Storage(
+            "sessions", encoding=wrapper.encoding)
+        self.data = self.sessions_storage.Data
+        if "players" not in self.data:
+            self.data["players"] = {}
+            self._import_legacy_logins()
+        if "open" not in self.data:
+            self.data["open"] = {}
+
+        # anything still open is left over from a crash or kill.
+        self._recover_open_sessions()
+
+        self.lasttick = time.time()
+        self.api.registerEvent("timer.second", self.eachsecond)
+
+    # noinspection PyUnusedLocal
+    def eachsecond(self, payload):
+        now = time.time()
+        if now - self.lasttick < TICK_INTERVAL:
+            return
+        self.lasttick = now
+        for uuid in list(self.data["open"]):
+            self.data["open"][uuid][1] = int(now)
+
+    def login(self, player):
+        """Open a session for a player object."""
+        uuid = self._uuid_of(player)
+        if not uuid:
+            return
+        record = self._getrecord(uuid)
+        record["name"] = player.username
+        # a login without a logout (kicked by a server crash, etc)
+        if uuid in self.data["open"]:
+            self._close(uuid, self.data["open"][uuid][1])
+        self.data["open"][uuid] = [int(player.loggedIn), int(time.time())]
+
+    def logout(self, player):
+        """Close a player's open session."""
+        uuid = self._uuid_of(player)
+        if uuid and uuid in self.data["open"]:
+            self._close(uuid, int(time.time()))
+
+    def close(self):
+        """close all open sessions and save (wrapper shutdown)."""
+        now = int(time.time())
+        for uuid in list(self.data["open"]):
+            self._close(uuid, now)
+        self.sessions_storage.close()
+
+    def getplaytime(self, uuid):
+        """Total seconds played, including any session in progress.
+
+        :param uuid: uuid string of the player.
+        """
+        total = 0
+        if uuid in self.data["players"]:
+            total = self.data["players"][uuid]["playtime"]
+        if uuid in self.data["open"]:
+            total += int(time.time()) - self.data["open"][uuid][0]
+        return total
+
+    def getlogins(self, uuid):
+        """Number of logins, including any session in progress."""
+        count = 0
+        if uuid in self.data["players"]:
+            count = self.data["players"][uuid]["logins"]
+        if uuid in self.data["open"]:
+            count += 1
+        return count
+
+    def getsessions(self, uuid):
+        """list of [login, logout] pairs (oldest first)."""
+        if uuid not in self.data["players"]:
+            return []
+        return list(self.data["players"][uuid]["sessions"])
+
+    def gettopplaytimes(self, count=None):
+        """Returns a sorted list of (seconds, username, logins) tuples,
+        largest playtime first.
+
+        :param count: max number of items returned (None for all).
+        """
+        topplayers = []
+        for uuid in self.data["players"]:
+            topplayers.append((self.getplaytime(uuid),
+                               self.data["players"][uuid]["name"],
+                               self.getlogins(uuid)))
+        topplayers.sort(key=lambda item: item[0], reverse=True)
+        if count is None:
+            return topplayers
+        return topplayers[:count]
+
+    def _close(self, uuid, logout):
+        login = self.data["open"].pop(uuid)[0]
+        logout = max(logout, login)
+        record = self._getrecord(uuid)
+        record["playtime"] += logout - login
+        record["logins"] += 1
+        record["sessions"].append([login, logout])
+        if len(record["sessions"]) > MAX_SESSIONS:
+            del record["sessions"][:-MAX_SESSIONS]
+
+    def _getrecord(self, uuid):
+        if uuid not in self.data["players"]:
+            self.data["players"][uuid] = {
+                "name": None, "playtime": 0, "logins": 0, "sessions": []}
+        return self.data["players"][uuid]
+
+    def _recover_open_sessions(self):
+        for uuid in list(self.data["open"]):
+            self._close(uuid, self.data["open"][uuid][1])
+
+    @staticmethod
+    def _uuid_of(player):
+        try:
+            return player.mojangUuid.string
+        except AttributeError:
+            # failed uuid lookups leave the uuid as False
+            return None
+
+    def _import_legacy_logins(self):
+        """One-time conversion of the old per-player 'logins' dicts
+        (which `_track` used to maintain) into session records."""
+        if not os.path.exists("wrapper-data/players"):
+            return
+        players = self.wrapper.api.minecraft.getAllPlayers()
+        for uuid in players:
+            if "logins" not in players[uuid]:
+                continue
+            record = self._getrecord(uuid)
+            record["name"] = self.wrapper.uuids.getusernamebyuuid(uuid)
+            for login in sorted(players[uuid]["logins"], key=int):
+                logout = int(players[uuid]["logins"][login])
+                login = int(login)
+                record["playtime"] += max(logout - login, 0)
+                record["logins"] += 1
+                record["sessions"].append([login, max(logout, login)])
+            del record["sessions"][:-MAX_SESSIONS]
+        self.log.debug("Imported legacy login records for %d players.",
+                       len(self.data["players"]))
@@ -12,8 +12,15 @@ import time
 import logging
 from api.helpers import mkdir_p, putjsonfile, getjsonfile, pickle_save, pickle_load
 from core.config import Config
+from utils.metrics import REGISTRY
 import threading
 
+# by root folder - a store per player would be too many labels
+_SAVE_SECONDS = REGISTRY.histogram(
+    "wrapper_storage_save_seconds", "Time taken to save a storage.", ("root",))
+_SAVED_BYTES = REGISTRY.counter(
+    "wrapper_storage_saved_bytes_total", "Bytes of storage files written.", ("root",))
+
 
 class Storage(object):
 
@@ -23,11 +30,12 @@ class Storage(object):
         self.name = name
         self.root = root
         self.pickle = pickle
-        self.configManager = Config()
-        self.configManager.loadconfig()
         self.log = logging.getLogger('Storage.py')
 
+        # only read wrapper.properties.json when we have to.
         if encoding == "default":
+            self.configManager = Config()
+            self.configManager.loadconfig()
             self.encoding = self.configManager.config["General"]["encoding"]
         else:
             self.encoding = encoding
@@ -71,6 +79,7 @@ class Storage(object):
             self.Data = self.json_load()
 
     def save(self):
+        started = time.time()
         if not os.path.exists(self.root):
             mkdir_p(self.root)
         if self.pickle:
@@ -78,6 +87,13 @@ class Storage(object):
             pickle_save(self.root, filenameis, self.Data, self.encoding)
         else:
             self.json_save()
+        _SAVE_SECONDS.labels(self.root).observe(time.time() - started)
+        try:
+            _SAVED_BYTES.labels(self.root).inc(os.path.getsize(
+                "%s/%s.%s" % (self.root, self.name, self.file_ext)))
+        except OSError:
+            # the save failed (and was logged)
+            pass
 
     def json_save(self):
         putcode = putjsonfile(self.Data, self.name, self.root)
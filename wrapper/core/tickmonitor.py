@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from api.base import API
+
+# seconds of time updates the proxy estimate is measured over
+TPS_WINDOW = 10
+
+# seconds the health state is judged on (the mean TPS over them)
+HEALTH_WINDOW = 5
+
+# TPS a degraded server must regain above a threshold to recover
+HYSTERESIS = 0.5
+
+# one point per second; an hour of them
+HISTORY = 3600
+
+# console probe results
+# vanilla "debug stop": "Stopped debug profiling after 10.01 seconds and
+#  200 ticks (19.98 ticks per second)" (1.17+: "...tick profiling...")
+_DEBUG_RESULT = re.compile(r"profiling after ([\d.]+) seconds and (\d+) ticks")
+# forge "forge tps": "Overall: Mean tick time: 12.345 ms. Mean TPS: 20.000"
+_FORGE_RESULT = re.compile(r"Overall\s*:\s*Mean tick time: ([\d.]+) ms\. Mean TPS: ([\d.]+)")
+# paper/spigot "tps": "TPS from last 1m, 5m, 15m: *20.0, 20.0, 20.0"
+_SPIGOT_RESULT = re.compile(r"TPS from last 1m, 5m, 15m: \W*([\d.]+)")
+# "Can't keep up! Is the server overloaded? Running 5012ms or 100 ticks behind"
+_LAG_RESULT = re.compile(r"Running (\d+)ms or (\d+) ticks behind")
+# the reports "debug stop" writes under the server's debug folder:
+#  "profile-results-2017-05-01_12.34.56.txt" (1.16: "...-profiling.zip")
+_DEBUG_REPORT = re.compile(r"profil", re.IGNORECASE)
+
+
+def percentile(ordered, fraction):
+    """nearest-rank percentile of a sorted list (None if empty)."""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(math.ceil(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+class TickMonitor(object):
+    """
+    Continuous estimate of the server's tick rate (TPS) and tick time
+    (MSPT), from up to three sources:
+
+        :proxy: the world age in the time updates the server sends
+         each connected player once a second.  The world age advances
+         one per tick, so age / wall time over TPS_WINDOW seconds is
+         the TPS.  Needs proxy mode and a player online.
+        :probe: the result of a console command run every Gameplay
+         "tps-probe-interval" seconds - "tps-probe-command" may be
+         "debug" (vanilla debug start/stop), "forge tps" or "tps"
+         (spigot/paper).  The reports each "debug stop" writes to the
+         server's debug folder are removed again.
+        :console: "Can't keep up!" warnings (recorded as lag spikes).
+
+    Once a second the freshest measurement becomes a point of the
+    history: (time, tps, mspt, source).  Where the source gives no
+    tick time, mspt is the effective 1000 / tps (which can not show
+    spare time while the server keeps up).
+
+    When the mean TPS over HEALTH_WINDOW seconds crosses Gameplay
+    "tps-warning" or "tps-critical" the "server.tickhealth" event is
+    called, for plugins that thin entities, warn players or restart.
+
+    Keepalive round trip times of the proxy's clients are kept too, to
+    tell network lag from server lag.
+    """
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.config = wrapper.config
+        self.log = wrapper.log
+        self.api = API(wrapper, "TickMonitor", internal=True)
+
+        # (time, tps, mspt, source) once a second
+        self.history = deque(maxlen=HISTORY)
+        # (time, ms behind, ticks skipped) of "Can't keep up!" warnings
+        self.lagspikes = deque(maxlen=100)
+        # {username: keepalive round trip seconds}
+        self.pings = {}
+        self.health = "ok"
+
+        # (wall time, world age) of the time updates seen
+        self._ages = deque()
+        # (time, tps, mspt) of the last probe result
+        self._probe = None
+        self._lastprobe = time.time()
+        self._profiling = False
+        # time of the probe's last "debug stop" (its report is removed
+        #  at the next probe)
+        self._stopped = None
+        self._lock = threading.Lock()
+
+        self.api.registerEvent("timer.second", self.onsecond)
+        self.api.registerEvent("player.logout", self.onlogout)
+
+    # source inputs
+
+    def timeupdate(self, worldage):
+        """ A time update packet reached the proxy.  Every client gets
+        a copy; only ones with a newer world age count. """
+        now = time.time()
+        with self._lock:
+            if self._ages and worldage <= self._ages[-1][1]:
+                return
+            if self._ages and worldage - self._ages[-1][1] > 20 * 60 * 20:
+                # a world age jump (/time add, a new world) - start over
+                self._ages.clear()
+            self._ages.append((now, worldage))
+            while now - self._ages[0][0] > TPS_WINDOW + 1:
+                self._ages.popleft()
+
+    def onlogout(self, payload):
+        player = payload["player"]
+        self.pings.pop(getattr(player, "username", player), None)
+
+    def keepalive(self, username, roundtrip):
+        """ A client answered the proxy's keepalive. """
+        self.pings[username] = roundtrip
+
+    def consoleline(self, line):
+        """ Read tick rate figures from a console line; True if it had
+        any. """
+        match = _FORGE_RESULT.search(line)
+        if match:
+            self._setprobe(float(match.group(2)), float(match.group(1)))
+            return True
+        match = _DEBUG_RESULT.search(line)
+        if match:
+            seconds, ticks = float(match.group(1)), int(match.group(2))
+            if seconds > 0:
+                self._setprobe(ticks / seconds, None)
+            return True
+        match = _SPIGOT_RESULT.search(line)
+        if match:
+            self._setprobe(float(match.group(1)), None)
+            return True
+        match = _LAG_RESULT.search(line)
+        if match:
+            self.lagspikes.append((time.time(), int(match.group(1)), int(match.group(2))))
+            return True
+        return False
+
+    def _setprobe(self, tps, mspt):
+        self._probe = (time.time(), min(20.0, tps), mspt)
+
+    # results
+
+    def current(self):
+        """ The latest (time, tps, mspt, source) point, or None if
+        nothing has been measured yet. """
+        try:
+            return self.history[-1]
+        except IndexError:
+            return None
+
+    def summary(self, seconds=60):
+        """
+        Percentiles of the last `seconds` of history:
+
+            {"points": n, "source": latest source, "health": "ok"...,
+             "tps": {"mean":, "min":, "p1":, "p5":, "p50":},
+             "mspt": {"mean":, "p50":, "p95":, "p99":, "max":},
+             "lagspikes": "Can't keep up!" warnings in the period}
+
+        TPS percentiles are the low ones (the bad seconds); MSPT the
+        high ones.  Values are None when there are no points.
+        """
+        since = time.time() - seconds
+        points = [point for point in self.history if point[0] > since]
+        tps = sorted(point[1] for point in points)
+        mspt = sorted(point[2] for point in points)
+        return {
+            "points": len(points),
+            "source": points[-1][3] if points else None,
+            "health": self.health,
+            "tps": {"mean": sum(tps) / len(tps) if tps else None,
+                    "min": tps[0] if tps else None,
+                    "p1": percentile(tps, 0.01),
+                    "p5": percentile(tps, 0.05),
+                    "p50": percentile(tps, 0.5)},
+            "mspt": {"mean": sum(mspt) / len(mspt) if mspt else None,
+                     "p50": percentile(mspt, 0.5),
+                     "p95": percentile(mspt, 0.95),
+                     "p99": percentile(mspt, 0.99),
+                     "max": mspt[-1] if mspt else None},
+            "lagspikes": len([spike for spike in self.lagspikes if spike[0] > since])
+        }
+
+    # once a second
+
+    def onsecond(self, payload=None):
+        self._runprobe()
+        point = self._measure()
+        if point is None:
+            return
+        self.history.append(point)
+        self._checkhealth()
+
+    def _measure(self):
+        now = time.time()
+        interval = self.config["Gameplay"]["tps-probe-interval"]
+        # a "debug" probe only has a result every other interval
+        if self._probe and now - self._probe[0] <= 3 * max(interval, 1):
+            stamp, tps, mspt = self._probe
+            source = "probe"
+        else:
+            with self._lock:
+                if len(self._ages) < 2 or now - self._ages[-1][0] > 5:
+                    # no player online (or not in proxy mode)
+                    return None
+                first, last = self._ages[0], self._ages[-1]
+            elapsed = last[0] - first[0]
+            if elapsed < 1:
+                return None
+            tps = min(20.0, (last[1] - first[1]) / elapsed)
+            mspt = None
+            source = "proxy"
+        if not mspt:
+            mspt = 1000.0 / max(tps, 0.1)
+        return now, tps, mspt, source
+
+    def _runprobe(self):
+        command = self.config["Gameplay"]["tps-probe-command"]
+        interval = self.config["Gameplay"]["tps-probe-interval"]
+        javaserver = self.wrapper.javaserver
+        if not command or interval < 1 or not javaserver or self.wrapper.servervitals.state != 2:
+            self._profiling = False
+            self._removereports()
+            return
+        if time.time() - self._lastprobe < interval:
+            return
+        self._lastprobe = time.time()
+        if command == "debug":
+            # measure from one probe to the next
+            if self._profiling:
+                self._stopped = time.time()
+                javaserver.console("debug stop")
+            else:
+                self._removereports()
+                javaserver.console("debug start")
+            self._profiling = not self._profiling
+        else:
+            javaserver.console(command)
+
+    def _removereports(self):
+        """ Remove the profiling reports written since the last "debug
+        stop" - a probe's, not any an operator asked for before. """
+        if self._stopped is None:
+            return
+        since, self._stopped = self._stopped - 1, None
+        folder = os.path.join(self.wrapper.servervitals.serverpath, "debug")
+        for root, dirs, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if _DEBUG_REPORT.search(name) and os.path.getmtime(path) >= since:
+                        os.remove(path)
+                except OSError as e:
+                    self.log.debug("Could not remove profiling report %s: %s", path, e)
+
+    def _checkhealth(self):
+        since = time.time() - HEALTH_WINDOW
+        recent = [point[1] for point in self.history if point[0] > since]
+        if not recent:
+            return
+        tps = sum(recent) / len(recent)
+        warning = self.config["Gameplay"]["tps-warning"]
+        critical = self.config["Gameplay"]["tps-critical"]
+        margin = HYSTERESIS if self.health != "ok" else 0
+        if tps < critical + (margin if self.health == "critical" else 0):
+            health = "critical"
+        elif tps < warning + margin:
+            health = "warning"
+        else:
+            health = "ok"
+        if health == self.health:
+            return
+        previous, self.health = self.health, health
+        self.wrapper.events.callevent("server.tickhealth", {
+            "health": health,
+            "previous": previous,
+            "tps": tps,
+            "mspt": self.history[-1][2],
+            "source": self.history[-1][3]
+        })
+
+        """ eventdoc
+            <group> core/tickmonitor.py <group>
+
+            <description> The server's tick rate crossed one of the
+            Gameplay "tps-warning" or "tps-critical" thresholds (judged
+            on the mean TPS of the last few seconds).
+            <description>
+
+            <abortable> No <abortable>
+
+            <comments> The tick rate comes from the proxy's time updates
+            (needs a player online) or the "tps-probe-command" console
+            probe.  See api.minecraft getTickHealth().
+            <comments>
+
+            <payload>
+            "health": "ok", "warning" or "critical"
+            "previous": the health before
+            "tps": mean ticks per second of the last few seconds
+            "mspt": milliseconds per tick
+            "source": "proxy" or "probe"
+            <payload>
+
+        """
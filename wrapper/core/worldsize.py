@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import os
+import threading
+import time
+
+# maximum number of stat() calls made per second.
+STAT_BUDGET = 200
+
+# minimum seconds between the starts of two counting passes.
+PASS_INTERVAL = 60
+
+# world sub folders of the other vanilla dimensions
+DIMENSIONS = {"DIM-1": "nether", "DIM1": "the_end"}
+
+
+class WorldSize(object):
+    """
+    Keeps a running tally of the world's disk usage without walking
+    the whole world folder at once.
+
+    A background thread counts the world in passes, making at most
+    STAT_BUDGET stat() calls a second.  Folder listings are cached
+    and only re-read when the folder's mtime changes (files were
+    added or removed); the files themselves are re-stat-ed every pass
+    because region files grow in place.  Results are published when
+    a pass completes:
+
+        :total: bytes used by the world.
+        :dimensions: {"overworld": bytes, "nether": bytes, "the_end": bytes}
+        :regions: {"overworld": {"r.0.0.mca": bytes, ...}, ...}
+        :updated: time of the last completed pass (0 - never).
+
+    """
+
+    def __init__(self, javaserver):
+        self.javaserver = javaserver
+        self.wrapper = javaserver.wrapper
+        self.vitals = javaserver.vitals
+        self.log = javaserver.log
+
+        self.total = 0
+        self.dimensions = {}
+        self.regions = {}
+        self.updated = 0
+
+        # {folder: (mtime, [sub folders], [files])}
+        self._listings = {}
+        self._budget = STAT_BUDGET
+
+        t = threading.Thread(target=self._counter, name="WorldSize", args=())
+        t.daemon = True
+        t.start()
+
+    def getregionsizes(self, dimension="overworld"):
+        """{region file name: bytes} for a dimension."""
+        return dict(self.regions.get(dimension, {}))
+
+    def _counter(self):
+        while not self.wrapper.halt.halt:
+            started = time.time()
+            if self.vitals.worldname:
+                worldpath = os.path.join(self.vitals.serverpath, self.vitals.worldname)
+                # noinspection PyBroadException
+                try:
+                    self._countworld(worldpath)
+                except Exception as e:
+                    self.log.debug("World size count failed: %s", e)
+            while time.time() - started < PASS_INTERVAL and not self.wrapper.halt.halt:
+                time.sleep(1)
+
+    def _countworld(self, worldpath):
+        total = 0
+        dimensions = {"overworld": 0}
+        regions = {}
+        seen = set()
+        pending = [(worldpath, "overworld")]
+        while pending:
+            folder, dimension = pending.pop()
+            seen.add(folder)
+            listing = self._getlisting(folder)
+            if listing is None:
+                continue
+            subfolders, files = listing
+            for name in subfolders:
+                sub = os.path.join(folder, name)
+                if folder == worldpath and name in DIMENSIONS:
+                    pending.append((sub, DIMENSIONS[name]))
+                else:
+                    pending.append((sub, dimension))
+            isregionfolder = os.path.basename(folder) == "region"
+            for name in files:
+                size = self._getsize(os.path.join(folder, name))
+                total += size
+                dimensions[dimension] = dimensions.get(dimension, 0) + size
+                if isregionfolder and name.endswith(".mca"):
+                    regions.setdefault(dimension, {})[name] = size
+
+        # forget folders that have been deleted
+        for folder in list(self._listings):
+            if folder not in seen:
+                del self._listings[folder]
+
+        self.total = total
+        self.dimensions = dimensions
+        self.regions = regions
+        self.updated = time.time()
+
+    def _getlisting(self, folder):
+        """([sub folders], [files]), re-read only if the folder changed."""
+        try:
+            mtime = self._stat(folder).st_mtime
+        except OSError:
+            return None
+        cached = self._listings.get(folder)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        subfolders = []
+        files = []
+        for name in os.listdir(folder):
+            if os.path.isdir(os.path.join(folder, name)):
+                subfolders.append(name)
+            else:
+                files.append(name)
+            self._spend()
+        self._listings[folder] = (mtime, subfolders, files)
+        return subfolders, files
+
+    def _getsize(self, path):
+        try:
+            return self._stat(path).st_size
+        except OSError:
+            # deleted since the folder was listed
+            return 0
+
+    def _stat(self, path):
+        self._spend()
+        return os.stat(path)
+
+    def _spend(self):
+        """ count one stat() against this second's budget; sleep out
+        the second once it is used up. """
+        self._budget -= 1
+        if self._budget <= 0:
+            time.sleep(1)
+            self._budget = STAT_BUDGET
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+
+from api.helpers import mkdir_p
+from core import nbt
+from core.region import RegionFile, SECTION_SELECT, DIMENSION_FOLDERS, \
+    decodesections, regioncoords
+
+REPORT = "wrapper-data/json/worldstats.json"
+
+# what the analyzer reads of each chunk.  Covers the pre-1.18 "Level"
+# layout, 1.18+ (no "Level") and the 1.17+ entities/ region files.
+_IDS = {"id": None}
+_SELECT = {"DataVersion": None, "InhabitedTime": None,
+           "block_entities": _IDS, "Entities": _IDS,
+           "Level": {"InhabitedTime": None, "Entities": _IDS,
+                     "TileEntities": _IDS}}
+_BLOCKSELECT = dict(_SELECT, sections=SECTION_SELECT,
+                    Level=dict(_SELECT["Level"], Sections=SECTION_SELECT))
+
+
+def _count(counter, items):
+    for item in items:
+        name = item.get("id", "unknown")
+        counter[name] = counter.get(name, 0) + 1
+
+
+def _analyzeregion(task):
+    """
+    Process pool worker - gather the statistics of one region file.
+
+    :Args:
+        :task: (path, blocks) - blocks is True to count blocks (slow).
+
+    :returns: {"chunks": {"x,z": [entities, tile entities, inhabited
+     ticks], ...}, "entities": {id: count}, "tiles": {id: count},
+     "blocks": {name: count}}
+    """
+    path, blocks = task
+    result = {"chunks": {}, "entities": {}, "tiles": {}, "blocks": {}}
+    regionx, regionz = regioncoords(path)
+    region = RegionFile(path)
+    try:
+        for localx, localz in region.chunks():
+            # noinspection PyBroadException
+            try:
+                data = region.readchunk(localx, localz)
+                if data is None:
+                    continue
+                root = nbt.loads(data, select=_BLOCKSELECT if blocks else _SELECT)
+            except Exception:
+                # a chunk being written by the server; skip it.
+                continue
+            level = root.get("Level", root)
+            entities = level.get("Entities", [])
+            tiles = level.get("TileEntities", root.get("block_entities", []))
+            _count(result["entities"], entities)
+            _count(result["tiles"], tiles)
+            key = "%d,%d" % (regionx * 32 + localx, regionz * 32 + localz)
+            result["chunks"][key] = [len(entities), len(tiles), level.get("InhabitedTime", 0)]
+            if blocks:
+                _countblocks(result["blocks"], root)
+    finally:
+        region.close()
+    return result
+
+
+def _countblocks(histogram, root):
+    for palette, indexes in decodesections(root).values():
+        for index, count in Counter(indexes).items():
+            entry = palette[index]
+            if "Name" in entry:
+                name = entry["Name"]
+            else:
+                name = "%d:%d" % (entry["id"], entry["data"])
+            histogram[name] = histogram.get(name, 0) + count
+
+
+class WorldStats(object):
+    """
+    Offline per-chunk world statistics, read from the region files
+    rather than from what the proxy sees.
+
+    Each region file is handed to a process pool, which gathers per
+    chunk entity counts, tile entity counts and inhabited time, plus
+    entity, tile entity and (optionally) block histograms.  Results
+    are kept by region file in REPORT and a region is only
+    re-analyzed when its mtime or size changed since the last run.
+
+    The report:
+
+        {"world": name, "updated": time of the last run,
+         "regions": {"<dimension>/<folder>/r.x.z.mca": {
+             "dimension": name, "mtime": float, "size": int, "blocks": bool,
+             <the _analyzeregion() result>}, ...}}
+
+    """
+
+    def __init__(self, wrapper):
+        self.wrapper = wrapper
+        self.vitals = wrapper.servervitals
+        self.log = wrapper.log
+        self.report = self._loadreport()
+        self.running = False
+        # (regions done, regions to do) of the current run
+        self.progress = (0, 0)
+
+    def analyze(self, blocks=True, workers=0, callback=None):
+        """
+        Start an analysis in a background thread.
+
+        :Args:
+            :blocks: also build block histograms (much slower).
+            :workers: pool processes (0 - one per CPU).
+            :callback: optional, called with the report when done.
+
+        :returns: False if an analysis is already running.
+
+        """
+        if self.running or not self.vitals.worldname:
+            return False
+        self.running = True
+        t = threading.Thread(target=self._analyze, name="WorldStats",
+                             args=(blocks, workers, callback))
+        t.daemon = True
+        t.start()
+        return True
+
+    def top(self, field="entities", count=10, dimension=None):
+        """
+        The chunks with the most entities, tiles or inhabited time.
+
+        :returns: [(dimension, chunkx, chunkz, value), ...] largest first.
+
+        """
+        column = ("entities", "tiles", "inhabited").index(field)
+        chunks = {}
+        for region in self.report["regions"].values():
+            if dimension and region["dimension"] != dimension:
+                continue
+            for key, values in region["chunks"].items():
+                ident = (region["dimension"], key)
+                # a 1.17+ chunk has entries in both region/ and entities/
+                chunks[ident] = chunks.get(ident, 0) + values[column]
+        ranked = sorted(chunks.items(), key=lambda item: item[1], reverse=True)
+        result = []
+        for (name, key), value in ranked[:count]:
+            chunkx, chunkz = key.split(",")
+            result.append((name, int(chunkx), int(chunkz), value))
+        return result
+
+    def totals(self, dimension=None):
+        """{"chunks": n, "entities": {id: n}, "tiles": {...}, "blocks": {...}}"""
+        totals = {"chunks": 0, "entities": Counter(), "tiles": Counter(), "blocks": Counter()}
+        for path, region in self.report["regions"].items():
+            if dimension and region["dimension"] != dimension:
+                continue
+            if "/entities/" not in path:
+                totals["chunks"] += len(region["chunks"])
+            for field in ("entities", "tiles", "blocks"):
+                totals[field].update(region[field])
+        for field in ("entities", "tiles", "blocks"):
+            totals[field] = dict(totals[field])
+        return totals
+
+    def _analyze(self, blocks, workers, callback):
+        # noinspection PyBroadException
+        try:
+            started = time.time()
+            report = self.report
+            if report.get("world") != self.vitals.worldname:
+                report = {"world": self.vitals.worldname, "updated": 0, "regions": {}}
+            found = self._findregions()
+            regions = {}
+            tasks = []
+            for key, (path, dimension, mtime, size) in found.items():
+                old = report["regions"].get(key)
+                if old and old["mtime"] == mtime and old["size"] == size \
+                        and (old["blocks"] or not blocks):
+                    regions[key] = old
+                else:
+                    regions[key] = {"dimension": dimension, "mtime": mtime,
+                                    "size": size, "blocks": blocks}
+                    tasks.append((key, path))
+
+            self.progress = (0, len(tasks))
+            for done, (key, result) in enumerate(self._runtasks(tasks, blocks, workers)):
+                regions[key].update(result)
+                self.progress = (done + 1, len(tasks))
+            # regions the pool could not read are left out (and retried next run)
+            regions = dict((key, value) for key, value in regions.items() if "chunks" in value)
+
+            report["regions"] = regions
+            report["updated"] = time.time()
+            self.report = report
+            self._savereport()
+            self.log.info("World analysis done: %d region files (%d re-read) in %.1f seconds.",
+                          len(regions), len(tasks), time.time() - started)
+            if callback:
+                callback(report)
+        except Exception as e:
+            self.log.exception("World analysis failed: %s", e)
+        finally:
+            self.running = False
+
+    def _runtasks(self, tasks, blocks, workers):
+        """yield (key, result) as the pool finishes each region."""
+        jobs = [(path, blocks) for key, path in tasks]
+        keys = dict((path, key) for key, path in tasks)
+        pool = None
+        if len(jobs) > 1 and workers != 1:
+            try:
+                pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+            except (OSError, ImportError, NotImplementedError):
+                pool = None
+        try:
+            if pool:
+                results = pool.imap_unordered(_safeanalyze, jobs)
+            else:
+                results = (_safeanalyze(job) for job in jobs)
+            for path, result in results:
+                if result is None:
+                    self.log.debug("World analysis could not read %s", path)
+                    continue
+                yield keys[path], result
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    def _findregions(self):
+        """{report key: (path, dimension, mtime, size)} of every region file."""
+        worldpath = os.path.join(self.vitals.serverpath, self.vitals.worldname)
+        found = {}
+        for dimension, folder in DIMENSION_FOLDERS.items():
+            for kind in ("region", "entities"):
+                regionfolder = os.path.join(worldpath, folder, kind)
+                if not os.path.isdir(regionfolder):
+                    continue
+                for name in os.listdir(regionfolder):
+                    if not name.endswith(".mca"):
+                        continue
+                    path = os.path.join(regionfolder, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    if st.st_size < 8192:
+                        # no chunks yet
+                        continue
+                    key = "%s/%s/%s" % (dimension, kind, name)
+                    found[key] = (path, dimension, st.st_mtime, st.st_size)
+        return found
+
+    def _loadreport(self):
+        if os.path.exists(REPORT):
+            try:
+                with open(REPORT) as f:
+                    return json.load(f)
+            except ValueError:
+                self.log.error("World analysis report %s is unreadable; it will be rebuilt.", REPORT)
+        return {"world": None, "updated": 0, "regions": {}}
+
+    def _savereport(self):
+        mkdir_p(os.path.dirname(REPORT))
+        temp = REPORT + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.report, f, separators=(",", ":"))
+        if os.path.exists(REPORT):
+            os.remove(REPORT)
+        os.rename(temp, REPORT)
+
+
+def _safeanalyze(job):
+    """(path, _analyzeregion result or None if the file is unreadable)"""
+    # noinspection PyBroadException
+    try:
+        return job[0], _analyzeregion(job)
+    except Exception:
+        return job[0], None
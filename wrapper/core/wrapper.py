@@ -47,6 +47,11 @@ import core.buildinfo as core_buildinfo_version
 from proxy.utils.mcuuid import UUIDS
 from core.config import Config
 from core.backups import Backups
+from core.sessions import Sessions
+from core.worldstats import WorldStats
+from core.serverstats import ServerStats
+from core.logsearch import LogSearch
+from core.tickmonitor import TickMonitor
 from core.consoleuser import ConsolePlayer
 from core.permissions import Permissions
 from utils.crypt import Crypt
@@ -203,6 +208,11 @@ class Wrapper(object):
         self.web = None
         self.proxy = None
         self.backups = None
+        self.sessions = None
+        self.worldstats = None
+        self.serverstats = None
+        self.logsearch = None
+        self.tickmonitor = None
 
         #  HaltSig - Why? ... because if self.halt was just `False`, passing
         #  a self.halt would simply be passing `False` (immutable).  Changing
@@ -271,11 +281,21 @@ class Wrapper(object):
         self.api = API(self, "Wrapper.py")
         self._registerwrappershelp()
 
+        self.sessions = Sessions(self)
+
+        # before the server, which feeds it console lines
+        self.tickmonitor = TickMonitor(self)
+        self.servervitals.tickmonitor = self.tickmonitor
+
         # This is not the actual server... the MCServer
         # class is a console wherein the server is started
         self.javaserver = MCServer(self, self.servervitals)
         self.javaserver.init()
 
+        self.worldstats = WorldStats(self)
+        self.serverstats = ServerStats(self)
+        self.logsearch = LogSearch(self)
+
         # load plugins
         self.plugins.loadplugins()
 
@@ -343,6 +363,7 @@ class Wrapper(object):
 
         self.plugins.disableplugins()
         self.log.info("Plugins disabled")
+        self.sessions.close()
         self.wrapper_storage.close()
         self.wrapper_permissions.close()
         self.wrapper_usercache.close()
@@ -644,6 +665,15 @@ class Wrapper(object):
                              "entity", "entities"):
                 self.runwrapperconsolecommand("ent", allargs)
 
+            elif command in ("/worldstats", "worldstats"):
+                self.runwrapperconsolecommand("worldstats", allargs)
+
+            elif command == "/wrapper":
+                self.runwrapperconsolecommand("wrapper", allargs)
+
+            elif command in ("/logs", "logs"):
+                self.runwrapperconsolecommand("logs", allargs)
+
             elif command in ("/config", "/con", "/prop",
                              "/property", "/properties"):
                 self.runwrapperconsolecommand("config", allargs)
@@ -717,6 +747,12 @@ class Wrapper(object):
                  "/entity help/? for more help.. ", None),
                 ("/config", "Change wrapper.properties (type"
                             " /config help for more..)", None),
+                ("/worldstats [run/entities/tiles/inhabited/blocks]",
+                 "Per-chunk world statistics from the region files.", None),
+                ("/wrapper [stats/mem/update/halt]",
+                 "Wrapper.py version, server stats and maintenance.", None),
+                ("/logs <server/wrapper> [from:<time>] [to:<time>] [regex]",
+                 "Search the logs and their archives (/logs for more).", None),
                 ("/password", "Sample usage: /pw IRC control-irc-pass <new"
                               "password>", None),
 
@@ -1109,6 +1145,16 @@ class Wrapper(object):
         readout("/entity",
                 "Work with entities (run /entity for more...)",
                 usereadline=self.use_readline)
+        readout("/worldstats",
+                "Analyze the world's region files (run /worldstats\n"
+                "                  help for more...)",
+                usereadline=self.use_readline)
+        readout("/wrapper", "Server stats (/wrapper stats) and memory"
+                            " (/wrapper mem).",
+                usereadline=self.use_readline)
+        readout("/logs", "Search the logs and their archives by time and\n"
+                         "                  regex (run /logs for more...)",
+                usereadline=self.use_readline)
         readout("/bans", "Display the ban help page.",
                 usereadline=self.use_readline)
 
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import hashlib
+import os
+import threading
+import zlib
+
+try:
+    import pkg_resources
+except ImportError:
+    pkg_resources = False
+
+# {extension: Content-Type}
+CONTENT_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "txt": "text/html; charset=utf-8",
+    "js": "application/javascript",
+    "css": "text/css",
+    "map": "application/json",
+    "json": "application/json",
+    "svg": "image/svg+xml",
+    "ico": "image/x-icon",
+    "png": "image/png",
+    "eot": "application/vnd.ms-fontobject",
+    "ttf": "font/ttf",
+    "woff": "font/woff",
+}
+
+# types worth a gzipped variant (the rest are already compressed)
+COMPRESSIBLE = ("html", "txt", "js", "css", "map", "json", "svg", "eot", "ttf")
+
+# files smaller than this are not worth gzipping
+GZIP_MINIMUM = 512
+
+
+class Asset(object):
+    """
+    One static file of the web interface, as served.
+
+    :data: the file's bytes.
+    :gzipped: the gzip-encoded bytes, or None if compression does
+     not pay off for this file.
+    :etag: quoted ETag header value (a hash of the content).
+    :contenttype: Content-Type header value.
+
+    """
+
+    def __init__(self, filename, data):
+        self.data = data
+        self.etag = '"%s"' % hashlib.sha1(data).hexdigest()[:20]
+        ext = filename[filename.rfind(".") + 1:].lower()
+        self.contenttype = CONTENT_TYPES.get(ext, "application/octet-stream")
+        self.gzipped = None
+        if ext in COMPRESSIBLE and len(data) >= GZIP_MINIMUM:
+            # wbits 31 - gzip container
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+            gzipped = compressor.compress(data) + compressor.flush()
+            if len(gzipped) < len(data):
+                self.gzipped = gzipped
+
+
+class AssetCache(object):
+    """
+    The web interface's static files (management/html), read once and
+    kept in memory with their ETag and gzipped variant.  The files
+    ship inside Wrapper.py and cannot change while it runs, so
+    nothing is ever re-read.
+    """
+
+    def __init__(self):
+        # {filename: Asset}
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """the Asset for a file in management/html (raises IOError
+        if there is no such file)."""
+        asset = self._assets.get(filename)
+        if asset is None:
+            asset = Asset(filename, self._load(filename))
+            with self._lock:
+                self._assets[filename] = asset
+        return asset
+
+    def _load(self, filename):
+        path = "html/%s" % filename
+        if pkg_resources:
+            # pkg_resources reports missing files in various ways
+            try:
+                return pkg_resources.resource_string(__name__, path)
+            except (IOError, OSError, KeyError):
+                raise IOError("No such asset: %s" % filename)
+        with open(os.path.join(os.path.dirname(__file__), path), "rb") as f:
+            return f.read()
@@ -9,6 +9,7 @@ import time
 import threading
 import random
 import datetime
+import json
 import logging
 
 from core.storage import Storage
@@ -117,6 +118,22 @@ class Web(object):
         def index():
             return render_template("dashboard.html")
 
+        @self.app.route("/stats")
+        def stats():
+            # public like the web server's /action/stats, unless the
+            #  operator turned that off (it lists players and uuids)
+            if not self.config["Web"]["public-stats"] and not self.validate_key():
+                return redirect("/login")
+            # the shared snapshot, serialized once per refresh
+            return Response(self.wrapper.serverstats.publicjson, mimetype="application/json")
+
+        @self.app.route("/resources/<tier>")
+        def resources(tier):
+            if not self.validate_key() or tier not in self.wrapper.javaserver.resources.tiers:
+                return redirect("/login")
+            return Response(json.dumps(self.wrapper.javaserver.resources.history(tier)),
+                            mimetype="application/json")
+
         @self.app.route("/login", methods=["GET", "POST"])
         def login():
             badpass = False
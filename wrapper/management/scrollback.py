@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import json
+import re
+import threading
+import time
+from collections import deque
+
+# Py3-2
+_STRINGS = (str, type(u""))
+
+
+class Sequence(object):
+    """
+    Sequence ids shared by several Scrollbacks, with the lock they
+    share so that an id is only handed out together with its entry.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # the last id handed out
+        self.value = 0
+
+    def next(self):
+        """the next id.  Call with the lock held."""
+        self.value += 1
+        return self.value
+
+
+class Scrollback(object):
+    """
+    Bounded ring buffer of (sequence id, time, item) entries.
+
+    Sequence ids come from a counter shared by all of the web
+    interface's buffers, so a client can follow several buffers with
+    a single cursor - "give me everything after id N".  Lookups walk
+    back from the newest entry, so they cost O(new entries), not
+    O(buffer size).
+
+    :Args:
+        :capacity: most entries kept.
+        :sequence: the shared Sequence.
+        :maxbytes: most bytes of items kept (0 - no limit).  The
+         oldest entries are dropped first.  Strings count their
+         length, other items the length of their json.
+
+    """
+
+    def __init__(self, capacity, sequence, maxbytes=0):
+        self.capacity = capacity
+        self.maxbytes = maxbytes
+        # bytes of the items held (only counted with maxbytes)
+        self.size = 0
+        self.entries = deque()
+        self.sequence = sequence
+        self._lock = sequence.lock
+
+    def append(self, item):
+        """add an item; returns its sequence id."""
+        size = _sizeof(item) if self.maxbytes else 0
+        with self._lock:
+            seq = self.sequence.next()
+            self.entries.append((seq, time.time(), item, size))
+            self.size += size
+            while len(self.entries) > self.capacity or (
+                    self.maxbytes and self.size > self.maxbytes and len(self.entries) > 1):
+                self.size -= self.entries.popleft()[3]
+        return seq
+
+    def since(self, cursor, until=None):
+        """items added after sequence id `cursor` (and up to id `until`),
+        oldest first."""
+        found = []
+        with self._lock:
+            for seq, stamp, item, size in reversed(self.entries):
+                if seq <= cursor:
+                    break
+                if until is None or seq <= until:
+                    found.append(item)
+        found.reverse()
+        return found
+
+    def sincetime(self, timestamp):
+        """items added after `timestamp`, oldest first."""
+        found = []
+        with self._lock:
+            for seq, stamp, item, size in reversed(self.entries):
+                if stamp <= timestamp:
+                    break
+                found.append(item)
+        found.reverse()
+        return found
+
+    def search(self, pattern, before=None, count=50):
+        """
+        One page of the entries matching a regular expression, newest
+        first.
+
+        :Args:
+            :pattern: regex (string or compiled); "" matches everything.
+            :before: only look at entries older than this sequence id
+             (the "next" of the previous page).
+            :count: most entries returned.
+
+        :returns: {"results": [[seq, time, item], ...] oldest first,
+         "next": sequence id to pass as `before` for the next (older)
+         page, or None if there are no more}
+
+        """
+        if not hasattr(pattern, "search"):
+            pattern = re.compile(pattern)
+        results = []
+        more = False
+        with self._lock:
+            entries = list(self.entries)
+        for seq, stamp, item, size in reversed(entries):
+            if before is not None and seq >= before:
+                continue
+            if pattern.search(_text(item)):
+                if len(results) == count:
+                    more = True
+                    break
+                results.append([seq, stamp, item])
+        results.reverse()
+        return {"results": results,
+                "next": results[0][0] if more and results else None}
+
+    def last(self):
+        """sequence id of the newest entry (0 if empty)."""
+        try:
+            return self.entries[-1][0]
+        except IndexError:
+            return 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _text(item):
+    if isinstance(item, _STRINGS):
+        return item
+    return json.dumps(item)
+
+
+def _sizeof(item):
+    return len(_text(item))
@@ -5,18 +5,31 @@
 # This program is distributed under the terms of the GNU
 # General Public License, version 3 or later.
 
+import select
 import socket
 import traceback
 import threading
 import time
 import json
 import random
+import re
 import os
 import logging
+import sys
 
-from api.helpers import getargs, get_req
+from api.helpers import get_req, get_int
 from api.base import API
 from core.storage import Storage
+from management.assets import AssetCache
+from management.scrollback import Scrollback, Sequence
+from utils.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+# Py3-2
+try:
+    import queue
+except ImportError:
+    # noinspection PyPep8Naming
+    import Queue as queue
 
 try:
     import pkg_resources
@@ -25,6 +38,36 @@ except ImportError:
     pkg_resources = False
     requests = False
 
+PY3 = sys.version_info > (3,)
+
+# seconds an idle keep-alive connection is held open
+KEEPALIVE_TIMEOUT = 5
+
+# seconds from a request's first byte to its end (then 408)
+REQUEST_TIMEOUT = 10
+
+# seconds between checks, while a connection is idle, for connections
+#  waiting on a worker (which an idle connection gives way to)
+IDLE_POLL = 0.5
+
+# requests served on one connection before it is closed
+KEEPALIVE_REQUESTS = 100
+
+# largest request head (request line and headers) accepted
+MAX_REQUEST_HEAD = 16384
+
+# accepted connections waiting for a free worker; more are refused
+CONNECTION_BACKLOG = 64
+
+# most concurrent event streams (each holds a thread of its own)
+MAX_STREAMS = 16
+
+# seconds between keepalive comments on an idle event stream
+STREAM_KEEPALIVE = 15
+
+# seconds a woken event stream waits for more updates before sending
+STREAM_BATCH = 0.25
+
 
 # Yeah, I know. The code is awful. Probably not even a HTTP-compliant web
 # server anyways. I just wrote it at like 3AM in like an hour.
@@ -39,6 +82,10 @@ class Web(object):
         self.config = wrapper.config
         self.serverpath = self.config["General"]["server-directory"]
         self.socket = False
+        self.assets = AssetCache()
+        # accepted (socket, address) pairs waiting for a worker
+        self.connections = queue.Queue(CONNECTION_BACKLOG)
+        self.workers = []
         self.data = Storage("web")
         self.pass_handler = self.wrapper.cipher
 
@@ -50,84 +97,111 @@ class Web(object):
         self.api.registerEvent("player.login", self.onPlayerJoin)
         self.api.registerEvent("player.logout", self.onPlayerLeave)
         self.api.registerEvent("irc.message", self.onChannelMessage)
-        self.consoleScrollback = []
-        self.chatScrollback = []
-        self.memoryGraph = []
+        self.api.registerEvent("timer.second", self.refreshstate)
+
+        # everything the admin page follows is numbered from one sequence,
+        # so a client needs just one cursor (see updatesince)
+        self.sequence = Sequence()
+        self.consoleScrollback = Scrollback(self.config["Web"]["console-scrollback-lines"], self.sequence,
+                                            self.config["Web"]["console-scrollback-bytes"])
+        self.chatScrollback = Scrollback(self.config["Web"]["chat-scrollback-lines"], self.sequence)
+        self.memoryGraph = Scrollback(200, self.sequence)
+        # {key: new value} changes of the admin page state (see refreshstate)
+        self.stateChanges = Scrollback(100, self.sequence)
+        self.state = {}
+        # notified whenever anything is added; streaming clients wait on it
+        self.updated = threading.Condition()
+        # number of connected streaming clients
+        self.streams = 0
+        # last time admin_stats was polled
+        self.lastpoll = 0
+
         self.loginAttempts = 0
         self.lastAttempt = 0
         self.disableLogins = 0
 
-        # t = threading.Thread(target=self.updateGraph, args=())
-        # t.daemon = True
-        # t.start()
-
     def __del__(self):
             self.data.close()
 
     def onServerConsole(self, payload):
-        while len(self.consoleScrollback) > 1000:
-            try:
-                del self.consoleScrollback[0]
-            except Exception as e:
-                break
-        self.consoleScrollback.append((time.time(), payload["message"]))
+        self.addscrollback(self.consoleScrollback, payload["message"])
 
     def onPlayerMessage(self, payload):
-        while len(self.chatScrollback) > 200:
-            try:
-                del self.chatScrollback[0]
-            except Exception as e:
-                break
-        self.chatScrollback.append((time.time(), {
+        self.addscrollback(self.chatScrollback, {
             "type": "player", 
             "payload": {
                 "player": payload["player"].username, 
                 "message": payload["message"]
             }
-        }))
+        })
 
     def onPlayerJoin(self, payload):
-        # print(payload)
-        while len(self.chatScrollback) > 200:
-            try:
-                del self.chatScrollback[0]
-            except Exception as e:
-                break
-        self.chatScrollback.append((time.time(), {
+        self.addscrollback(self.chatScrollback, {
             "type": "playerJoin", 
             "payload": {
                 "player": payload["player"].username
             }
-        }))
+        })
 
     def onPlayerLeave(self, payload):
-        while len(self.chatScrollback) > 200:
-            try:
-                del self.chatScrollback[0]
-            except Exception as e:
-                break
-        self.chatScrollback.append((time.time(), {
+        self.addscrollback(self.chatScrollback, {
             "type": "playerLeave", 
             "payload": {
                 "player": payload["player"]
             }
-        }))
+        })
 
     def onChannelMessage(self, payload):
-        while len(self.chatScrollback) > 200:
-            try:
-                del self.chatScrollback[0]
-            except Exception as e:
-                break
-        self.chatScrollback.append((time.time(), {"type": "irc", "payload": payload}))
-
-    def updateGraph(self):
-        while not self.wrapper.halt.halt:
-            while len(self.memoryGraph) > 200:
-                del self.memoryGraph[0]
-            if self.wrapper.javaserver.getmemoryusage():
-                self.memoryGraph.append([time.time(), self.wrapper.javaserver.getmemoryusage()])
-            time.sleep(1)
+        self.addscrollback(self.chatScrollback, {"type": "irc", "payload": payload})
+
+    def addscrollback(self, scrollback, item):
+        scrollback.append(item)
+        with self.updated:
+            self.updated.notify_all()
+
+    def refreshstate(self, payload=None):
+        """ Pick up a new server stats snapshot as the admin page state
+        (checked once a second, while anyone is streaming or polling)
+        and record what changed. """
+        if not self.streams and time.time() - self.lastpoll > 5:
+            return
+        state = self.wrapper.serverstats.get()
+        if not state or state is self.state:
+            return
+        delta = {}
+        for key in state:
+            if state[key] != self.state.get(key):
+                delta[key] = state[key]
+        self.state = state
+        if state["server_memory"]:
+            self.addscrollback(self.memoryGraph, state["server_memory"])
+        if delta:
+            self.addscrollback(self.stateChanges, delta)
+
+    def updatesince(self, cursor, fullstate=False):
+        """
+        What was added after sequence id `cursor`:
+
+            {"cursor": new cursor, "console": [lines], "chat": [...],
+             "server_memory_graph": [...], "state": {changed keys}}
+
+        With fullstate, "state" is the whole current state instead
+        of the changes.
+        """
+        newest = self.sequence.value
+        if fullstate:
+            state = dict(self.state)
+        else:
+            state = {}
+            for delta in self.stateChanges.since(cursor, newest):
+                state.update(delta)
+        return {
+            "cursor": newest,
+            "console": self.consoleScrollback.since(cursor, newest),
+            "chat": self.chatScrollback.since(cursor, newest),
+            "server_memory_graph": self.memoryGraph.since(cursor, newest),
+            "state": state
+        }
 
     def checkLogin(self, password):
         if time.time() - self.disableLogins < 60:
@@ -197,14 +271,36 @@ class Web(object):
     def listen(self):
         self.log.info("Web Interface bound to %s:%d",
                       self.config["Web"]["web-bind"], self.config["Web"]["web-port"])
+        self.startworkers()
         while not self.wrapper.halt.halt:
             # noinspection PyUnresolvedReferences
             sock, addr = self.socket.accept()
-            # self.log.debug("(WEB) Connection %s started", str(addr))
-            client = WebClient(sock, addr, self)
-            t = threading.Thread(target=client.wrap, args=())
+            try:
+                self.connections.put_nowait((sock, addr))
+            except queue.Full:
+                # every worker is busy and the backlog is full
+                try:
+                    sock.sendall(b"HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                    sock.close()
+                except socket.error:
+                    pass
+
+    def startworkers(self):
+        """ Start the pool of "web-workers" threads that serve the
+        accepted connections. """
+        while len(self.workers) < max(1, self.config["Web"]["web-workers"]):
+            t = threading.Thread(target=self.worker, name="WebWorker-%d" % len(self.workers), args=())
             t.daemon = True
             t.start()
+            self.workers.append(t)
+
+    def worker(self):
+        while not self.wrapper.halt.halt:
+            try:
+                sock, addr = self.connections.get(timeout=1)
+            except queue.Empty:
+                continue
+            WebClient(sock, addr, self).wrap()
 
 
 # noinspection PyBroadException,PyUnusedLocal,PyMethodMayBeStatic,PyPep8Naming
@@ -222,27 +318,43 @@ class WebClient(object):
         self.request = ""
         self.log = self.wrapper.log
         self.api = self.wrapper.api
-        self.socket.setblocking(30)
-
-    def read(self, filename):
-        return pkg_resources.resource_stream(__name__, "html/%s" % filename).read()
+        self.socket.settimeout(KEEPALIVE_TIMEOUT)
+
+        # received bytes not yet parsed
+        self.buffer = b""
+        # the current request's HTTP version and {lowercase name: value} headers
+        self.version = "HTTP/1.0"
+        self.requestheaders = {}
+        self.method = "GET"
+        self.keepalive = False
+        # the connection was handed to another thread (an event stream)
+        self.detached = False
 
     def write(self, message):
-        self.socket.send(message)
-
-    def headers(self, status="200 Good", contenttype="text/html", location=""):
-        self.write("HTTP/1.0 %s\n" % status)
-        if len(location) < 1:
-            self.write("Content-Type: %s\n" % contenttype)
-
-        if len(location) > 0:
-            self.write("Location: %s\n" % location)
-
-        self.write("\n")
+        if not isinstance(message, bytes):
+            message = message.encode("utf-8")
+        self.socket.sendall(message)
+
+    def respond(self, status="200 OK", body=b"", contenttype="text/html; charset=utf-8", headers=None):
+        """ Send a complete response.  Every response carries its
+        Content-Length, so the connection can be kept alive. """
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        lines = ["%s %s" % (self.version, status),
+                 "Content-Type: %s" % contenttype,
+                 "Content-Length: %d" % len(body),
+                 "Connection: %s" % ("keep-alive" if self.keepalive else "close")]
+        for name, value in headers or ():
+            lines.append("%s: %s" % (name, value))
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        if self.method == "HEAD":
+            body = b""
+        # one send, so the head and a small body share a packet
+        self.write(head + body)
 
     def close(self):
         try:
-            self.socket.close_server()
+            self.socket.close()
             # self.log.debug("(WEB) Connection %s closed", str(self.addr))
         except Exception as e:
             pass
@@ -252,9 +364,14 @@ class WebClient(object):
             self.handle()
         except Exception as e:
             self.log.exception("Internal error while handling web mode request")
-            self.headers(status="300 Internal Server Error")
-            self.write("<h1>300 Internal Server Error</h1>")
-            self.close()
+            self.keepalive = False
+            try:
+                self.respond("500 Internal Server Error", "<h1>500 Internal Server Error</h1>")
+            except Exception as e:
+                pass
+        finally:
+            if not self.detached:
+                self.close()
 
     def handleAction(self, request):
         info = self.runAction(request)
@@ -273,11 +390,7 @@ class WebClient(object):
         if action == "stats":
             if not self.wrapper.config["Web"]["public-stats"]:
                 return EOFError  # Why are we returning error objects and not just raising them?
-            players = []
-            for i in self.wrapper.javaserver.players:
-                players.append({"name": i, "loggedIn": self.wrapper.javaserver.players[i].loggedIn,
-                                "uuid": self.wrapper.javaserver.players[i].uuid.string})
-            return {"playerCount": len(self.wrapper.javaserver.players), "players": players}
+            return self.wrapper.serverstats.public
         if action == "login":
             password = get_req("password", request)
             rememberme = get_req("remember-me", request)
@@ -401,90 +514,52 @@ class WebClient(object):
             if not self.wrapper.javaserver:
                 return
             refreshtime = float(get_req("last_refresh", request))
-            players = []
-            for i in self.wrapper.javaserver.players:
-                player = self.wrapper.javaserver.players[i]
-                players.append({
-                    "name": i,
-                    "loggedIn": player.loggedIn,
-                    "uuid": player.uuid.string,
-                    "isOp": player.isOp()
-                })
-            plugins = []
-            for pid in self.wrapper.plugins:
-                plugin = self.wrapper.plugins[pid]
-                if plugin["good"]:
-                    if plugin["description"]:
-                        description = plugin["description"]
-                    else:
-                        description = None
-                    plugins.append({
-                        "name": plugin["name"],
-                        "version": plugin["version"],
-                        "description": description,
-                        "summary": plugin["summary"],
-                        "author": plugin["author"],
-                        "website": plugin["website"],
-                        # "version": (".".join([str(_) for _ in plugin["version"]])),
-                        "id": pid,
-                        "good": True
-                    })
-                else:
-                    plugins.append({
-                        "name": plugin["name"],
-                        "good": False
-                    })
-            consolescrollback = []
-            for line in self.web.consoleScrollback:
-                if line[0] > refreshtime:
-                    consolescrollback.append(line[1])
-            chatscrollback = []
-            for line in self.web.chatScrollback:
-                if line[0] > refreshtime:
-                    print(line[1])
-                    chatscrollback.append(line[1])
-            memorygraph = []
-            for line in self.web.memoryGraph:
-                if line[0] > refreshtime:
-                    memorygraph.append(line[1])
-            # totalPlaytime = {}
-            # totalPlayers = self.web.api.minecraft.getAllPlayers()
-            # for uu in totalPlayers:
-            #   if not "logins" in totalPlayers[uu]:
-            #       continue
-            #   playerName = self.api.lookupbyUUID(uu)
-            #   totalPlaytime[playerName] = [0, 0]
-            #   for i in totalPlayers[uu]["logins"]:
-            #       totalPlaytime[playerName][0] += totalPlayers[uu]["logins"][i] - int(i)
-            #       totalPlaytime[playerName][1] += 1
-
-            # secondstohuman was removed from here... a new version is in api.helpers, if needed later.
-
-            topplayers = []
-            # for i,username in enumerate(totalPlaytime):
-            #   topPlayers.append((totalPlaytime[username][0], secondsToHuman(totalPlaytime[username][0]),
-            #                                   totalPlaytime[username][1], username))
-            #   if i == 9: break
-            #   topPlayers.sort(); topPlayers.reverse()
-            return {
-                "playerCount": [len(self.wrapper.javaserver.players), self.wrapper.javaserver.maxPlayers],
-                "players": players,
-                "plugins": plugins,
-                "server_state": self.wrapper.servervitals.state,
-                "wrapper_build": self.wrapper.getbuildstring(),
-                "console": consolescrollback,
-                "chat": chatscrollback,
-                "level_name": self.wrapper.javaserver.worldname,
-                "server_version": self.wrapper.javaserver.version,
-                "motd": self.wrapper.javaserver.motd,
-                "refresh_time": time.time(),
-                "server_name": self.wrapper.config["Web"]["server-name"],
-                "server_memory": self.wrapper.javaserver.getmemoryusage(),
-                "server_memory_graph": memorygraph,
-                "world_size": self.wrapper.javaserver.worldSize,
-                "disk_avail": self.wrapper.javaserver.getstorageavailable("."),
-                "topPlayers": topplayers
-            }
+            if not self.web.state or time.time() - self.web.lastpoll > 5:
+                # nobody was watching, so the state is stale
+                self.web.lastpoll = time.time()
+                self.web.refreshstate()
+            self.web.lastpoll = time.time()
+            stats = dict(self.web.state)
+            stats.update({
+                "console": self.web.consoleScrollback.sincetime(refreshtime),
+                "chat": self.web.chatScrollback.sincetime(refreshtime),
+                "server_memory_graph": self.web.memoryGraph.sincetime(refreshtime),
+                "refresh_time": time.time()
+            })
+            return stats
+        if action == "search_console":
+            if not self.web.validateKey(get_req("key", request)):
+                return EOFError
+            before = get_req("before", request)
+            count = min(get_int(get_req("count", request)) or 50, 500)
+            try:
+                return self.web.consoleScrollback.search(
+                    get_req("query", request), get_int(before) if before else None, count)
+            except re.error:
+                return {"error": "invalid_query"}
+        if action == "search_logs":
+            if not self.web.validateKey(get_req("key", request)):
+                return EOFError
+            since, until = get_req("since", request), get_req("until", request)
+            count = min(get_int(get_req("count", request)) or 50, 500)
+            try:
+                found = self.wrapper.logsearch.search(
+                    get_req("source", request) or "server", get_req("query", request),
+                    float(since) if since else None, float(until) if until else None, count,
+                    get_int(get_req("skip", request)))
+            except re.error:
+                return {"error": "invalid_query"}
+            if found is None:
+                return {"error": "invalid_source", "sources": self.wrapper.logsearch.sources()}
+            return found
+        if action == "resources":
+            if not self.web.validateKey(get_req("key", request)):
+                return EOFError
+            tier = get_req("tier", request) or "second"
+            if tier not in self.wrapper.javaserver.resources.tiers:
+                return {"error": "invalid_tier"}
+            since = get_req("since", request)
+            return self.wrapper.javaserver.resources.history(tier, float(since) if since else 0)
         if action == "console":
             if not self.web.validateKey(get_req("key", request)):
                 return EOFError
@@ -495,7 +570,7 @@ class WebClient(object):
             if not self.web.validateKey(get_req("key", request)):
                 return EOFError
             message = get_req("message", request)
-            self.web.chatScrollback.append((time.time(), {"type": "raw", "payload": "[WEB ADMIN] " + message}))
+            self.web.addscrollback(self.web.chatScrollback, {"type": "raw", "payload": "[WEB ADMIN] " + message})
             self.wrapper.javaserver.broadcast("&c[WEB ADMIN]&r " + message)
             return True
         if action == "kick_player":
@@ -529,6 +604,10 @@ class WebClient(object):
                     self.wrapper.storage["disabled_plugins"].append(plugin)
                     self.log.warning("[%s] Disabled plugin '%s'", self.addr[0], plugin)
                     self.wrapper.reloadplugins()
+        if action == "backups":
+            if not self.web.validateKey(get_req("key", request)):
+                return EOFError
+            return {"backups": self.wrapper.backups.listbackups()}
         if action == "reload_plugins":
             if not self.web.validateKey(get_req("key", request)):
                 return EOFError
@@ -560,78 +639,268 @@ class WebClient(object):
             return {"error": "invalid_server_action"}
         return False
 
-    def getcontenttype(self, filename):
-        ext = filename[filename.rfind("."):][1:]
-        if ext == "js":
-            return "application/javascript"
-        if ext == "css":
-            return "text/css"
-        if ext in ("txt", "html"):
-            return "text/html"
-        if ext == "ico":
-            return "image/x-icon"
-        return "application/octet-stream"
-
     def get(self, request):
-        print("GET request: %s" % request)
         if request == "/":
             workfile = "index.html"
+        elif request.split("/")[1:][0] == "stream":
+            self.startstream(request)
+            return
+        elif request.split("?")[0] == "/action/stats" and self.config["Web"]["public-stats"]:
+            # polled by server list sites; serialized once per stats refresh
+            self.respond(body=self.wrapper.serverstats.publicjson, contenttype="application/json",
+                         headers=(("Cache-Control", "no-store"),))
+            return
+        elif request.split("?")[0] == "/metrics" and self.config["Web"]["metrics-endpoint"]:
+            # Prometheus text format, for a scraper
+            self.respond(body=REGISTRY.exposition(), contenttype=METRICS_CONTENT_TYPE,
+                         headers=(("Cache-Control", "no-store"),))
+            return
         elif request.split("/")[1:][0] == "action":
             try:
-                self.write(json.dumps(self.handleAction(request)))
+                body = json.dumps(self.handleAction(request))
             except Exception as e:
-                self.headers(status="300 Internal Server Error")
-                print(traceback.format_exc())
-            self.close()
-            return False
+                self.log.exception("Internal error in web action %s", request)
+                self.respond("500 Internal Server Error", "<h1>500 Internal Server Error</h1>")
+                return
+            self.respond(body=body, contenttype="application/json",
+                         headers=(("Cache-Control", "no-store"),))
+            return
         else:
-            workfile = request.replace("..", "").replace("%", "").replace("\\", "")
+            workfile = request.split("?")[0].replace("..", "").replace("%", "").replace("\\", "")
         if workfile == "/admin.html":
-            self.headers(status="301 Go Away", location="/admin")
-            return False
+            self.respond("301 Moved Permanently", headers=(("Location", "/admin"),))
+            return
         if workfile == "/login.html":
-            self.headers(status="301 Go Away", location="/login")
-            return False
-        if workfile == ".":
-            self.headers(status="400 Bad Request")
-            self.write("<h1>BAD REQUEST</h1>")
-            self.close()
-            return False
-        # try:
-        print("\n\nworkfile: %s\n\n" % workfile)
+            self.respond("301 Moved Permanently", headers=(("Location", "/login"),))
+            return
+        if workfile in (".", "/", ""):
+            self.respond("400 Bad Request", "<h1>BAD REQUEST</h1>")
+            return
         if workfile == "/admin":
             workfile = "admin.html"
         if workfile == "/login":
             workfile = "login.html"
-        print("\n\nworkfile: %s\n\n" % workfile)
-        data = self.read(workfile)
-        self.headers(contenttype=self.getcontenttype(workfile))
-        self.write(data)
-        # except Exception as e:
-        #    self.headers(status="404 Not Found (exception in get)")
-        #    self.write("<h1>404 Not Found (exception in get)</h4>")
-        self.close()
+        self.sendasset(workfile.lstrip("/"))
+
+    def sendasset(self, filename):
+        """ Serve a static file from the asset cache, honoring
+        If-None-Match and Accept-Encoding: gzip. """
+        try:
+            asset = self.web.assets.get(filename)
+        except (IOError, OSError):
+            self.respond("404 Not Found", "<h1>404 Not Found</h1>")
+            return
+        headers = [("ETag", asset.etag), ("Cache-Control", "no-cache")]
+        if asset.gzipped:
+            headers.append(("Vary", "Accept-Encoding"))
+        if asset.etag in self.requestheaders.get("if-none-match", ""):
+            self.respond("304 Not Modified", contenttype=asset.contenttype, headers=headers)
+            return
+        if asset.gzipped and "gzip" in self.requestheaders.get("accept-encoding", ""):
+            headers.append(("Content-Encoding", "gzip"))
+            self.respond(body=asset.gzipped, contenttype=asset.contenttype, headers=headers)
+        else:
+            self.respond(body=asset.data, contenttype=asset.contenttype, headers=headers)
+
+    def startstream(self, request):
+        """ Hand the connection to a thread of its own for an event
+        stream, so that it does not hold up a worker. """
+        self.keepalive = False
+        if self.web.streams >= MAX_STREAMS:
+            self.respond("503 Service Unavailable", "<h1>Too many streams</h1>")
+            return
+        self.detached = True
+        t = threading.Thread(target=self.stream, name="WebStream", args=(request,))
+        t.daemon = True
+        t.start()
+
+    def stream(self, request):
+        """
+        /stream/admin?key=<key>&cursor=<id> - a server-sent events
+        stream of the admin page's updates (Web.updatesince).
+
+        The first event carries the full state; after that an event is
+        only sent when something was added, and holds just what is new.
+        Updates arriving together are batched by waiting STREAM_BATCH
+        seconds after being woken.  A comment line is sent every
+        STREAM_KEEPALIVE seconds so proxies keep the connection open.
+        """
+        if not self.web.validateKey(get_req("key", request)):
+            try:
+                self.respond("403 Forbidden", "<h1>403 Forbidden</h1>")
+            except socket.error:
+                pass
+            self.close()
+            return
+        cursor = get_int(get_req("cursor", request))
+        with self.web.updated:
+            self.web.streams += 1
+        try:
+            # the stream only ends when either side closes the connection
+            self.write("%s 200 OK\r\n"
+                       "Content-Type: text/event-stream\r\n"
+                       "Cache-Control: no-cache\r\n"
+                       "Connection: close\r\n\r\n" % self.version)
+            if not self.web.state:
+                self.web.refreshstate()
+            fullstate = True
+            while not self.wrapper.halt.halt:
+                if fullstate or self.web.sequence.value != cursor:
+                    update = self.web.updatesince(cursor, fullstate)
+                    fullstate = False
+                    cursor = update["cursor"]
+                    self.write("id: %d\ndata: %s\n\n" % (cursor, json.dumps(update)))
+                with self.web.updated:
+                    if self.web.sequence.value == cursor:
+                        self.web.updated.wait(STREAM_KEEPALIVE)
+                if self.web.sequence.value == cursor:
+                    self.write(": keepalive\n\n")
+                else:
+                    time.sleep(STREAM_BATCH)
+        except socket.error:
+            # the browser went away
+            pass
+        finally:
+            with self.web.updated:
+                self.web.streams -= 1
+            self.close()
 
     def handle(self):
+        served = 0
+        while not self.wrapper.halt.halt:
+            request = self.readrequest()
+            if request is None:
+                return
+            self.method, target, self.version, self.requestheaders = request
+            served += 1
+            connection = self.requestheaders.get("connection", "").lower()
+            if self.version == "HTTP/1.1":
+                self.keepalive = "close" not in connection
+            else:
+                self.keepalive = "keep-alive" in connection
+            if served >= KEEPALIVE_REQUESTS:
+                self.keepalive = False
+            if self.method in ("GET", "HEAD"):
+                self.get(target)
+            else:
+                self.respond("405 Method Not Allowed", "<h1>Invalid request. Sorry.</h1>",
+                             headers=(("Allow", "GET, HEAD"),))
+            if not self.keepalive or self.detached:
+                return
+
+    def readrequest(self):
+        """
+        Read the next request from the connection.
+
+        :returns: (method, target, version, {lowercase header: value}),
+         or None when the connection was closed, went idle for
+         KEEPALIVE_TIMEOUT seconds (or while other connections waited
+         for a worker), took over REQUEST_TIMEOUT seconds to send a
+         request (answered with a 408 first) or sent a malformed
+         request (answered with a 400 first).  A request body is read
+         and discarded.
+        """
+        idlesince = time.time()
+        # set by the request's first byte
+        deadline = None
         while True:
-            try:
-                data = self.socket.recv(1024)
-                if len(data) < 1:
-                    self.close()
-                    return
-                # self.buffer = data.split("\n")  # TODO replace all new_buffer with self.buffer to restore back
-                new_buffer = data.split("\n")
-            except Exception as e:
-                self.close()
-                # self.log.debug("(WEB) Connection %s closed", str(self.addr))
+            # tolerate the blank lines some clients send between requests
+            self.buffer = self.buffer.lstrip(b"\r\n")
+            end = self.buffer.find(b"\r\n\r\n")
+            separator = 4
+            if end < 0:
+                end = self.buffer.find(b"\n\n")
+                separator = 2
+            if end >= 0:
                 break
-            if len(new_buffer) < 1:
-                print("Web connection closed suddenly")
+            if len(self.buffer) > MAX_REQUEST_HEAD:
+                return self.badrequest("431 Request Header Fields Too Large")
+            if not self.buffer:
+                if not self.waitidle(idlesince):
+                    return None
+            elif deadline is None:
+                deadline = time.time() + REQUEST_TIMEOUT
+            if not self.receive(deadline):
+                return self.timedout(deadline)
+        head = self.buffer[:end]
+        self.buffer = self.buffer[end + separator:]
+        if PY3:
+            head = head.decode("latin-1")
+        lines = head.splitlines()
+        requestline = lines[0].split()
+        if len(requestline) == 2:
+            # HTTP/0.9 style
+            requestline.append("HTTP/1.0")
+        if len(requestline) != 3 or not requestline[2].startswith("HTTP/"):
+            return self.badrequest("400 Bad Request")
+        method, target, version = requestline
+        if version not in ("HTTP/1.0", "HTTP/1.1"):
+            version = "HTTP/1.1"
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = get_int(headers.get("content-length", "0"))
+        if deadline is None:
+            deadline = time.time() + REQUEST_TIMEOUT
+        while len(self.buffer) < length:
+            if not self.receive(deadline):
+                return self.timedout(deadline)
+        self.buffer = self.buffer[length:]
+        return method.upper(), target, version, headers
+
+    def waitidle(self, since):
+        """ Wait for an idle connection (no partial request) to become
+        readable; False once it has been idle KEEPALIVE_TIMEOUT seconds
+        or as soon as another connection is waiting for a worker. """
+        while not self.wrapper.halt.halt:
+            left = since + KEEPALIVE_TIMEOUT - time.time()
+            if left <= 0:
                 return False
-            for line in new_buffer:
-                if getargs(line.split(" "), 0) == "GET":
-                    self.get(getargs(line.split(" "), 1))
-                if getargs(line.split(" "), 0) == "POST":
-                    self.request = getargs(line.split(" "), 1)
-                    self.headers(status="400 Bad Request")
-                    self.write("<h1>Invalid request. Sorry.</h1>")
+            try:
+                readable = select.select([self.socket], [], [], min(left, IDLE_POLL))[0]
+            except (select.error, socket.error, ValueError):
+                return False
+            if readable:
+                return True
+            if not self.web.connections.empty():
+                return False
+        return False
+
+    def receive(self, deadline=None):
+        """ Append what arrives on the socket to the buffer; False if
+        the connection closed, or timed out (after KEEPALIVE_TIMEOUT
+        seconds, or at the deadline). """
+        timeout = KEEPALIVE_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.time())
+            if timeout <= 0:
+                return False
+        try:
+            self.socket.settimeout(timeout)
+            data = self.socket.recv(4096)
+        except (socket.timeout, socket.error):
+            return False
+        finally:
+            try:
+                # for the response
+                self.socket.settimeout(KEEPALIVE_TIMEOUT)
+            except socket.error:
+                pass
+        self.buffer += data
+        return len(data) > 0
+
+    def timedout(self, deadline):
+        """ readrequest()'s result when receive() failed part way
+        through a request: a 408 if it ran out of time. """
+        if deadline is not None and time.time() >= deadline:
+            try:
+                return self.badrequest("408 Request Timeout")
+            except socket.error:
+                return None
+        return None
+
+    def badrequest(self, status):
+        self.keepalive = False
+        self.respond(status, "<h1>%s</h1>" % status)
+        return None
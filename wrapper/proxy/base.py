@@ -78,11 +78,16 @@ class ServerVitals(object):
         self.entity_control = None
         # -1 until a player logs on and server sends a time update
         self.timeofday = -1
+        # the caller's core.tickmonitor TickMonitor (fed time updates
+        #  and keepalive round trips), if any
+        self.tickmonitor = None
         self.spammy_stuff = ["found nothing", "vehicle of", "Wrong location!",
                              "Tried to add entity",]
 
         # PROPOSE
         self.clients = []
+        # the same clients, indexed by username
+        self.clientsbyname = {}
 
         # owner/op info
         self.ownernames = {}
@@ -120,6 +125,8 @@ class ProxyConfig(object):
             "spigot-mode": False
         }
         self.entity = {
+            "cull-radius": 0,
+            "cull-type-cap": 0,
             "enable-entity-controls": False,
             "entity-update-frequency": 4,
             "thin-Chicken": 30,
@@ -244,9 +251,13 @@ class Proxy(object):
 
     def removestaleclients(self):
         """only removes aborted clients"""
-        for i, client in enumerate(self.srv_data.clients):
-            if self.srv_data.clients[i].abort:
-                self.srv_data.clients.pop(i)
+        for client in list(self.srv_data.clients):
+            if client.abort:
+                self.srv_data.clients.remove(client)
+                if self.srv_data.clientsbyname.get(client.username) is client:
+                    del self.srv_data.clientsbyname[client.username]
+                    if self.entity_control:
+                        self.entity_control.removeclient(client.username)
 
     def pollserver(self, host="localhost", port=None):
         if port is None:
@@ -27,6 +27,14 @@ from proxy.utils.constants import *
 from proxy.utils.mcuuid import MCUUID
 
 from api.helpers import processcolorcodes, processoldcolorcodes, chattocolorcodes
+from utils.metrics import REGISTRY
+
+# result: "accepted", "banned", "denied" (by a plugin) or "auth_failed"
+_LOGINS = REGISTRY.counter(
+    "wrapper_proxy_logins_total", "Proxy login attempts.", ("result",))
+_AUTH_SECONDS = REGISTRY.histogram(
+    "wrapper_proxy_auth_seconds", "Time the session server took to "
+    "authenticate a client.")
 
 
 # noinspection PyMethodMayBeStatic
@@ -64,6 +72,7 @@ class Client(object):
         # client setup and operating paramenters
         self.username = "PING REQUEST"
         self.packet = Packet(self.client_socket, self)
+        self.packet.side = "client"
         self.verifyToken = encryption.generate_challenge_token()
         self.serverID = encryption.generate_server_id().encode('utf-8')
         self.MOTD = {}
@@ -75,8 +84,8 @@ class Client(object):
         self.onlinemode = self.proxy.config["online-mode"]
 
         # packet stuff
-        self.pktSB = mcpackets_sb.Packets(self.clientversion)
-        self.pktCB = mcpackets_cb.Packets(self.clientversion)
+        self.pktSB = mcpackets_sb.getpackets(self.clientversion)
+        self.pktCB = mcpackets_cb.getpackets(self.clientversion)
         self.parse_sb = ParseSB(self, self.packet)
 
         # dictionary of parser packet constants and associated parsing methods
@@ -300,6 +309,7 @@ class Client(object):
                           " connect:\n %s" % (self.username, banreason))
             self.state = HANDSHAKE
             self.disconnect("Banned: %s" % banreason)
+            _LOGINS.labels("banned").inc()
             return
 
         # Run the pre-login event
@@ -339,6 +349,7 @@ class Client(object):
 
             self.state = HANDSHAKE
             self.disconnect("Login denied by a Plugin.")
+            _LOGINS.labels("denied").inc()
             return
 
         self.log.info("%s's Proxy Client LOGON occurred: (UUID: %s"
@@ -347,6 +358,7 @@ class Client(object):
                       self.ip, self.onlinemode)
         self._inittheplayer()  # set up inventory and stuff
         self._add_client()
+        _LOGINS.labels("accepted").inc()
 
         # start keep alives
 
@@ -485,8 +497,8 @@ class Client(object):
         # Determine packet types  - in this context, pktSB/pktCB is
         # what is being received/sent from/to the client.
         # That is why we refresh to the clientversion.
-        self.pktSB = mcpackets_sb.Packets(self.clientversion)
-        self.pktCB = mcpackets_cb.Packets(self.clientversion)
+        self.pktSB = mcpackets_sb.getpackets(self.clientversion)
+        self.pktCB = mcpackets_cb.getpackets(self.clientversion)
         self._define_parsers()
 
     # api related
@@ -584,9 +596,11 @@ class Client(object):
 
     def _login_authenticate_client(self, server_id):
         if self.onlinemode:
+            started = time.time()
             r = requests.get("https://sessionserver.mojang.com"
                              "/session/minecraft/hasJoined?username=%s"
                              "&serverId=%s" % (self.username, server_id))
+            _AUTH_SECONDS.observe(time.time() - started)
             if r.status_code == 200:
                 requestdata = r.json()
                 self.uuid = MCUUID(requestdata["id"])  # TODO
@@ -638,6 +652,7 @@ class Client(object):
         #  will be called later by mcserver.py)
         if self not in self.proxy.srv_data.clients:
             self.proxy.srv_data.clients.append(self)
+        self.proxy.srv_data.clientsbyname[self.username] = self
 
     def _send_client_settings(self):
         if self.clientSettings and not self.clientSettingsSent:
@@ -752,6 +767,9 @@ class Client(object):
 
         if data[0] == self.keepalive_val:
             self.time_client_responded = time.time()
+            if self.proxy.srv_data.tickmonitor:
+                self.proxy.srv_data.tickmonitor.keepalive(
+                    self.username, self.time_client_responded - self.time_server_pinged)
         return False
 
     # plugin channel handler
@@ -977,6 +995,7 @@ class Client(object):
         # verify correct response
         if not verifytoken == self.verifyToken:
             self.disconnect("Verify tokens are not the same")
+            _LOGINS.labels("auth_failed").inc()
             return False
 
         # determine if IP is silent banned:
@@ -989,11 +1008,13 @@ class Client(object):
             else:
                 # self disconnect does not "return" anything.
                 self.disconnect("Your address is IP-banned from this server!.")
+            _LOGINS.labels("banned").inc()
             return False
 
         # begin Client logon process
         # Wrapper in online mode, taking care of authentication
         if self._login_authenticate_client(serverid) is False:
+            _LOGINS.labels("auth_failed").inc()
             return False  # client failed to authenticate
 
         # TODO Whitelist processing Here (or should it be at javaserver start?)
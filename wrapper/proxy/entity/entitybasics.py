@@ -5,7 +5,8 @@
 # This program is distributed under the terms of the GNU
 # General Public License, version 3 or later.
 
-
+import threading
+from array import array
 from time import time as currtime
 from api.helpers import putjsonfile
 from proxy.entity.entityconsts import ENTITIES, PRE1_11_RENAMES
@@ -108,25 +109,187 @@ class Objects(object):
         self.objectlist = OBJECTS
 
 
+class EntityStore(object):
+    """
+    Struct-of-arrays storage for tracked entities.  Each entity
+    occupies one slot across a set of array.array columns (eid,
+    type, x/y/z, owning client) instead of being a python object
+    with its own __dict__.  Released slots go on a free list and
+    are reused by the next spawn.
+
+    The rarely used fields (uuid, look, rodeBy, riding) live in
+    plain lists alongside the columns.
+
+    `Entity` objects are only views (store, slot) onto this data.
+    """
+
+    def __init__(self):
+        self.eid = array("i")
+        self.type = array("i")
+        self.x = array("d")
+        self.y = array("d")
+        self.z = array("d")
+        self.owner = array("i")
+        self.isobject = array("b")
+        self.active = array("d")
+        # bumped each time a slot is reused, so stale views are
+        # detectable
+        self.generation = array("i")
+
+        self.uuid = []
+        self.name = []
+        self.look = []
+        self.rodeby = []
+        self.riding = []
+
+        self.free = []
+        # client names are stored once; `owner` holds an index.
+        self.owners = []
+        self._ownerindex = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.eid) - len(self.free)
+
+    def add(self, eid, uuid, entitytype, entityname, position, look,
+            isobject, clientname):
+        """ store a new entity and return an Entity view of it. """
+        with self._lock:
+            owner = self._ownerindex.get(clientname)
+            if owner is None:
+                owner = len(self.owners)
+                self.owners.append(clientname)
+                self._ownerindex[clientname] = owner
+            if self.free:
+                slot = self.free.pop()
+                self.eid[slot] = eid
+                self.type[slot] = entitytype
+                self.x[slot] = position[0]
+                self.y[slot] = position[1]
+                self.z[slot] = position[2]
+                self.owner[slot] = owner
+                self.isobject[slot] = isobject
+                self.active[slot] = currtime()
+                self.generation[slot] += 1
+                self.uuid[slot] = uuid
+                self.name[slot] = entityname
+                self.look[slot] = look
+                self.rodeby[slot] = False
+                self.riding[slot] = False
+            else:
+                slot = len(self.eid)
+                self.eid.append(eid)
+                self.type.append(entitytype)
+                self.x.append(position[0])
+                self.y.append(position[1])
+                self.z.append(position[2])
+                self.owner.append(owner)
+                self.isobject.append(isobject)
+                self.active.append(currtime())
+                self.generation.append(0)
+                self.uuid.append(uuid)
+                self.name.append(entityname)
+                self.look.append(look)
+                self.rodeby.append(False)
+                self.riding.append(False)
+        return Entity(self, slot)
+
+    def release(self, entity):
+        """ free the entity's slot for reuse. """
+        slot = entity.slot
+        with self._lock:
+            if not entity.alive:
+                return
+            self.eid[slot] = -1
+            self.generation[slot] += 1
+            # drop references so they can be GC-ed
+            self.uuid[slot] = None
+            self.look[slot] = None
+            self.rodeby[slot] = False
+            self.riding[slot] = False
+            self.free.append(slot)
+
+
+# noinspection PyPep8Naming
 class Entity(object):
-    def __init__(self, eid, uuid, entitytype, entityname, position, look,
-                 isobject, playerclientname):
-        self.eid = eid  # Entity ID
-        self.uuid = uuid  # Entity UUID
-        self.entitytype = entitytype  # Type of Entity
-        self.position = position  # (x, y, z)
-        self.look = look  # Head Position
-        self.rodeBy = False
-        self.riding = False
-
-        # Boat/Minecart/other non-living Entities are objects
-        self.isObject = isobject
-        self.entityname = entityname
-        self.active = currtime()
-        self.clientname = playerclientname
+    """ A view of one entity in an EntityStore.
+
+    CAUTION - once the entity is destroyed, the view is dead (see
+    `alive`) and its fields may describe a different entity.
+    """
+    __slots__ = ("store", "slot", "_gen")
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+        self._gen = store.generation[slot]
+
+    @property
+    def alive(self):
+        return self.store.generation[self.slot] == self._gen
+
+    @property
+    def eid(self):
+        return self.store.eid[self.slot]
+
+    @property
+    def uuid(self):
+        return self.store.uuid[self.slot]
+
+    @property
+    def entitytype(self):
+        return self.store.type[self.slot]
+
+    @property
+    def entityname(self):
+        return self.store.name[self.slot]
+
+    @property
+    def clientname(self):
+        return self.store.owners[self.store.owner[self.slot]]
+
+    @property
+    def isObject(self):
+        return bool(self.store.isobject[self.slot])
+
+    @property
+    def active(self):
+        return self.store.active[self.slot]
+
+    @property
+    def look(self):
+        return self.store.look[self.slot]
+
+    @property
+    def position(self):
+        slot = self.slot
+        store = self.store
+        return store.x[slot], store.y[slot], store.z[slot]
+
+    @position.setter
+    def position(self, position):
+        slot = self.slot
+        store = self.store
+        store.x[slot], store.y[slot], store.z[slot] = position
+
+    @property
+    def rodeBy(self):
+        return self.store.rodeby[self.slot]
+
+    @rodeBy.setter
+    def rodeBy(self, rider):
+        self.store.rodeby[self.slot] = rider
+
+    @property
+    def riding(self):
+        return self.store.riding[self.slot]
+
+    @riding.setter
+    def riding(self, vehicle):
+        self.store.riding[self.slot] = vehicle
 
     def __str__(self):
-        return self.entitytype
+        return "%s" % self.entitytype
 
     def move_relative(self, position):
         """ Move the entity relative to their position, unless it is illegal.
@@ -136,32 +299,39 @@ class Entity(object):
         Args:
             position:
         """
-        x, y, z = position
-        oldposition = [self.position[0], self.position[1], self.position[2]]
-        oldposition[0] += x / (128 * 32.0)
-        oldposition[1] += y / (128 * 32.0)
-        oldposition[2] += z / (128 * 32.0)
-        self.position = (oldposition[0], oldposition[1], oldposition[2])
-        if self.rodeBy:
-            self.rodeBy.position = self.position
+        slot = self.slot
+        store = self.store
+        store.x[slot] += position[0] / (128 * 32.0)
+        store.y[slot] += position[1] / (128 * 32.0)
+        store.z[slot] += position[2] / (128 * 32.0)
+        rider = store.rodeby[slot]
+        if rider:
+            rider.position = self.position
 
     def teleport(self, position):
         """ Track entity teleports to a specific location. """
-        self.position = (position[0] / 32, position[1] / 32, position[2] / 32)  # Fixed point numbers...
-        if self.rodeBy:
-            self.rodeBy.position = self.position
+        # Fixed point numbers...
+        self.position = (position[0] / 32, position[1] / 32, position[2] / 32)
+        rider = self.store.rodeby[self.slot]
+        if rider:
+            rider.position = self.position
 
     def about_entity(self):
+        if not self.alive:
+            return None
+        slot = self.slot
+        store = self.store
         info = {
-            "eid": self.eid,
-            "uuid": str(self.uuid),
-            "type": self.entitytype,
-            "position": [int(self.position[0]), int(self.position[1]), int(self.position[2])],
-            "rodeBy": self.rodeBy,
-            "Riding": self.riding,
-            "isObject": self.isObject,
-            "name": self.entityname,
-            "player": self.clientname
+            "eid": store.eid[slot],
+            "uuid": str(store.uuid[slot]),
+            "type": store.type[slot],
+            "position": [int(store.x[slot]), int(store.y[slot]),
+                         int(store.z[slot])],
+            "rodeBy": store.rodeby[slot],
+            "Riding": store.riding[slot],
+            "isObject": bool(store.isobject[slot]),
+            "name": store.name[slot],
+            "player": store.owners[store.owner[slot]]
         }
         return info
 
@@ -5,10 +5,146 @@
 # This program is distributed under the terms of the GNU
 # General Public License, version 3 or later.
 
-from time import sleep
+from time import sleep, time
 import threading
 from proxy.entity.entitybasics import Entities as Entitytypes
 from proxy.entity.entitybasics import Objects as Objecttypes
+from proxy.entity.entitybasics import EntityStore
+
+# seconds between checks for culled entities that can be revealed
+CULL_CHECK_INTERVAL = 0.5
+
+# most packets (after the spawn) kept for each culled entity
+CULL_KEEP_PACKETS = 16
+
+
+def _decrement(counts, name):
+    remaining = counts.get(name, 1) - 1
+    if remaining > 0:
+        counts[name] = remaining
+    else:
+        counts.pop(name, None)
+
+
+def _chunk_of(position):
+    """ (chunkX, chunkZ) of a world position. """
+    return int(position[0] // 16), int(position[2] // 16)
+
+
+class ClientEntities(object):
+    """
+    The entities present in one client's world.  Entities are
+    indexed by eid and bucketed by the chunk they are in, with a
+    running count of each entity type, so that nothing has to
+    walk the full entity list to answer "what is near this player?"
+
+    Maintained by EntityControl (from parse_cb); not intended for
+    use by plugins.
+    """
+
+    def __init__(self, clientname):
+        self.clientname = clientname
+        # {eid: Entity}
+        self.entities = {}
+        # {(chunkX, chunkZ): set(eids)}
+        self.chunks = {}
+        # {eid: (chunkX, chunkZ)}
+        self.chunkof = {}
+        # {entityname: count}
+        self.counts = {}
+        # spawns held back by entity culling.  {eid: [raw packets]}
+        self.hidden = {}
+        # {entityname: count} of the hidden entities
+        self.hiddencounts = {}
+        # when hidden entities were last checked for revealing
+        self.lastreveal = 0
+
+    def add(self, entity):
+        """ add entity; returns any entity it replaced (same eid). """
+        eid = entity.eid
+        replaced = self.remove(eid)
+        self.entities[eid] = entity
+        self._bucket(eid, _chunk_of(entity.position))
+        name = entity.entityname
+        self.counts[name] = self.counts.get(name, 0) + 1
+        return replaced
+
+    def remove(self, eid):
+        entity = self.entities.pop(eid, None)
+        if not entity:
+            return None
+        self._unbucket(eid)
+        name = entity.entityname
+        _decrement(self.counts, name)
+        if self.hidden.pop(eid, None) is not None:
+            _decrement(self.hiddencounts, name)
+        return entity
+
+    def hide(self, entity, payload):
+        """ hold back an entity's spawn packet. """
+        self.hidden[entity.eid] = [payload]
+        name = entity.entityname
+        self.hiddencounts[name] = self.hiddencounts.get(name, 0) + 1
+
+    def unhide(self, eid):
+        """ the packets held back for a hidden entity. """
+        packets = self.hidden.pop(eid)
+        _decrement(self.hiddencounts, self.entities[eid].entityname)
+        return packets
+
+    def visible(self, name):
+        """ how many entities of this type the client can see. """
+        return self.counts.get(name, 0) - self.hiddencounts.get(name, 0)
+
+    def moved(self, eid):
+        """ re-bucket an entity after its position changed. """
+        entity = self.entities.get(eid)
+        if not entity:
+            return
+        chunk = _chunk_of(entity.position)
+        if self.chunkof.get(eid) != chunk:
+            self._unbucket(eid)
+            self._bucket(eid, chunk)
+
+    def nearby(self, position, radius):
+        """ Entities within `radius` blocks (horizontally) of
+        position.  Only the chunks overlapping the radius are
+        looked at. """
+        found = []
+        x, z = position[0], position[2]
+        minx, minz = _chunk_of((x - radius, 0, z - radius))
+        maxx, maxz = _chunk_of((x + radius, 0, z + radius))
+        radius_sq = radius * radius
+        for cx in range(minx, maxx + 1):
+            for cz in range(minz, maxz + 1):
+                bucket = self.chunks.get((cx, cz))
+                if not bucket:
+                    continue
+                for eid in list(bucket):
+                    entity = self.entities.get(eid)
+                    if not entity:
+                        continue
+                    dx = entity.position[0] - x
+                    dz = entity.position[2] - z
+                    if dx * dx + dz * dz <= radius_sq:
+                        found.append(entity)
+        return found
+
+    def _bucket(self, eid, chunk):
+        self.chunkof[eid] = chunk
+        if chunk in self.chunks:
+            self.chunks[chunk].add(eid)
+        else:
+            self.chunks[chunk] = {eid}
+
+    def _unbucket(self, eid):
+        chunk = self.chunkof.pop(eid, None)
+        bucket = self.chunks.get(chunk)
+        if bucket is None:
+            return
+        bucket.discard(eid)
+        if not bucket:
+            self.chunks.pop(chunk, None)
 
 
 # noinspection PyPep8Naming
@@ -58,25 +194,29 @@ class EntityControl(object):
         # load config settings
         self.entityControl = self.ent_config[
             "enable-entity-controls"]
-        self.entityProcessorFrequency = self.ent_config[
-            "entity-update-frequency"]
         self.thiningFrequency = self.ent_config[
             "thinning-frequency"]
         self.startThinningThreshshold = self.ent_config[
             "thinning-activation-threshhold"]
+        # proxy side culling of entity spawns (0 - off)
+        self.cullradius = self.ent_config["cull-radius"]
+        self.cullcap = self.ent_config["cull-type-cap"]
+        self.culling = bool(self.cullradius or self.cullcap)
         # self.kill_aura_radius = self.javaserver.config["Entities"][
         #   "player-thinning-radius"]
 
+        # the entity data itself.  Entity objects are views of it.
+        self.store = EntityStore()
+        # {eid: Entity} of every tracked entity.  When two clients
+        # see the same entity, this holds the most recent copy.
         self.entities = {}
+        # {clientname: ClientEntities} - the per-client spatial index.
+        # A client's partition is dropped when its server connection
+        # closes (disconnect, server change) or it respawns.
+        self.clients = {}
         self._abortep = False
         if self.entityControl:
 
-            # entity processor thread
-            t = threading.Thread(target=self._entity_processor,
-                                 name="entProc", args=())
-            t.daemon = True
-            t.start()
-
             # entity killer thread
 
             ekt = threading.Thread(target=self._entity_thinner,
@@ -133,13 +273,54 @@ class EntityControl(object):
             @:type Dict
 
         """
+        partition = self.clients.get(playername)
+        if not partition:
+            return []
+        ents = []
+        for entity in list(partition.entities.values()):
+            about = entity.about_entity()
+            if about:
+                ents.append(about)
+        return ents
+
+    def countEntityTypesInPlayer(self, playername):
+        """
+        Returns a dictionary of entity names and how many of each
+        are in the player's client.
+
+            :sample:
+                .. code:: python
+
+                    {"Cow": 12, "Zombie": 3, "Item": 40}
+
+                ..
+
+        """
+        partition = self.clients.get(playername)
+        if not partition:
+            return {}
+        return dict(partition.counts)
+
+    def getEntitiesInRadius(self, playername, position, radius):
+        """
+        Returns a list of entity info dictionaries (see
+        getEntityInfo) for the entities in the player's client that
+        are within `radius` blocks (horizontal distance) of position.
+
+        :Args:
+            :playername: the player whose client is searched.
+            :position: (x, y, z) center of the search.
+            :radius: search radius in blocks.
+
+        """
+        partition = self.clients.get(playername)
+        if not partition:
+            return []
         ents = []
-        entities = self.entities
-        for v in iter(entities.values()):
-            if v.clientname == playername:
-                about = v.about_entity
-                if about:
-                    ents.append(about())
+        for entity in partition.nearby(position, radius):
+            about = entity.about_entity()
+            if about:
+                ents.append(about)
         return ents
 
     def getEntityInfo(self, eid):
@@ -226,32 +407,140 @@ class EntityControl(object):
 
                             """
 
-    def _entity_processor(self):
-        self._log.debug("_entityprocessor thread started.")
-        timer = float(0)
-        # server is running
-        while self.srvr_data.state in (1, 2, 4) and not self._abortep:
-            timer += .1
-            sleep(.1)
-            # timer for removing stale entities we want a FAST response
-            # to server shutdowns (activate while loop frequently)
-            if timer < float(self.entityProcessorFrequency):
+    # Index maintenance - called by parse_cb as packets arrive.
+
+    def addentity(self, clientname, eid, uuid, entitytype, entityname,
+                  position, look, isobject):
+        """ track a newly spawned entity in a client. """
+        entity = self.store.add(eid, uuid, entitytype, entityname,
+                                position, look, isobject, clientname)
+        if clientname not in self.clients:
+            self.clients[clientname] = ClientEntities(clientname)
+        replaced = self.clients[clientname].add(entity)
+        self.entities[eid] = entity
+        if replaced:
+            self.store.release(replaced)
+        return entity
+
+    def getcliententity(self, clientname, eid):
+        """ The Entity with this eid in the client, or None. """
+        partition = self.clients.get(clientname)
+        if partition:
+            return partition.entities.get(eid)
+        return None
+
+    def moveentity(self, clientname, eid, delta):
+        """ apply a relative move packet (fixed point deltas). """
+        partition = self.clients.get(clientname)
+        if not partition:
+            return
+        entity = partition.entities.get(eid)
+        if entity:
+            entity.move_relative(delta)
+            partition.moved(eid)
+
+    def teleportentity(self, clientname, eid, position):
+        """ apply a teleport packet (fixed point position). """
+        partition = self.clients.get(clientname)
+        if not partition:
+            return
+        entity = partition.entities.get(eid)
+        if entity:
+            entity.teleport(position)
+            partition.moved(eid)
+
+    def removeentity(self, clientname, eid):
+        """ forget an entity destroyed in a client. """
+        partition = self.clients.get(clientname)
+        if not partition:
+            return
+        entity = partition.remove(eid)
+        if entity:
+            self._forget(eid, entity)
+
+    # Entity culling - spawns beyond a client's cull radius, or over
+    # its per-type cap, are held back by the proxy (with the packets
+    # that follow them) and replayed once the player comes in range
+    # or enough entities of that type are destroyed.
+
+    def cullspawn(self, clientname, entity, playerposition, payload):
+        """ decide whether a tracked entity's spawn packet (payload)
+        is held back.  Returns True if it was. """
+        partition = self.clients.get(clientname)
+        if not partition:
+            return False
+        if not self._inrange(entity, playerposition) or (
+                self.cullcap and partition.visible(
+                    entity.entityname) > self.cullcap):
+            partition.hide(entity, payload)
+            return True
+        return False
+
+    def culledpacket(self, clientname, eid, payload=None):
+        """ True if the eid's spawn was held back (so the packet about
+        it must be too).  A payload given is kept to be replayed with
+        the spawn (entity metadata, equipment...). """
+        partition = self.clients.get(clientname)
+        if not partition or eid not in partition.hidden:
+            return False
+        if payload is not None:
+            packets = partition.hidden[eid]
+            packets.append(payload)
+            if len(packets) > CULL_KEEP_PACKETS:
+                # keep the spawn itself
+                del packets[1]
+        return True
+
+    def revealentities(self, clientname, playerposition, force=False):
+        """ Held back entities that are now in range (and under the
+        type cap).  Checked at most every CULL_CHECK_INTERVAL seconds
+        unless forced.
+
+        :returns: [(Entity, [raw packets to send]), ...]
+        """
+        partition = self.clients.get(clientname)
+        if not partition or not partition.hidden:
+            return []
+        now = time()
+        if not force and now - partition.lastreveal < CULL_CHECK_INTERVAL:
+            return []
+        partition.lastreveal = now
+        revealed = []
+        for eid in list(partition.hidden):
+            entity = partition.entities[eid]
+            if not self._inrange(entity, playerposition):
                 continue
-            timer = float(0)
+            if self.cullcap and partition.visible(
+                    entity.entityname) >= self.cullcap:
+                continue
+            revealed.append((entity, partition.unhide(eid)))
+        return revealed
 
-            # start looking for stale client entities
-            playerlist = []
-            for player in self.srvr_data.clients:
-                playerlist.append(player.username)
-            entity_eids = list(self.entities.keys())
-            for eid in entity_eids:
-                if self.getEntityByEID(eid).clientname not in playerlist:
-                    # noinspection PyBroadException
-                    try:
-                        self.entities.pop(eid, None)
-                    except:
-                        pass
-        self._log.debug("_entityprocessor thread closed.")
+    def _inrange(self, entity, playerposition):
+        if not self.cullradius:
+            return True
+        x, y, z = entity.position
+        dx = x - playerposition[0]
+        dz = z - playerposition[2]
+        return dx * dx + dz * dz <= self.cullradius * self.cullradius
+
+    def removeclient(self, clientname):
+        """ forget every entity in a client's world. """
+        partition = self.clients.pop(clientname, None)
+        if not partition:
+            return
+        for eid, entity in list(partition.entities.items()):
+            self._forget(eid, entity)
+
+    def _forget(self, eid, entity):
+        if self.entities.get(eid) is entity:
+            del self.entities[eid]
+            # another client may still be tracking this eid
+            for other in list(self.clients.values()):
+                if eid in other.entities:
+                    self.entities[eid] = other.entities[eid]
+                    break
+        self.store.release(entity)
 
     # each entity IS a dictionary, so...
     # noinspection PyTypeChecker
@@ -279,18 +568,14 @@ class EntityControl(object):
             # loop through playerlist
             for playerclient in playerlist:
                 players_position = playerclient.position
-                his_entities = self.countEntitiesInPlayer(playerclient.username)
-                if len(his_entities) < self.startThinningThreshshold:
+                partition = self.clients.get(playerclient.username)
+                if not partition or len(
+                        partition.entities) < self.startThinningThreshshold:
                     # don't worry with this player, his load is light.
                     continue
 
-                # now we need to count each entity type
-                counts = {}
-                for entity in his_entities:
-                    if entity["name"] in counts:
-                        counts[entity["name"]] += 1
-                    else:
-                        counts[entity["name"]] = 1  # like {"Cow": 1}
+                # like {"Cow": 1}
+                counts = dict(partition.counts)
 
                 for mob_type in counts:
                     if "thin-%s" % mob_type in self.ent_config:
@@ -376,3 +376,15 @@ class Packets(object):
             # -Open sign editor
             # -Ping values has new info
             # -Display scoreboard has new info for team play
+
+
+# Packets instances are never changed after __init__, so a single
+# instance per protocol is shared by all clients, servers and players.
+_packets_by_protocol = {}
+
+
+def getpackets(protocol):
+    """Returns the shared Packets instance for `protocol`."""
+    if protocol not in _packets_by_protocol:
+        _packets_by_protocol[protocol] = Packets(protocol)
+    return _packets_by_protocol[protocol]
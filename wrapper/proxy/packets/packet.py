@@ -18,6 +18,7 @@ import sys
 
 # local
 from proxy.utils.mcuuid import MCUUID
+from utils.metrics import REGISTRY
 
 # Py3-2
 PY3 = sys.version_info > (3,)
@@ -57,6 +58,25 @@ _CODERS = {
     "rest": 90,
     "raw": 90
 }
+
+# side: "client" (the player's connection) or "server" (the proxy's
+#  connection to the server); direction: "in" (read) or "out" (sent)
+_PACKETS = REGISTRY.counter(
+    "wrapper_proxy_packets_total", "Packets through the proxy.",
+    ("side", "direction", "id"))
+_BYTES = REGISTRY.counter(
+    "wrapper_proxy_bytes_total", "Packet bytes through the proxy (as on the "
+    "wire, before encryption).", ("side", "direction", "id"))
+# compressed packets only; the ratio is compressed / uncompressed
+_COMPRESSED = REGISTRY.counter(
+    "wrapper_proxy_compressed_bytes_total", "Compressed bytes of the "
+    "compressed packets.", ("side", "direction"))
+_UNCOMPRESSED = REGISTRY.counter(
+    "wrapper_proxy_uncompressed_bytes_total", "Uncompressed bytes of the "
+    "compressed packets.", ("side", "direction"))
+_QUEUED = REGISTRY.histogram(
+    "wrapper_proxy_send_queue_depth", "Packets waiting in a send queue when "
+    "it is flushed.", ("side",), buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
 # endregion
 
 
@@ -69,6 +89,8 @@ class Packet(object):
         self.sendCipher = None
         self.compressThreshold = -1
         self.abort = False
+        # "client" or "server" - which connection this is, for the metrics
+        self.side = "other"
 
         # this is set by the calling class/method.  Not presently used here,
         #  but could be. maybe to decide which metadata parser to use?
@@ -166,6 +188,8 @@ class Packet(object):
 
     def grabpacket(self):
         length = self.unpack_varint()  # first field - entire raw packet Length
+        # the whole frame, with its length field
+        wirelength = length + len(self.pack_varint(length))
         datalength = 0  # if 0, an uncompressed packet
         if self.compressThreshold != -1:  # if compressed:
             # length of the uncompressed (Packet ID + Data)
@@ -177,9 +201,14 @@ class Packet(object):
 
         if datalength > 0:  # it is compressed, unpack it
             payload = zlib.decompress(payload)
+            _COMPRESSED.labels(self.side, "in").inc(length)
+            _UNCOMPRESSED.labels(self.side, "in").inc(len(payload))
 
         self.buffer = io.BytesIO(payload)
         pkid = self.read_varint()
+        pktlabel = "0x%02x" % pkid
+        _PACKETS.labels(self.side, "in", pktlabel).inc()
+        _BYTES.labels(self.side, "in", pktlabel).inc(wirelength)
 
         # payload is untouched entire packet, containing the prefixed pkid
         return pkid, payload
@@ -213,19 +242,26 @@ class Packet(object):
         self.compressThreshold = threshold
 
     def flush(self):
+        if self.queue:
+            _QUEUED.labels(self.side).observe(len(self.queue))
         while len(self.queue) > 0:
             packet_tuple = self.queue.pop(0)
             packet = packet_tuple[1]
+            pktlabel = "0x%02x" % _packetid(packet)
             if packet_tuple[0] > -1:
                 if len(packet) > self.compressThreshold:
-                    pktcomp = self.pack_varint(len(packet)) + zlib.compress(
-                        packet)
+                    compressed = zlib.compress(packet)
+                    _COMPRESSED.labels(self.side, "out").inc(len(compressed))
+                    _UNCOMPRESSED.labels(self.side, "out").inc(len(packet))
+                    pktcomp = self.pack_varint(len(packet)) + compressed
                     packet = self.pack_varint(len(pktcomp)) + pktcomp
                 else:
                     packet = self.pack_varint(0) + packet
                     packet = self.pack_varint(len(packet)) + packet
             else:
                 packet = self.pack_varint(len(packet)) + packet
+            _PACKETS.labels(self.side, "out", pktlabel).inc()
+            _BYTES.labels(self.side, "out", pktlabel).inc(len(packet))
             if self.sendCipher is None:
                 self.socket.send(packet)
             else:
@@ -865,3 +901,16 @@ class Packet(object):
 
     def read_ulong(self):  # unused ...?
         return struct.unpack(">Q", self.read_data(8))[0]
+
+
+def _packetid(data):
+    """the packet id (varint) at the start of an uncompressed packet."""
+    total = 0
+    shift = 0
+    # Py3-2: bytes index to int in py3 only
+    for byte in bytearray(data[:5]):
+        total |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return total
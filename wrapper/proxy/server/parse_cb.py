@@ -7,7 +7,6 @@
 
 import json
 
-from proxy.entity.entitybasics import Entity
 from proxy.utils.constants import *
 
 # Py3-2
@@ -297,6 +296,9 @@ class ParseCB(object):
         # "int:dimension|ubyte:difficulty|ubyte:gamemode|level_type:string")
         self.client.gamemode = data[2]
         self.client.dimension = data[0]
+        # the client discards all its entities on respawn
+        if self.ent_control:
+            self.ent_control.removeclient(self.client.username)
         return True
 
     def parse_play_change_game_state(self):
@@ -322,6 +324,11 @@ class ParseCB(object):
             self.proxy.srv_data.timeofday = data[1]
         except:
             pass
+        if self.proxy.srv_data.tickmonitor:
+            self.proxy.srv_data.tickmonitor.timeupdate(data[0])
+        # a once a second chance to replay culled entity spawns
+        if self.ent_control and self.ent_control.culling:
+            self._revealentities()
         return True
 
     # Window processing/ inventory tracking
@@ -398,11 +405,10 @@ class ParseCB(object):
         if dt[2] in self.ent_control.objecttypes:
             objectname = self.ent_control.objecttypes[
                 dt[2]]
-            newobject = {dt[0]: Entity(dt[0], entityuuid, dt[2], objectname,
-                                       (dt[3], dt[4], dt[5],), (dt[6], dt[7]),
-                                       True, self.client.username)}
-
-            self.ent_control.entities.update(newobject)
+            entity = self.ent_control.addentity(
+                self.client.username, dt[0], entityuuid, dt[2], objectname,
+                (dt[3], dt[4], dt[5],), (dt[6], dt[7]), True)
+            return not self._cullspawn(entity)
         return True
 
     def parse_play_spawn_mob(self):
@@ -433,29 +439,34 @@ class ParseCB(object):
         if dt[2] in self.ent_control.entitytypes:
             mobname = self.ent_control.entitytypes[
                 dt[2]]["name"]
-            newmob = {dt[0]: Entity(dt[0], entityuuid, dt[2], mobname,
-                                    (dt[3], dt[4], dt[5],),
-                                    (dt[6], dt[7], dt[8]),
-                                    False, self.client.username)}
-
-            self.ent_control.entities.update(newmob)
+            entity = self.ent_control.addentity(
+                self.client.username, dt[0], entityuuid, dt[2], mobname,
+                (dt[3], dt[4], dt[5],), (dt[6], dt[7], dt[8]), False)
+            return not self._cullspawn(entity)
         return True
 
     def parse_play_entity_relative_move(self):
+        # also parses ENTITY_LOOK_AND_RELATIVE_MOVE (same leading fields)
         if not self.ent_control:
             return True
         if self.server.version < PROTOCOL_1_8START:  # 1.7.10 - 1.7.2
             data = self.packet.readpkt([INT, BYTE, BYTE, BYTE])
-
-        # FutureVersion > elif self.version > mcpacket.PROTOCOL_1_7_9:  1.8 ++
-        else:
+        elif self.server.version < PROTOCOL_1_9START:
             data = self.packet.readpkt([VARINT, BYTE, BYTE, BYTE])
-        # ("varint:eid|byte:dx|byte:dy|byte:dz")
+        else:
+            data = self.packet.readpkt([VARINT, SHORT, SHORT, SHORT])
+        # ("varint:eid|byte:dx|byte:dy|byte:dz") - 1/32 block before 1.9
+        # ("varint:eid|short:dx|short:dy|short:dz") - 1/4096 block 1.9+
+        if self.server.version < PROTOCOL_1_9START:
+            delta = (data[1] * 128, data[2] * 128, data[3] * 128)
+        else:
+            delta = (data[1], data[2], data[3])
 
-        entupd = self.ent_control.getEntityByEID(
-            data[0])
-        if entupd:
-            entupd.move_relative((data[1], data[2], data[3]))
+        self.ent_control.moveentity(self.client.username, data[0], delta)
+        if self.ent_control.culling:
+            if self.ent_control.culledpacket(self.client.username, data[0]):
+                return False
+            self._revealentities()
         return True
 
     def parse_play_entity_teleport(self):
@@ -472,12 +483,39 @@ class ParseCB(object):
 
         # ("varint:eid|int:x|int:y|int:z|byte:yaw|byte:pitch")
 
-        entupd = self.ent_control.getEntityByEID(
-            data[0])
-        if entupd:
-            entupd.teleport((data[1], data[2], data[3]))
+        self.ent_control.teleportentity(
+            self.client.username, data[0], (data[1], data[2], data[3]))
+        if self.ent_control.culling:
+            if self.ent_control.culledpacket(self.client.username, data[0]):
+                return False
+            self._revealentities()
         return True
 
+    def parse_play_entity_update(self):
+        """ look, velocity and other transient entity packets; only
+        parsed when entity culling is on. """
+        if self.server.version < PROTOCOL_1_8START:
+            eid = self.packet.readpkt([INT])[0]
+        else:
+            eid = self.packet.readpkt([VARINT])[0]
+        return not self.ent_control.culledpacket(self.client.username, eid)
+
+    def parse_play_entity_status(self):
+        # the eid is an INT in every version
+        eid = self.packet.readpkt([INT])[0]
+        return not self.ent_control.culledpacket(self.client.username, eid)
+
+    def parse_play_entity_state(self):
+        """ metadata, equipment, effects... - held back with a culled
+        entity and replayed after its spawn.  Only parsed when entity
+        culling is on. """
+        if self.server.version < PROTOCOL_1_8START:
+            eid = self.packet.readpkt([INT])[0]
+        else:
+            eid = self.packet.readpkt([VARINT])[0]
+        return not self.ent_control.culledpacket(
+            self.client.username, eid, self.packet.buffer.getvalue())
+
     def parse_play_attach_entity(self):
         if not self.ent_control:
             return True
@@ -549,8 +587,8 @@ class ParseCB(object):
                                self.client.username, vehormobeid)
                 if not self.ent_control:
                     return
-                entupd = self.ent_control.getEntityByEID(
-                    vehormobeid)
+                entupd = self.ent_control.getcliententity(
+                    self.client.username, vehormobeid)
                 if entupd:
                     self.client.riding = entupd
                     entupd.rodeBy = self.client
@@ -558,13 +596,9 @@ class ParseCB(object):
 
     def parse_play_destroy_entities(self):
         # Get rid of dead entities so that python can GC them.
-        # TODO - not certain this works correctly (errors -
-        # eids not used and too broad exception)
         if not self.ent_control:
             return True
 
-        # noinspection PyUnusedLocal
-        eids = []  # todo what was this for??
         if self.server.version < PROTOCOL_1_8START:
             # make sure we get iterable integer
             entitycount = bytearray(self.packet.readpkt([BYTE])[0])[0]
@@ -577,8 +611,52 @@ class ParseCB(object):
 
         for _ in range(entitycount):
             eid = self.packet.readpkt(parser)[0]
-            # noinspection PyBroadException
-            if eid in self.ent_control.entities:
-                self.ent_control.entities.pop(eid, None)
+            self.ent_control.removeentity(self.client.username, eid)
 
+        # room under the type cap for held back spawns
+        if self.ent_control.culling:
+            self._revealentities(True)
         return True
+
+    # Entity culling
+
+    def _cullspawn(self, entity):
+        """ True if the spawn packet being parsed is held back. """
+        if not self.ent_control.culling:
+            return False
+        return self.ent_control.cullspawn(
+            self.client.username, entity, self.client.position,
+            self.packet.buffer.getvalue())
+
+    def _revealentities(self, force=False):
+        """ send the held back spawns that are now in range, each
+        followed by its held back packets and a teleport to where the
+        entity is now. """
+        for entity, packets in self.ent_control.revealentities(
+                self.client.username, self.client.position, force):
+            for payload in packets:
+                self.client.packet.send_raw(payload)
+            x, y, z = entity.position
+            look = entity.look
+            # objects spawn with (pitch, yaw), mobs with (yaw, pitch..)
+            if entity.isObject:
+                yaw, pitch = look[1], look[0]
+            else:
+                yaw, pitch = look[0], look[1]
+            if self.server.version < PROTOCOL_1_8START:
+                self.client.packet.sendpkt(
+                    self.pktCB.ENTITY_TELEPORT,
+                    [INT, INT, INT, INT, BYTE, BYTE],
+                    (entity.eid, int(x * 32), int(y * 32), int(z * 32),
+                     yaw, pitch))
+            elif self.server.version < PROTOCOL_1_9START:
+                self.client.packet.sendpkt(
+                    self.pktCB.ENTITY_TELEPORT,
+                    [VARINT, INT, INT, INT, BYTE, BYTE, BOOL],
+                    (entity.eid, int(x * 32), int(y * 32), int(z * 32),
+                     yaw, pitch, False))
+            else:
+                self.client.packet.sendpkt(
+                    self.pktCB.ENTITY_TELEPORT,
+                    [VARINT, DOUBLE, DOUBLE, DOUBLE, BYTE, BYTE, BOOL],
+                    (entity.eid, x, y, z, yaw, pitch, False))
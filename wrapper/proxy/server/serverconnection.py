@@ -71,8 +71,8 @@ class ServerConnection(object):
         """Get serverversion for mcpackets use"""
 
         self.version = self.proxy.srv_data.protocolVersion
-        self.pktSB = mcpackets_sb.Packets(self.version)
-        self.pktCB = mcpackets_cb.Packets(self.version)
+        self.pktSB = mcpackets_sb.getpackets(self.version)
+        self.pktCB = mcpackets_cb.getpackets(self.version)
         self.parse_cb = ParseCB(self, self.packet)
         self._define_parsers()
 
@@ -102,6 +102,7 @@ class ServerConnection(object):
 
         # start packet handler
         self.packet = Packet(self.server_socket, self)
+        self.packet.side = "server"
         self.packet.version = self.client.clientversion
 
         # define parsers
@@ -125,6 +126,10 @@ class ServerConnection(object):
         self.abort = True
         time.sleep(0.1)
 
+        # the client's view of this server's entities is gone.
+        if self.entity_controls and self.proxy.entity_control:
+            self.proxy.entity_control.removeclient(self.client.username)
+
         # noinspection PyBroadException
         try:
             self.server_socket.shutdown(2)
@@ -314,3 +319,21 @@ class ServerConnection(object):
                 self.pktCB.ATTACH_ENTITY] = self.parse_cb.parse_play_attach_entity
             self.parsers[PLAY][
                 self.pktCB.DESTROY_ENTITIES] = self.parse_cb.parse_play_destroy_entities
+            self.parsers[PLAY][
+                self.pktCB.ENTITY_LOOK_AND_RELATIVE_MOVE] = self.parse_cb.parse_play_entity_relative_move
+
+            # entity culling holds back the packets of entities whose
+            # spawns it held back.
+            if self.proxy.entity_control and self.proxy.entity_control.culling:
+                for pkid in (self.pktCB.ENTITY, self.pktCB.ENTITY_LOOK,
+                             self.pktCB.ENTITY_HEAD_LOOK,
+                             self.pktCB.ENTITY_VELOCITY):
+                    self.parsers[PLAY][pkid] = self.parse_cb.parse_play_entity_update
+                for pkid in (self.pktCB.ENTITY_METADATA[PKT],
+                             self.pktCB.ENTITY_EQUIPMENT,
+                             self.pktCB.ENTITY_EFFECT,
+                             self.pktCB.REMOVE_ENTITY_EFFECT,
+                             self.pktCB.ENTITY_PROPERTIES):
+                    self.parsers[PLAY][pkid] = self.parse_cb.parse_play_entity_state
+                self.parsers[PLAY][
+                    self.pktCB.ENTITY_STATUS] = self.parse_cb.parse_play_entity_status
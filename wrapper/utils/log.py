@@ -5,17 +5,44 @@
 # This program is distributed under the terms of the GNU
 # General Public License, version 3 or later.
 
+import atexit
 import json
 import os
 import logging
+import logging.handlers
+import re
+import threading
+import time
 from logging.config import dictConfig
 
 # noinspection PyProtectedMember
 from api.helpers import mkdir_p, _use_style
+from utils.logarchive import ARCHIVER, LineClock, INDEX_SUFFIX
+from utils.metrics import REGISTRY
+
+# Py3-2
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import Queue as queue
+
+# records waiting to be written; beyond this, new ones are dropped
+QUEUE_SIZE = 10000
+
+# seconds an ERROR record waits for room in a full queue before it
+#  is dropped too
+ERROR_WAIT = 1.0
+
+_DROPPED = REGISTRY.counter(
+    "wrapper_log_records_dropped_total", "Log records dropped because the "
+    "log queue was full.", ("level",))
 
 DEFAULT = {
-    "wrapperversion": 1.2,
+    "wrapperversion": 1.3,
     "version": 1,
+    # records queued for the log writer thread (see QueueHandler)
+    "queuesize": QUEUE_SIZE,
     "disable_existing_loggers": False,
     "formatters": {
         "standard": {
@@ -44,6 +71,7 @@ DEFAULT = {
             "filename": "logs/wrapper/wrapper.log",
             "maxBytes": 10485760,
             "backupCount": 20,
+            "daily": True,
             "encoding": "utf8"
         },
         "error_file_handler": {
@@ -54,6 +82,7 @@ DEFAULT = {
             "filename": "logs/wrapper/wrapper.errors.log",
             "maxBytes": 10485760,
             "backupCount": 20,
+            "daily": True,
             "encoding": "utf8"
         }
     },
@@ -64,13 +93,20 @@ DEFAULT = {
 }
 
 
+# the running LogListener
+_listener = None
+
+
 def configure_logger(betterconsole=False):
     loadconfig(betterconsole=betterconsole)
     logging.getLogger()
 
 
 def loadconfig(betterconsole=False, configfile="logging.json"):
+    # write out what the last configuration still has queued
+    stopqueue()
     dictConfig(DEFAULT)  # Load default config
+    queuesize = DEFAULT["queuesize"]
     try:
         if os.path.isfile(configfile):
             with open(configfile, "r") as f:
@@ -91,6 +127,7 @@ def loadconfig(betterconsole=False, configfile="logging.json"):
                         # go up one line to print - '^[1A' (in hex ASCII)
                         "\x1b\x5b\x31\x41%s\r\n" % readcurrent)
                 dictConfig(conf)
+                queuesize = conf.get("queuesize", queuesize)
                 logging.info("Logging configuration file (%s) located and "
                              "loaded, logging configuration set!", configfile)
         else:
@@ -100,6 +137,149 @@ def loadconfig(betterconsole=False, configfile="logging.json"):
                             "configuration", configfile)
     except Exception as e:
         logging.exception("Unable to load or create %s! (%s)", configfile, e)
+    startqueue(queuesize)
+
+
+def startqueue(queuesize=QUEUE_SIZE):
+    """
+    Move the root logger's handlers behind a QueueHandler, so logging
+    threads (the proxy's packet loops, the console reader) only queue
+    records and a LogListener thread formats and writes them.  A slow
+    or stalled log volume then costs dropped log records instead of
+    stalled threads.
+
+    The root logger's level is raised to the lowest of its handlers'
+    levels, so records no handler would write (debug, usually) are
+    turned away by the logger before a record is even made.
+    """
+    global _listener
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if not handlers:
+        return
+    lowest = min(handler.level for handler in handlers)
+    queuehandler = QueueHandler(queue.Queue(max(1, queuesize)))
+    queuehandler.setLevel(lowest)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(queuehandler)
+    if root.level == logging.NOTSET:
+        root.setLevel(lowest)
+    _listener = LogListener(queuehandler, handlers)
+    _listener.start()
+
+
+def filehandlers():
+    """ the WrapperHandlers the logs are written with. """
+    handlers = _listener.handlers if _listener else logging.getLogger().handlers
+    return [handler for handler in handlers if isinstance(handler, WrapperHandler)]
+
+
+def stopqueue():
+    """ Write out the queued records and stop the LogListener. """
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(listener.queuehandler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+    listener.stop()
+
+
+atexit.register(stopqueue)
+
+
+class QueueHandler(logging.Handler):
+    """
+    Puts records on a bounded queue for the LogListener.  When the
+    queue is full the record is dropped and counted (ERROR and above
+    first wait up to ERROR_WAIT seconds for room).
+
+    The message is merged with its arguments here, so later changes
+    to mutable arguments do not show in the log; everything else
+    (formatting, styling, tracebacks, I/O) happens on the listener.
+    """
+
+    def __init__(self, records):
+        logging.Handler.__init__(self)
+        self.records = records
+        # records dropped so far
+        self.dropped = 0
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.levelno >= logging.ERROR:
+                self.records.put(record, timeout=ERROR_WAIT)
+            else:
+                self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            _DROPPED.labels(record.levelname).inc()
+        except Exception:
+            self.handleError(record)
+
+
+class LogListener(object):
+    """
+    The thread that takes records off a QueueHandler's queue and
+    passes them to the real handlers (each still applies its own
+    level and filters).  Drops are reported in the log once the
+    queue has drained.
+    """
+
+    def __init__(self, queuehandler, handlers):
+        self.queuehandler = queuehandler
+        self.records = queuehandler.records
+        self.handlers = handlers
+        # drops already reported
+        self.reported = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="LogListener", args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # the sentinel queues behind the records still waiting
+        try:
+            self.records.put(None, timeout=5)
+        except queue.Full:
+            # the handlers are stuck; leave the rest
+            return
+        self._thread.join(5)
+
+    def _run(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                self._reportdrops()
+                return
+            self.handle(record)
+            if self.records.empty():
+                self._reportdrops()
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _reportdrops(self):
+        dropped = self.queuehandler.dropped
+        if dropped == self.reported:
+            return
+        self.handle(logging.makeLogRecord({
+            "name": __name__,
+            "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": "%d log records were dropped; the log queue was full"
+                   % (dropped - self.reported)
+        }))
+        self.reported = dropped
 
 
 class ColorFormatter(logging.Formatter):
@@ -107,40 +287,111 @@ class ColorFormatter(logging.Formatter):
      (bold, italic, etc) and output based on logging level."""
     def __init__(self, *args, **kwargs):
         super(ColorFormatter, self).__init__(*args, **kwargs)
-
-    # noinspection PyUnusedLocal
-    def format(self, record):
-        args = record.args
-        msg = record.msg
-
+        # {level: "<ANSI codes>%s<reset>"}, built once
+        self.styles = {}
         # Only style on *nix since windows doesn't support ANSI
         if os.name in ("posix", "mac"):
-            if record.levelno == logging.INFO:
-                info_style = _use_style(foreground="green")
-                msg = info_style(msg)
-            elif record.levelno == logging.DEBUG:
-                debug_style = _use_style(foreground="cyan")
-                msg = debug_style(msg)
-            elif record.levelno == logging.WARNING:
-                warn_style = _use_style(foreground="yellow", options=("bold",))
-                msg = warn_style(msg)
-            elif record.levelno == logging.ERROR:
-                error_style = _use_style(foreground="red", options=("bold",))
-                msg = error_style(msg)
-            elif record.levelno == logging.CRITICAL:
-                crit_style = _use_style(foreground="black", background="red",
-                                        options=("bold",))
-                msg = crit_style(msg)
-
-        record.msg = msg
-
-        return super(ColorFormatter, self).format(record)
+            self.styles = {
+                logging.INFO: _use_style(foreground="green")("%s"),
+                logging.DEBUG: _use_style(foreground="cyan")("%s"),
+                logging.WARNING: _use_style(foreground="yellow", options=("bold",))("%s"),
+                logging.ERROR: _use_style(foreground="red", options=("bold",))("%s"),
+                logging.CRITICAL: _use_style(foreground="black", background="red",
+                                             options=("bold",))("%s")
+            }
+
+    def format(self, record):
+        style = self.styles.get(record.levelno)
+        if style is None:
+            return super(ColorFormatter, self).format(record)
+        # style a copy; the file handlers get the record unstyled
+        styled = logging.makeLogRecord(record.__dict__)
+        styled.msg = style % record.getMessage()
+        styled.args = None
+        return super(ColorFormatter, self).format(styled)
 
 
 # noinspection PyPep8Naming,PyUnresolvedReferences
 class WrapperHandler(logging.handlers.RotatingFileHandler):
+    """
+    A log file rotated when it reaches maxBytes or, with daily, at the
+    first record of a new day.  A rotated file is renamed with the
+    time ("wrapper.2017-05-01-123456.log") and compressed in the
+    background to an indexed archive (see utils.logarchive) - the
+    newest backupCount archives are kept.
+    """
+
     def __init__(self, filename, mode='a', maxBytes=0,
-                 backupCount=0, encoding=None, delay=0):
+                 backupCount=0, encoding=None, delay=0, daily=False):
         mkdir_p(os.path.dirname(filename))
         super(WrapperHandler, self).__init__(filename, mode, maxBytes,
                                              backupCount, encoding, delay)
+        self.daily = daily
+        if os.path.exists(self.baseFilename):
+            self.day = time.strftime("%Y-%m-%d", time.localtime(os.path.getmtime(self.baseFilename)))
+        else:
+            self.day = time.strftime("%Y-%m-%d")
+        self.stem, self.ext = os.path.splitext(self.baseFilename)
+        # "<stem>.<yyyy-mm-dd-hhmmss><ext>[.gz]"
+        self.rotatedname = re.compile(r"%s\.\d{4}-\d\d-\d\d-\d{6}%s(\.gz)?$" % (
+            re.escape(os.path.basename(self.stem)), re.escape(self.ext)))
+        # numbered backups of the plain size rotation ("wrapper.log.1")
+        number = 1
+        while os.path.exists("%s.%d" % (self.baseFilename, number)):
+            old = "%s.%d" % (self.baseFilename, number)
+            os.rename(old, self._freename(os.path.getmtime(old)))
+            number += 1
+        # rotated files a restart left uncompressed
+        for rotated in self._rotated(archived=False):
+            self._archive(rotated)
+
+    def shouldRollover(self, record):
+        if self.daily and time.strftime("%Y-%m-%d") != self.day:
+            return 1
+        return super(WrapperHandler, self).shouldRollover(record)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            rotated = self._freename(time.time())
+            os.rename(self.baseFilename, rotated)
+            self._archive(rotated)
+        self.day = time.strftime("%Y-%m-%d")
+        if not self.delay:
+            self.stream = self._open()
+
+    def archives(self):
+        """ paths of this log's archives, oldest first. """
+        return self._rotated(archived=True)
+
+    def _freename(self, when):
+        """ the rotated name for a time (a second later if taken). """
+        while True:
+            rotated = "%s.%s%s" % (self.stem, time.strftime("%Y-%m-%d-%H%M%S", time.localtime(when)),
+                                   self.ext)
+            if not os.path.exists(rotated) and not os.path.exists(rotated + ".gz"):
+                return rotated
+            when += 1
+
+    def _rotated(self, archived):
+        folder = os.path.dirname(self.baseFilename)
+        found = []
+        for name in os.listdir(folder):
+            match = self.rotatedname.match(name)
+            if match and bool(match.group(1)) == archived:
+                found.append(os.path.join(folder, name))
+        # the time in the names sorts them
+        return sorted(found)
+
+    def _archive(self, rotated):
+        ARCHIVER.archive(rotated, rotated + ".gz", LineClock(), self._prune)
+
+    def _prune(self, archive):
+        if self.backupCount < 1:
+            return
+        for old in self.archives()[:-self.backupCount]:
+            for path in (old, old + INDEX_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+"""
+Compressed, indexed log archives.
+
+An archive is an ordinary .gz file (zcat and zgrep read it), written
+as a series of gzip members of about BLOCK_SIZE uncompressed bytes
+each.  Next to it, "<archive>.idx" holds one line per member:
+
+    <first time> <last time> <offset> <length>
+
+(epoch seconds of its first and last timestamped line, and where the
+member starts in the .gz and how long it is), so a search for a time
+range only decompresses the members that overlap it.
+"""
+
+import errno
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+# Py3-2
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import Queue as queue
+
+# uncompressed bytes per gzip member (the unit a search decompresses)
+BLOCK_SIZE = 256 * 1024
+
+INDEX_SUFFIX = ".idx"
+
+_INDEX_HEADER = "# log archive index 1\n"
+
+# wrapper.log lines: "[2017-05-01 12:34:56] [...]"
+_FULL_STAMP = re.compile(r"^\[(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)\]")
+# server lines: "[12:34:56] [Server thread/INFO]:" (or "[12:34:56 INFO]:")
+_TIME_STAMP = re.compile(r"^\[(\d\d):(\d\d):(\d\d)[\] ]")
+# the date in a rotated server log's name ("2017-05-01-2.log.gz")
+_NAME_DATE = re.compile(r"(\d{4})-(\d\d)-(\d\d)")
+
+
+class LineClock(object):
+    """
+    Reads the time of log lines (local time, as epoch seconds).
+
+    Wrapper log lines carry the date.  Server log lines only carry the
+    time of day, so the clock is given the date of the file's last
+    line and counts the midnights the file passes - a time of day
+    earlier than the previous one - back from it (see prepare()).
+
+    :Args:
+        :enddate: (year, month, day) of a server log's last line; None
+         for wrapper logs.
+
+    """
+
+    def __init__(self, enddate=None):
+        self.enddate = enddate
+        # midnight of the current line's day
+        self._midnight = None
+        self._last = -1
+
+    def prepare(self, lines):
+        """ Count the midnights a server log passes (one pass over
+        its lines) so the first line's date is known. """
+        if self.enddate is None:
+            return
+        rollovers = 0
+        last = -1
+        for line in lines:
+            seconds = self._timeofday(line)
+            if seconds is None:
+                continue
+            if seconds < last:
+                rollovers += 1
+            last = seconds
+        year, month, day = self.enddate
+        self._midnight = time.mktime((year, month, day - rollovers, 0, 0, 0, 0, 0, -1))
+
+    def resync(self, stamp):
+        """ Continue from a known time (the first of an archive member). """
+        if self.enddate is None:
+            return
+        day = time.localtime(stamp)
+        self._midnight = time.mktime((day[0], day[1], day[2], 0, 0, 0, 0, 0, -1))
+        self._last = int(stamp - self._midnight)
+
+    def stamp(self, line):
+        """ the time of a line, or None if it has no timestamp. """
+        if self.enddate is None:
+            match = _FULL_STAMP.match(line)
+            if not match:
+                return None
+            return time.mktime(tuple(int(part) for part in match.groups()) + (0, 0, -1))
+        seconds = self._timeofday(line)
+        if seconds is None:
+            return None
+        if self._midnight is None:
+            self.prepare(())
+        if seconds < self._last:
+            # past midnight (mktime normalizes the day overflow)
+            day = time.localtime(self._midnight + 36 * 3600)
+            self._midnight = time.mktime((day[0], day[1], day[2], 0, 0, 0, 0, 0, -1))
+        self._last = seconds
+        return self._midnight + seconds
+
+    @staticmethod
+    def _timeofday(line):
+        match = _TIME_STAMP.match(line)
+        if not match:
+            return None
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def enddate(path):
+    """ (year, month, day) of the last line of a server log: the date
+    in a rotated log's name, else the date the file was last written. """
+    match = _NAME_DATE.search(os.path.basename(path))
+    if match:
+        return tuple(int(part) for part in match.groups())
+    return time.localtime(os.path.getmtime(path))[:3]
+
+
+def _readlines(path):
+    """ lines (text) of a plain or gzipped log file. """
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    opened = gzip.open(path, "rb") if gzipped else open(path, "rb")
+    try:
+        for line in opened:
+            yield line.decode("utf-8", "replace").rstrip("\r\n")
+    finally:
+        opened.close()
+
+
+def _compressblock(data):
+    # wbits 31 - a whole gzip member
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compressfile(source, target, clock):
+    """
+    Write the lines of `source` (plain or gzipped) to the archive
+    `target` and its index.  Both are written under temporary names
+    and renamed into place, so `target` may be `source` itself (to
+    index a gzipped server log).
+
+    :Args:
+        :clock: a LineClock for the file's kind of log.
+
+    """
+    if not os.path.exists(source):
+        raise IOError(errno.ENOENT, "No such file", source)
+    clock.prepare(_readlines(source))
+    temporary = "%s.tmp" % target
+    try:
+        _writearchive(source, temporary, clock)
+    except Exception:
+        for path in (temporary, temporary + INDEX_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    _replace(temporary, target)
+    _replace(temporary + INDEX_SUFFIX, target + INDEX_SUFFIX)
+
+
+def _writearchive(source, temporary, clock):
+    """ compressfile() under the temporary names. """
+    blocks = []
+    offset = 0
+    # lines without a timestamp (tracebacks) take the one before
+    previous = None
+    with open(temporary, "wb") as out:
+        pending = []
+        size = 0
+        first = last = None
+        for line in _readlines(source):
+            stamp = clock.stamp(line)
+            if stamp is None:
+                stamp = previous
+            previous = stamp
+            if stamp is not None:
+                if first is None:
+                    first = stamp
+                last = stamp
+            data = (line + "\n").encode("utf-8")
+            pending.append(data)
+            size += len(data)
+            if size >= BLOCK_SIZE:
+                member = _compressblock(b"".join(pending))
+                out.write(member)
+                blocks.append((first, last, offset, len(member)))
+                offset += len(member)
+                pending, size, first = [], 0, None
+        if pending:
+            member = _compressblock(b"".join(pending))
+            out.write(member)
+            blocks.append((first, last, offset, len(member)))
+    with open(temporary + INDEX_SUFFIX, "w") as out:
+        out.write(_INDEX_HEADER)
+        for first, last, start, length in blocks:
+            out.write("%d %d %d %d\n" % (-1 if first is None else first,
+                                         -1 if last is None else last, start, length))
+
+
+def _replace(source, target):
+    # os.rename does not replace on Windows (os.replace is py3 only)
+    if os.name == "nt" and os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+
+def readindex(path):
+    """ [(first time, last time, offset, length), ...] of an archive,
+    or None if it has no (readable) index. """
+    try:
+        with open(path + INDEX_SUFFIX) as f:
+            if f.readline() != _INDEX_HEADER:
+                return None
+            return [tuple(int(field) for field in line.split()) for line in f if line.strip()]
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def searchfile(path, clock, pattern=None, since=None, until=None):
+    """
+    Matching lines of one log file, oldest first, as (time, line).
+    An indexed archive is read member by member, skipping the members
+    outside [since, until]; other files (the live log) are read whole.
+
+    :Args:
+        :clock: a LineClock for the file's kind of log.
+        :pattern: compiled regex, or None for every line.
+        :since, until: epoch seconds bounds, or None.
+
+    """
+    index = readindex(path)
+    if index is None:
+        clock.prepare(_readlines(path))
+        members = [(-1, _readlines(path))]
+    else:
+        members = _members(path, index, since, until)
+    previous = None
+    for first, lines in members:
+        if first >= 0:
+            # the member's lines continue from its first time
+            clock.resync(first)
+            previous = first
+        for line in lines:
+            stamp = clock.stamp(line)
+            if stamp is None:
+                stamp = previous
+            previous = stamp
+            if stamp is not None:
+                if since is not None and stamp < since:
+                    continue
+                if until is not None and stamp > until:
+                    # later lines are later still
+                    return
+            if pattern is None or pattern.search(line):
+                yield stamp, line
+
+
+def _members(path, index, since, until):
+    """ (first time, lines) of the archive's members that overlap
+    [since, until]. """
+    with open(path, "rb") as f:
+        for first, last, offset, length in index:
+            if since is not None and 0 <= last < since:
+                continue
+            if until is not None and first > until:
+                return
+            f.seek(offset)
+            data = zlib.decompress(f.read(length), 31).decode("utf-8", "replace")
+            yield first, data.split("\n")[:-1]
+
+
+class Archiver(object):
+    """
+    The thread that compresses rotated logs, one at a time in the
+    order they are handed over, so the thread that rotated a log (the
+    log writer) never waits for it.
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        # sources queued and not yet done
+        self.pending = set()
+        self.log = logging.getLogger("LogArchive")
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def archive(self, source, target, clock, callback=None):
+        """
+        Queue `source` to be compressed to the archive `target`.  A
+        plain source is removed once archived.  The source stays until
+        then, so logs a restart interrupted can be queued again.  A
+        source already queued (each logging configuration loaded makes
+        its own handlers) is not queued twice.
+
+        :Args:
+            :clock: a LineClock for the file's kind of log.
+            :callback: called with `target` when it is written.
+
+        """
+        with self._lock:
+            if source in self.pending:
+                return
+            self.pending.add(source)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="LogArchiver", args=())
+                self._thread.daemon = True
+                self._thread.start()
+        self.jobs.put((source, target, clock, callback))
+
+    def _run(self):
+        while True:
+            source, target, clock, callback = self.jobs.get()
+            # noinspection PyBroadException
+            try:
+                compressfile(source, target, clock)
+                if source != target:
+                    os.remove(source)
+            except Exception as e:
+                self.log.warning("Could not archive %s: %s", source, e)
+                continue
+            finally:
+                with self._lock:
+                    self.pending.discard(source)
+            if callback:
+                # noinspection PyBroadException
+                try:
+                    callback(target)
+                except Exception as e:
+                    self.log.warning("Error after archiving %s: %s", source, e)
+
+
+ARCHIVER = Archiver()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016, 2017 - BenBaptist and Wrapper.py developer(s).
+# https://github.com/benbaptist/minecraft-wrapper
+# This program is distributed under the terms of the GNU
+# General Public License, version 3 or later.
+
+import threading
+
+# upper bounds (seconds) of the default Histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the Content-Type of exposition()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric(object):
+    """
+    Base of the metric types.  A metric without labelnames holds its
+    own value; one with labelnames holds a child of its own type per
+    combination of label values (see labels()).
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # {label values: child}
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """the child for these label values (in labelnames order),
+        created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("%s takes labels %s" % (self.name, self.labelnames))
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._newchild()
+                    self._children[values] = child
+        return child
+
+    def _newchild(self):
+        return self.__class__(self.name, self.documentation)
+
+    def samples(self):
+        """[(suffix, {label: value}, value), ...] of the metric and
+        its children."""
+        if not self.labelnames:
+            return self._samples({})
+        result = []
+        for values, child in sorted(self._children.items(), key=lambda item: item[0]):
+            result.extend(child._samples(dict(zip(self.labelnames, values))))
+        return result
+
+    def _samples(self, labels):
+        return []
+
+
+class Counter(_Metric):
+    """ A value that only goes up (packets, bytes, logins...). """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, labels):
+        return [("", labels, self.value)]
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down (queue depths, sizes).
+
+    :Args:
+        :function: optional callable returning the value, read at
+         exposition time instead of the set value.
+
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def _samples(self, labels):
+        if self.function is None:
+            return [("", labels, self.value)]
+        # noinspection PyBroadException
+        try:
+            return [("", labels, self.function())]
+        except Exception:
+            return []
+
+
+class Histogram(_Metric):
+    """
+    Observations counted into cumulative buckets, with their sum and
+    count (latencies, sizes).
+
+    :Args:
+        :buckets: ascending upper bounds; +Inf is added.
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per bucket (not cumulative); the last is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _newchild(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value):
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def _samples(self, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        result = []
+        cumulative = 0
+        for bound, bucketcount in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucketcount
+            bucketlabels = dict(labels)
+            bucketlabels["le"] = bound if bound == "+Inf" else repr(float(bound))
+            result.append(("_bucket", bucketlabels, cumulative))
+        result.append(("_sum", labels, total))
+        result.append(("_count", labels, count))
+        return result
+
+
+class Registry(object):
+    """
+    The metrics of a process, by name.  Registering a name twice
+    returns the metric already registered, so modules may create
+    their metrics at import time (and again after a reload).
+    """
+
+    def __init__(self):
+        # {name: metric}, in registration order
+        self.metrics = {}
+        self.order = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            self.order.append(metric.name)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def exposition(self):
+        """ All metrics in the Prometheus text exposition format. """
+        lines = []
+        for name in list(self.order):
+            metric = self.metrics[name]
+            lines.append("# HELP %s %s" % (name, _escape(metric.documentation, False)))
+            lines.append("# TYPE %s %s" % (name, metric.kind))
+            for suffix, labels, value in metric.samples():
+                if labels:
+                    labeltext = ",".join('%s="%s"' % (key, _escape(str(labels[key])))
+                                         for key in sorted(labels))
+                    lines.append("%s%s{%s} %s" % (name, suffix, labeltext, _number(value)))
+                else:
+                    lines.append("%s%s %s" % (name, suffix, _number(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(text, quotes=True):
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    if quotes:
+        text = text.replace('"', '\\"')
+    return text
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+# the wrapper's metrics.  The proxy and other parts that do not hold a
+#  reference to the wrapper record into this one too.
+REGISTRY = Registry()